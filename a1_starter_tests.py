@@ -35,13 +35,29 @@ add further test cases in this file to improve your confidence in your code.
 Tip: if you put your mouse inside a pytest function and right click, the "run"
 menu will give you the option of running just that test function.
 """
+import asyncio
+import json
+from itertools import permutations, product
 import pytest
-from typing import Dict
+from typing import Dict, List, Tuple
+from pathlib import Path
 from distance_map import DistanceMap
 from domain import Truck, Parcel, Fleet
-from scheduler import GreedyScheduler
-from container import PriorityQueue, _shorter
-from experiment import SchedulingExperiment
+from scheduler import GreedyScheduler, RandomScheduler, GreedySession, \
+    InsertionScheduler, FirstFitScheduler, BestFitScheduler, \
+    WorstFitScheduler, BranchAndBoundScheduler
+from container import PriorityQueue, HeapPriorityQueue, _shorter
+from store import ParcelStore, FleetStore
+from service import SchedulingService, SchedulingError
+from routing import improve_routes, improve_route
+from partition import PartitionedScheduler, cluster_destinations
+from experiment import SchedulingExperiment, run_random_replicas, \
+    read_parcels, read_trucks, read_distance_map, write_parcels_binary, \
+    write_trucks_binary, write_distance_map_binary, load_trucks, \
+    load_distance_map, binary_kind
+from benchmark import run_benchmarks
+from explore import compare_algorithms, ALGORITHM_CONFIGURATIONS
+from profiling import PhaseHook
 
 # This variable is used in the special pytest test case defined by function
 # test_experiment below.  The variable defines a single scheduling experiment
@@ -84,6 +100,32 @@ def test_distance_map_basic() -> None:
     assert m.distance('Montreal', 'Toronto') == 4
 
 
+def test_read_distance_map_complete_cached(tmp_path: Path) -> None:
+    """Test that a completed map fills in missing distances and is loaded
+    from the cache the second time the same file is read."""
+    map_file = tmp_path / 'map.txt'
+    map_file.write_text('Toronto, Hamilton, 9\nHamilton, London, 12, 14\n')
+    cache_dir = str(tmp_path / 'cache')
+    m = read_distance_map(str(map_file), True, True, cache_dir)
+    assert m.distance('Toronto', 'London') == 21
+    assert m.distance('London', 'Toronto') == 23
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+    cached = read_distance_map(str(map_file), True, True, cache_dir)
+    assert cached.distance('Toronto', 'London') == 21
+    assert cached.path('London', 'Toronto') == ['London', 'Hamilton',
+                                                 'Toronto']
+
+    # The cache is a binary map file, and one that cannot be loaded is
+    # written again instead of being trusted.
+    cache_file, = (tmp_path / 'cache').iterdir()
+    assert binary_kind(str(cache_file)) == 'map'
+    cache_file.write_bytes(b'not a map')
+    m = read_distance_map(str(map_file), True, True, cache_dir)
+    assert m.path('London', 'Toronto') == ['London', 'Hamilton', 'Toronto']
+    assert binary_kind(str(cache_file)) == 'map'
+
+
 def test_num_trucks_doctest() -> None:
     """Test the doctest provided for Fleet.num_trucks"""
     f = Fleet()
@@ -215,6 +257,21 @@ def test_priority_queue_add_remove_doctest() -> None:
     assert pq.remove() == 'monalisa'
 
 
+def test_heap_priority_queue_matches_priority_queue() -> None:
+    """Test that HeapPriorityQueue removes items in the same FIFO-priority
+    order as PriorityQueue, including ties."""
+    words = ['fred', 'arju', 'monalisa', 'o', 'hat', 'ronaldo', 'frederic',
+             'no', 'a', 'bob', 'ed', 'jo']
+    pq = PriorityQueue(_shorter)
+    hpq = HeapPriorityQueue(_shorter)
+    for word in words:
+        pq.add(word)
+        hpq.add(word)
+    while not pq.is_empty():
+        assert hpq.remove() == pq.remove()
+    assert hpq.is_empty() is True
+
+
 def test_greedy_scheduler_example() -> None:
     """Test GreedyScheduler on the example provided."""
     p17 = Parcel(17, 25, 'York', 'Toronto')
@@ -259,6 +316,674 @@ def test_greedy_scheduler_example() -> None:
     assert truck_parcels[3] == [21, 13]
 
 
+def test_greedy_scheduler_index_matches_scan() -> None:
+    """Test that GreedyScheduler chooses the same trucks with and without its
+    TruckIndex, for every parcel and truck order."""
+    for priority in ['volume', 'destination']:
+        for p_order in ['non-increasing', 'non-decreasing']:
+            for t_order in ['non-increasing', 'non-decreasing']:
+                allocations = []
+                for index_trucks in [True, False]:
+                    parcels = [Parcel(i, 5 + (i * 7) % 20, 'York',
+                                      ['Toronto', 'London', 'Hamilton'][i % 3])
+                               for i in range(30)]
+                    trucks = [Truck(i, 30 + (i * 13) % 40, 'York')
+                              for i in range(6)]
+                    config = {'parcel_priority': priority,
+                              'parcel_order': p_order,
+                              'truck_order': t_order,
+                              'index_trucks': index_trucks}
+                    unscheduled = GreedyScheduler(config).schedule(parcels,
+                                                                   trucks)
+                    allocations.append(
+                        ([p.p_id for p in unscheduled],
+                         [(t.parcel_ids(), t.route) for t in trucks]))
+                assert allocations[0] == allocations[1]
+
+
+def test_greedy_scheduler_on_stores() -> None:
+    """Test that GreedyScheduler gives the same schedule on a ParcelStore and
+    FleetStore as on Parcel and Truck objects."""
+    config = {'parcel_priority': 'destination',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing'}
+    data = [(17, 25, 'Toronto'), (21, 10, 'London'), (13, 8, 'London'),
+            (42, 20, 'Toronto'), (25, 15, 'Toronto'), (61, 15, 'Hamilton'),
+            (76, 20, 'London')]
+
+    f = Fleet()
+    for t_id, cap in [(1, 40), (2, 40), (3, 25)]:
+        f.add_truck(Truck(t_id, cap, 'York'))
+    parcels = [Parcel(p_id, vol, 'York', dest) for p_id, vol, dest in data]
+    unscheduled = GreedyScheduler(config).schedule(parcels, f.trucks)
+
+    ps = ParcelStore()
+    for p_id, vol, dest in data:
+        ps.add(p_id, vol, 'York', dest)
+    fs = FleetStore(ps)
+    for t_id, cap in [(1, 40), (2, 40), (3, 25)]:
+        fs.add_truck(Truck(t_id, cap, 'York'))
+    store_unscheduled = GreedyScheduler(config).schedule(ps, fs.trucks)
+
+    assert [p.p_id for p in store_unscheduled] == \
+        [p.p_id for p in unscheduled]
+    assert fs.parcel_allocations() == f.parcel_allocations()
+    assert fs.total_unused_space() == f.total_unused_space()
+    assert fs.average_fullness() == f.average_fullness()
+
+
+def test_greedy_session_matches_schedule() -> None:
+    """Test that submitting parcels one at a time in priority order, or all
+    in one batch, packs them as GreedyScheduler.schedule does."""
+    config = {'parcel_priority': 'destination',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing'}
+    cities = ['Toronto', 'Hamilton', 'London', 'York']
+    parcels = [Parcel(i, 3 + i * 7 % 11, 'York', cities[i * 5 % 4])
+               for i in range(40)]
+    trucks = [Truck(i, 20 + i * 3 % 9, 'York') for i in range(8)]
+    unscheduled = GreedyScheduler(config).schedule(parcels, trucks)
+    expected = [t.parcel_ids() for t in trucks]
+
+    for index_trucks in [True, False]:
+        config['index_trucks'] = index_trucks
+        trucks = [Truck(i, 20 + i * 3 % 9, 'York') for i in range(8)]
+        session = GreedySession(config, trucks)
+        ordered = sorted(parcels, key=lambda p: p.dest)
+        ids = [session.submit(p) for p in ordered]
+        assert [t.parcel_ids() for t in trucks] == expected
+        assert ids.count(None) == len(unscheduled)
+
+        trucks = [Truck(i, 20 + i * 3 % 9, 'York') for i in range(8)]
+        session = GreedySession(config, trucks)
+        assert session.submit_batch(parcels) == unscheduled
+        assert [t.parcel_ids() for t in trucks] == expected
+
+
+def test_scheduling_service() -> None:
+    """Test that the scheduling service answers each client's requests in
+    order, batches them, and schedules every parcel onto its fleet."""
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing'}
+    fleet = read_trucks('data/truck-data-small.txt', 'Toronto')
+
+    async def client(port: int, lines: List[str]) -> List[Dict]:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        await writer.drain()
+        answers = [json.loads(await reader.readline()) for _ in lines]
+        writer.close()
+        return answers
+
+    async def run() -> Tuple[List[Dict], List[Dict], Dict]:
+        service = SchedulingService(config, fleet, batch_delay=0.05)
+        _, port = await service.start()
+        first, second = await asyncio.gather(
+            client(port, [json.dumps({'p_id': i, 'p_vol': 10,
+                                      'source': 'Toronto', 'dest': 'York'})
+                          for i in range(10)] + ['not json']),
+            client(port, [json.dumps({'p_id': 100 + i, 'p_vol': 90,
+                                      'source': 'Toronto', 'dest': 'London'})
+                          for i in range(3)]))
+        stats = (await client(port, ['{"op": "stats"}']))[0]
+        await service.close()
+        return first, second, stats
+
+    first, second, stats = asyncio.run(run())
+    assert [a['p_id'] for a in first[:10]] == list(range(10))
+    assert 'error' in first[10]
+    assert [a['p_id'] for a in second] == [100, 101, 102]
+    assert stats['requests'] == 13
+    assert stats['batches'] < 13
+    trucks = {t.t_id: t for t in fleet.trucks}
+    for answer in first[:10] + second:
+        if answer['truck'] is None:
+            continue
+        assert answer['p_id'] in trucks[answer['truck']].parcel_ids()
+    scheduled = sum(t.num_par() for t in fleet.trucks)
+    assert scheduled == 13 - stats['unscheduled']
+
+
+def test_scheduling_service_failures() -> None:
+    """Test that a request whose micro-batch fails, or that is still waiting
+    when the service closes, fails instead of waiting forever, and that the
+    service keeps scheduling after a failed batch."""
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing'}
+    fleet = read_trucks('data/truck-data-small.txt', 'Toronto')
+
+    async def run() -> None:
+        service = SchedulingService(config, fleet, batch_delay=0.05)
+        assign_batch = service._session.assign_batch
+
+        def fail_once(parcels: List[Parcel]) -> List:
+            service._session.assign_batch = assign_batch
+            raise RuntimeError('broken batch')
+        service._session.assign_batch = fail_once
+
+        with pytest.raises(SchedulingError):
+            await service.schedule(Parcel(1, 10, 'Toronto', 'York'))
+        truck, _ = await service.schedule(Parcel(2, 10, 'Toronto', 'York'))
+        assert truck is not None
+
+        waiting = asyncio.ensure_future(
+            service.schedule(Parcel(3, 10, 'Toronto', 'York')))
+        await asyncio.sleep(0)
+        await service.close()
+        with pytest.raises(SchedulingError):
+            await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(run())
+
+
+def test_scheduling_service_rejects_bad_parcels() -> None:
+    """Test that the scheduling service rejects parcels whose volume is not
+    positive or whose source or destination is empty, and leaves the fleet
+    unchanged."""
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing'}
+    fleet = read_trucks('data/truck-data-small.txt', 'Toronto')
+    before = [(t.t_id, t.avail, t.parcel_ids()) for t in fleet.trucks]
+    requests = [{'p_id': 1, 'p_vol': -50, 'source': 'Toronto',
+                 'dest': 'York'},
+                {'p_id': 2, 'p_vol': 0, 'source': 'Toronto', 'dest': 'York'},
+                {'p_id': 3, 'p_vol': 5, 'source': 'Toronto', 'dest': ' '},
+                {'p_id': 4, 'p_vol': 5, 'source': '', 'dest': 'York'}]
+
+    async def run() -> List[Dict]:
+        service = SchedulingService(config, fleet, batch_delay=0.01)
+        answers = [await service._answer(json.dumps(r).encode())
+                   for r in requests]
+        await service.close()
+        return answers
+
+    for answer in asyncio.run(run()):
+        assert answer['error'].startswith('bad request')
+    assert [(t.t_id, t.avail, t.parcel_ids()) for t in fleet.trucks] \
+        == before
+
+
+def test_experiment_streams_parcel_batches() -> None:
+    """Test that streaming parcels in batches schedules every parcel, and
+    matches the unbatched result when there is a single batch."""
+    config = {'depot_location': 'Toronto',
+              'parcel_file': 'data/parcel-data-small.txt',
+              'truck_file': 'data/truck-data-small.txt',
+              'map_file': 'data/map-data.txt',
+              'algorithm': 'greedy',
+              'parcel_priority': 'volume',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing',
+              'verbose': False}
+    expected = SchedulingExperiment(config).run()
+    config['parcel_batch_size'] = 10
+    experiment = SchedulingExperiment(config)
+    assert experiment.parcels == []
+    assert experiment.run() == expected
+
+    config['parcel_batch_size'] = 1
+    experiment = SchedulingExperiment(config)
+    results = experiment.run()
+    scheduled = sum(t.num_par() for t in experiment.fleet.trucks)
+    assert scheduled + results['unscheduled'] == 3
+
+
+def test_read_parcels_extra_columns(tmp_path: Path) -> None:
+    """Test that parcel lines with a trailing comma or extra columns are read
+    using only their first four fields."""
+    parcel_file = tmp_path / 'parcels.txt'
+    parcel_file.write_text('1, Toronto, Hamilton, 5,\n'
+                           '2, Toronto, London, 7, fragile\n')
+    parcels = read_parcels(str(parcel_file))
+    assert [(p.p_id, p.source, p.dest, p.p_vol) for p in parcels] \
+        == [(1, 'Toronto', 'Hamilton', 5), (2, 'Toronto', 'London', 7)]
+
+
+def test_improve_routes_after_scheduling() -> None:
+    """Test that improving routes after scheduling visits the same cities,
+    never travels further, and leaves every other statistic unchanged."""
+    parcels = [Parcel(i, 5, 'Toronto', city) for i, city in
+               enumerate(['Hamilton', 'London', 'Hamilton', 'Ottawa',
+                          'London', 'Kingston', 'Hamilton', 'Ottawa'])]
+    dmap = read_distance_map('data/map-data.txt', complete=True)
+    fleets = []
+    for budget in [None, 1.0]:
+        fleet = Fleet()
+        for t_id in range(2):
+            fleet.add_truck(Truck(t_id, 40, 'Toronto'))
+        RandomScheduler(5).schedule(parcels, fleet.trucks)
+        if budget is not None:
+            improve_routes(fleet, dmap, budget, processes=1)
+        fleets.append(fleet)
+
+    before, after = fleets
+    assert after.total_distance_travelled(dmap) < \
+        before.total_distance_travelled(dmap)
+    assert after.parcel_allocations() == before.parcel_allocations()
+    for old, new in zip(before.trucks, after.trucks):
+        assert new.route[0] == 'Toronto'
+        assert set(new.route) == set(old.route)
+        assert new.truck_distance(dmap) <= old.truck_distance(dmap)
+
+
+def test_improve_route_exact() -> None:
+    """Test that routes with few stops are solved exactly, and that the exact
+    route is cached by its set of stops."""
+    dmap = read_distance_map('data/map-data.txt', complete=True)
+    matrix = dmap.matrix()
+    stops = ['Hamilton', 'Ottawa', 'London', 'Kingston', 'Windsor', 'Guelph']
+
+    def length(route: List[str]) -> int:
+        legs = zip(route, route[1:] + route[:1])
+        return sum(matrix.distance(a, b) for a, b in legs)
+
+    shortest = min(length(['Toronto'] + list(order))
+                   for order in permutations(stops))
+    cache = {}
+    route = improve_route(['Toronto'] + stops, matrix, cache=cache)
+    assert sorted(route[1:]) == sorted(stops)
+    assert length(route) == shortest
+    assert improve_route(['Toronto'] + stops[::-1], matrix,
+                         cache=cache) == route
+    assert len(cache) == 1
+
+
+def test_insertion_scheduler() -> None:
+    """Test that the insertion scheduler visits each destination once per
+    truck, and travels less than the greedy scheduler on the same parcels."""
+    dmap = read_distance_map('data/map-data.txt', complete=True)
+    cities = ['Hamilton', 'Ottawa', 'London', 'Kingston', 'Windsor', 'Guelph']
+    parcels = [Parcel(i, 4 + i % 5, 'Toronto', cities[i * 7 % 6])
+               for i in range(60)]
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    distances = []
+    for scheduler in [GreedyScheduler(config),
+                      InsertionScheduler(config, dmap)]:
+        fleet = Fleet()
+        for t_id in range(4):
+            fleet.add_truck(Truck(t_id, 100, 'Toronto'))
+        assert scheduler.schedule(parcels, fleet.trucks) == []
+        distances.append(fleet.total_distance_travelled(dmap))
+
+    for truck in fleet.trucks:
+        assert len(set(truck.route)) == len(truck.route)
+        assert {p.dest for p in truck.par} == set(truck.route[1:])
+    assert distances[1] < distances[0]
+
+
+def test_bin_packing_schedulers() -> None:
+    """Test that the bin-packing schedulers take parcels largest first, and
+    choose the first, tightest or emptiest truck that fits."""
+    vols = [4, 9, 2, 7, 5, 3]
+    expected = {FirstFitScheduler: [[1, 3], [4, 0, 5, 2], []],
+                BestFitScheduler: [[0], [3, 4, 2], [1, 5]],
+                WorstFitScheduler: [[1, 0], [3, 5], [4, 2]]}
+    for scheduler, allocation in expected.items():
+        parcels = [Parcel(i, vol, 'York', 'Toronto')
+                   for i, vol in enumerate(vols)]
+        trucks = [Truck(1, 16, 'York'), Truck(2, 14, 'York'),
+                  Truck(3, 12, 'York')]
+        assert scheduler().schedule(parcels, trucks) == []
+        assert [t.parcel_ids() for t in trucks] == allocation
+
+    trucks = [Truck(1, 16, 'York'), Truck(2, 9, 'York')]
+    parcels = [Parcel(i, vol, 'York', 'Toronto') for i, vol in enumerate(vols)]
+    unscheduled = BestFitScheduler().schedule(parcels, trucks)
+    assert [t.parcel_ids() for t in trucks] == [[3, 4, 0], [1]]
+    assert [p.p_id for p in unscheduled] == [5, 2]
+
+
+def test_branch_and_bound_scheduler() -> None:
+    """Test that the branch-and-bound scheduler schedules as many parcels as
+    any assignment can, and reports the gap to the greedy warm start."""
+    dmap = DistanceMap()
+    dmap.add_distance('York', 'Toronto', 5)
+    dmap.add_distance('York', 'London', 20)
+    dmap.add_distance('Toronto', 'London', 18)
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-increasing'}
+    vols = [2, 3, 5, 6, 8, 9]
+    parcels = [Parcel(i, vol, 'York', 'London' if i % 2 else 'Toronto')
+               for i, vol in enumerate(vols)]
+    greedy_trucks = [Truck(1, 12, 'York'), Truck(2, 13, 'York')]
+    greedy = GreedyScheduler(config).schedule(parcels, greedy_trucks)
+    trucks = [Truck(1, 12, 'York'), Truck(2, 13, 'York')]
+    scheduler = BranchAndBoundScheduler(config, dmap)
+    unscheduled = scheduler.schedule(parcels, trucks)
+
+    # Greedy leaves out 8 and 9, but only one parcel need be left out.
+    fewest = len(vols)
+    for assignment in product(range(3), repeat=len(vols)):
+        loads = [0, 0, 0]
+        for vol, i in zip(vols, assignment):
+            loads[i] += vol
+        if loads[1] <= 12 and loads[2] <= 13:
+            fewest = min(fewest, assignment.count(0))
+    assert len(unscheduled) == fewest < len(greedy)
+    stats = scheduler.search_stats
+    assert stats['warm_start'] == len(greedy)
+    assert stats['unscheduled'] == stats['lower_bound'] == fewest
+    assert stats['gap'] == 0 and stats['optimal']
+    for truck in trucks:
+        assert truck.avail >= 0
+        assert {p.dest for p in truck.par} <= set(truck.route[1:])
+
+
+def test_partitioned_scheduler() -> None:
+    """Test that partitioned scheduling keeps far-apart destinations on
+    separate trucks, and gives the same schedule over a pool of processes."""
+    dmap = read_distance_map('data/map-data.txt')
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing'}
+    cities = ['Hamilton', 'Oakville', 'Ottawa', 'Kingston', 'Guelph',
+              'Mississauga']
+    clusters = cluster_destinations(dict.fromkeys(cities, 1), dmap, 2)
+    assert clusters == [['Hamilton', 'Oakville', 'Guelph', 'Mississauga'],
+                        ['Ottawa', 'Kingston']]
+
+    parcels = [Parcel(i, 3 + i % 5, 'Toronto', cities[i % 6])
+               for i in range(60)]
+    allocations = []
+    for processes in [1, 2]:
+        trucks = [Truck(i, 40, 'Toronto') for i in range(6)]
+        unscheduled = PartitionedScheduler(config, dmap, 2,
+                                           processes).schedule(parcels, trucks)
+        scheduled = [p for t in trucks for p in t.par]
+        assert len(scheduled) + len(unscheduled) == len(parcels)
+        assert all(t.avail >= 0 for t in trucks)
+        allocations.append([t.parcel_ids() for t in trucks])
+        for t in trucks:
+            dests = {p.dest for p in t.par}
+            assert any(dests <= set(c) for c in clusters)
+    assert allocations[0] == allocations[1]
+
+
+def test_random_scheduler_seeded() -> None:
+    """Test that a seeded RandomScheduler is reproducible and does not reorder
+    its input lists."""
+    allocations = []
+    for _ in range(2):
+        parcels = [Parcel(i, 5 + i % 7, 'York', 'Toronto') for i in range(20)]
+        trucks = [Truck(i, 25, 'York') for i in range(5)]
+        unscheduled = RandomScheduler(2021).schedule(parcels, trucks)
+        assert [p.p_id for p in parcels] == list(range(20))
+        assert [t.t_id for t in trucks] == list(range(5))
+        allocations.append(([p.p_id for p in unscheduled],
+                            [t.parcel_ids() for t in trucks]))
+    assert allocations[0] == allocations[1]
+
+
+def test_run_random_replicas() -> None:
+    """Test that random replicas give the same statistics in parallel as in a
+    single process, and that the best fleet matches the best statistics."""
+    parcels = read_parcels('data/parcel-data-small.txt')
+    trucks = read_trucks('data/truck-data-small.txt', 'Toronto').trucks
+    dmap = read_distance_map('data/map-data.txt')
+    serial, _ = run_random_replicas(parcels, trucks, dmap, 6, seed=7,
+                                    processes=1)
+    parallel, best = run_random_replicas(parcels, trucks, dmap, 6, seed=7,
+                                         processes=2)
+    assert serial == parallel
+    assert all(t.empty_truck() for t in trucks)
+    fewest = min(s['unscheduled'] for s in parallel)
+    scheduled = sum(t.num_par() for t in best.trucks)
+    assert scheduled == len(parcels) - fewest
+
+
+def test_binary_input_files(tmp_path: Path) -> None:
+    """Test that an experiment on binary input files converted from the text
+    files gives the same statistics as on the text files."""
+    config = {'depot_location': 'Toronto',
+              'parcel_file': 'data/parcel-data-small.txt',
+              'truck_file': 'data/truck-data-small.txt',
+              'map_file': 'data/map-data.txt',
+              'algorithm': 'greedy',
+              'parcel_priority': 'destination',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing',
+              'verbose': False}
+    expected = SchedulingExperiment(config).run()
+
+    binary = {'parcel_file': str(tmp_path / 'parcels.bin'),
+              'truck_file': str(tmp_path / 'trucks.bin'),
+              'map_file': str(tmp_path / 'map.bin')}
+    write_parcels_binary(config['parcel_file'], binary['parcel_file'])
+    write_trucks_binary(config['truck_file'], 'Toronto', binary['truck_file'])
+    write_distance_map_binary(config['map_file'], binary['map_file'])
+    config.update(binary)
+    experiment = SchedulingExperiment(config)
+    assert isinstance(experiment.fleet, FleetStore)
+    assert experiment.run() == pytest.approx(expected)
+
+
+def test_binary_map_keep_paths(tmp_path: Path) -> None:
+    """Test that paths kept from a binary map follow its roads, and that a
+    complete binary map, which has lost its roads, can only keep paths that
+    were written with it."""
+    map_file = tmp_path / 'map.txt'
+    map_file.write_text('A, B, 1\nB, C, 1\nC, D, 1\n')
+    sparse = str(tmp_path / 'sparse.bin')
+    complete = str(tmp_path / 'complete.bin')
+    write_distance_map_binary(str(map_file), sparse)
+    write_distance_map_binary(str(map_file), complete, True)
+    expected = read_distance_map(str(map_file), True, True).path('A', 'D')
+    assert expected == ['A', 'B', 'C', 'D']
+    assert load_distance_map(sparse, True, True).path('A', 'D') == expected
+    assert load_distance_map(complete, True).distance('A', 'D') == 3
+    with pytest.raises(ValueError):
+        load_distance_map(complete, True, True)
+
+    write_distance_map_binary(str(map_file), complete, True, True)
+    assert load_distance_map(complete, True, True).path('A', 'D') == expected
+
+
+def test_multi_depot_trucks(tmp_path: Path) -> None:
+    """Test that trucks can name their own depots, in text and binary truck
+    files, and that parcels only go on trucks from the depots nearest their
+    destination when 'nearby_depots' is set."""
+    truck_file = tmp_path / 'trucks.txt'
+    truck_file.write_text('1, 90\n2, 40, Ottawa\n3, 45, Windsor\n'
+                          '4, 60, Ottawa\n')
+    fleet = read_trucks(str(truck_file), 'Toronto')
+    assert fleet.depots() == ['Toronto', 'Ottawa', 'Windsor']
+    assert [t.t_id for t in fleet.trucks_at('Ottawa')] == [2, 4]
+    binary_file = str(tmp_path / 'trucks.bin')
+    write_trucks_binary(str(truck_file), 'Toronto', binary_file)
+    assert [(t.t_id, t.cap, t.dep) for t in load_trucks(binary_file)] == \
+        [(t.t_id, t.cap, t.dep) for t in fleet.trucks]
+
+    dmap = read_distance_map('data/map-data.txt')
+    config = {'parcel_priority': 'volume',
+              'parcel_order': 'non-increasing',
+              'truck_order': 'non-increasing',
+              'nearby_depots': 1}
+    near = dmap.nearest_depots(fleet.depots(), 1)
+    parcels = [Parcel(i, 5 + i % 4, 'Toronto', city) for i, city in
+               enumerate(['Kingston', 'London', 'Hamilton', 'Belleville',
+                          'Windsor', 'Ottawa', 'Guelph', 'Woodstock'] * 2)]
+    GreedyScheduler(config, dmap).schedule(parcels, fleet.trucks)
+    assert sum(t.num_par() for t in fleet.trucks) == len(parcels)
+    for truck in fleet.trucks:
+        assert all(near[p.dest] == [truck.dep] for p in truck.par)
+    assert fleet.parcel_allocations()[3]
+
+    expected = [t.parcel_ids() for t in fleet.trucks]
+    trucks = read_trucks(str(truck_file), 'Toronto').trucks
+    session = GreedySession(config, trucks, dmap)
+    assert session.submit_batch(parcels) == []
+    assert [t.parcel_ids() for t in trucks] == expected
+
+    for processes in [1, 2]:
+        trucks = read_trucks(str(truck_file), 'Toronto').trucks
+        PartitionedScheduler(config, dmap, 2, processes).schedule(parcels,
+                                                                  trucks)
+        for truck in trucks:
+            assert all(near[p.dest] == [truck.dep] for p in truck.par)
+
+
+def test_benchmarks(tmp_path: Path) -> None:
+    """Test that benchmarks time every phase of each configuration on
+    generated problems, skip slow algorithms on large problems, and save the
+    results as JSON."""
+    configurations = [{'algorithm': 'greedy',
+                       'parcel_priority': 'volume',
+                       'parcel_order': 'non-increasing',
+                       'truck_order': 'non-increasing'},
+                      {'algorithm': 'insertion',
+                       'parcel_priority': 'volume',
+                       'parcel_order': 'non-increasing',
+                       'truck_order': 'NA'}]
+    results = run_benchmarks(str(tmp_path), [200, 20000], None,
+                             configurations, num_cities=20, num_depots=2)
+    with open(tmp_path / 'benchmark.json') as file:
+        assert json.load(file) == results
+    small, large = results['problems']
+    assert (small['parcels'], small['num_cities']) == (200, 20)
+    assert set(small['read']) == {'read_parcels', 'read_trucks',
+                                  'read_distance_map'}
+    for run in small['runs']:
+        assert set(run['phases']) == {'setup', 'schedule', 'compute_stats'}
+        assert run['stats']['unscheduled'] == 0
+    assert 'phases' in large['runs'][0]
+    assert large['runs'][1]['skipped']
+
+
+def test_compare_algorithms_processes(tmp_path: Path,
+                                      monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that comparing algorithms over a pool of worker processes writes
+    the same results.csv as running them one after another."""
+    data = tmp_path / 'data'
+    data.mkdir()
+    for name in ['parcel-data-small.txt', 'truck-data-small.txt',
+                 'map-data.txt']:
+        (data / name).write_bytes((Path('data') / name).read_bytes())
+    # Seed the random algorithm so that both runs schedule the same way.
+    config = json.loads(Path('data/demo.json').read_text())
+    config['seed'] = 148
+    (data / 'demo.json').write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+
+    compare_algorithms('data/demo.json', 1)
+    sequential = (data / 'results.csv').read_text()
+    compare_algorithms('data/demo.json', 2)
+    assert (data / 'results.csv').read_text() == sequential
+    assert len(sequential.splitlines()) == len(ALGORITHM_CONFIGURATIONS) + 1
+    # Every row, including the title, lines up with the algorithm column.
+    assert len({line.index(',') for line in sequential.splitlines()}) == 1
+
+
+def test_profiling_hooks_and_counters(tmp_path: Path) -> None:
+    """Test that hooks are told about every phase, that profiling counts the
+    greedy algorithm's work without changing its schedule, and that the
+    phases and counts are written as a Chrome trace."""
+
+    class Recorder(PhaseHook):
+        """Records the phases it is told about."""
+        def __init__(self) -> None:
+            self.events = []
+
+        def phase_started(self, phase: str) -> None:
+            self.events.append(('start', phase))
+
+        def phase_ended(self, phase: str, seconds: float) -> None:
+            self.events.append(('end', phase))
+
+    config = {'depot_location': 'Toronto',
+              'parcel_file': 'data/parcel-data-small.txt',
+              'truck_file': 'data/truck-data-small.txt',
+              'map_file': 'data/map-data.txt',
+              'algorithm': 'greedy',
+              'parcel_priority': 'volume',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing',
+              'verbose': False}
+    expected = SchedulingExperiment(config).run()
+    recorder = Recorder()
+    config.update({'profile': True, 'index_trucks': False,
+                   'sort_parcels': False,
+                   'trace_file': str(tmp_path / 'trace.json')})
+    experiment = SchedulingExperiment(config, hooks=[recorder])
+    stats = experiment.run()
+    phases = ['read_parcels', 'read_trucks', 'read_distance_map', 'schedule',
+              'compute_stats']
+    assert recorder.events == [(event, phase) for phase in phases
+                               for event in ('start', 'end')]
+    assert {key: stats[key] for key in expected} == expected
+    assert stats['parcels_considered'] == 3
+    assert stats['trucks_scanned'] == 9
+    assert stats['max_trucks_scanned'] == 3
+    assert stats['queue_comparisons'] > 0
+    assert stats['index_lookups'] == 0
+
+    with open(tmp_path / 'trace.json') as file:
+        events = json.load(file)['traceEvents']
+    assert [e['name'] for e in events if e['ph'] == 'X'] == phases
+    assert events[-1]['args']['trucks_scanned'] == 9
+
+    del config['index_trucks'], config['sort_parcels'], config['trace_file']
+    stats = SchedulingExperiment(config).run()
+    assert {key: stats[key] for key in expected} == expected
+    assert stats['parcels_considered'] == 3
+    assert 3 <= stats['index_lookups'] <= 6
+    assert 3 <= stats['trucks_scanned'] <= 6
+    assert stats['candidates_queued'] == 3
+    assert stats['max_candidates_queued'] == 1
+    assert stats['index_comparisons'] > 0
+    assert stats['sort_comparisons'] > 0
+    assert stats['queue_comparisons'] == 0
+
+    config.update({'partitions': 2, 'nearby_depots': 1})
+    stats = SchedulingExperiment(config).run()
+    assert stats['parcels_considered'] == 3
+    assert stats['candidates_queued'] == 3
+
+
+def test_run_report_and_sampled_trace(capsys: pytest.CaptureFixture) -> None:
+    """Test that verbose scheduling prints a sampled trace of the parcels
+    placed, that the trace cannot be sampled less than once per parcel, and
+    that reports have histograms of the fleet as text or JSON."""
+    config = {'depot_location': 'Toronto',
+              'parcel_file': 'data/parcel-data-small.txt',
+              'truck_file': 'data/truck-data-small.txt',
+              'map_file': 'data/map-data.txt',
+              'algorithm': 'greedy',
+              'parcel_priority': 'volume',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing',
+              'verbose': True,
+              'verbose_every': 2}
+    SchedulingExperiment(config).run()
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split(':')[0] for line in lines] == \
+        ['placement 0', 'placement 2', '3 parcels placed, 0 unscheduled']
+
+    config['verbose'] = False
+    stats = SchedulingExperiment(config).run(report=True)
+    out = capsys.readouterr().out
+    assert '=== Trucks by fullness ===' in out
+    assert '[    90.0,    100.0]      3 ####' in out
+
+    config['report_format'] = 'json'
+    SchedulingExperiment(config).run(report=True)
+    report = json.loads(capsys.readouterr().out)
+    assert report['stats'] == stats
+    assert set(report['phases']) == {'schedule', 'compute_stats'}
+    assert sum(report['histograms']['parcels']['counts']) == 3
+    assert len(report['histograms']['distance']['edges']) == 11
+
+    for every in [0, -1]:
+        config['verbose_every'] = every
+        with pytest.raises(ValueError):
+            SchedulingExperiment(config)
+
+
 ################################################################################
 # The test below uses pytest.mark.parametrize.
 #
@@ -0,0 +1,171 @@
+"""Assignment 1 - Benchmarks
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module times every phase of scheduling on generated problems of growing
+size, for every algorithm configuration in explore.ALGORITHM_CONFIGURATIONS,
+and saves the timings as JSON, so that runs on different versions of the code
+can be compared.
+
+Problems are generated with generator.py: a random road network between
+cities, parcels with volumes from a chosen distribution, and a fleet with a
+mix of truck sizes, about PARCELS_PER_TRUCK parcels per truck.  Each problem
+is read once, timing its 'read_parcels', 'read_trucks' and 'read_distance_map'
+phases (see LoadedProblem.read_times).  Then each configuration runs on it,
+timing its 'setup', 'schedule' and 'compute_stats' phases (see
+SchedulingExperiment.phase_times).  Algorithms that take more than O(log T)
+time per parcel for T trucks are only run on problems with at most
+SLOW_ALGORITHMS[algorithm] parcels, and are recorded as skipped on larger ones.
+"""
+from typing import Dict, List, Optional, Union
+import json
+import os
+import platform
+import time
+from experiment import SchedulingExperiment, LoadedProblem
+from explore import ALGORITHM_CONFIGURATIONS
+from generator import generate_map, generate_parcels, generate_trucks, \
+    VolumeDistribution, FleetMix
+
+# The numbers of parcels in the problems benchmarked by default.
+BENCHMARK_SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+
+# The number of parcels per truck in generated problems.
+PARCELS_PER_TRUCK = 20
+
+# The largest number of parcels that each slow algorithm is benchmarked on.
+SLOW_ALGORITHMS = {'insertion': 10 ** 4, 'branch-and-bound': 10 ** 4}
+
+# The results of benchmarking one configuration on one problem.
+RunResult = Dict[str, Union[str, bool, Dict[str, float]]]
+
+
+def generate_problem(directory: str, num_parcels: int,
+                     num_cities: int = 100, degree: int = 4,
+                     volumes: VolumeDistribution = ('uniform', 5, 25),
+                     fleet_mix: FleetMix = ((200, 1.0), (300, 1.0),
+                                            (400, 1.0)),
+                     num_depots: int = 1,
+                     seed: int = 0) -> Dict[str, Union[str, bool]]:
+    """Generate a problem with <num_parcels> parcels in the files
+    'parcels-<num_parcels>.txt', 'trucks-<num_parcels>.txt' and
+    'map-<num_parcels>.txt' in <directory>, and return the part of an
+    experiment configuration that names its files and depot.
+
+    The map has <num_cities> cities joined as in generator.generate_map with
+    <degree>, and is completed when it is read.  Parcel volumes come from
+    <volumes>, and there is one truck, with a capacity from <fleet_mix>, for
+    every PARCELS_PER_TRUCK parcels.  Trucks start at the first <num_depots>
+    cities, and parcels are never bound for the first one.
+
+    Precondition: num_parcels > 0, num_cities > 1 and
+                  0 < num_depots <= num_cities
+    """
+    os.makedirs(directory, exist_ok=True)
+    config = {'parcel_file': os.path.join(directory,
+                                          f'parcels-{num_parcels}.txt'),
+              'truck_file': os.path.join(directory,
+                                         f'trucks-{num_parcels}.txt'),
+              'map_file': os.path.join(directory, f'map-{num_parcels}.txt'),
+              'complete_map': True,
+              'verbose': False}
+    cities = generate_map(config['map_file'], num_cities, degree, seed)
+    config['depot_location'] = cities[0]
+    generate_parcels(config['parcel_file'], num_parcels, cities, cities[0],
+                     volumes, seed + 1)
+    generate_trucks(config['truck_file'],
+                    max(1, num_parcels // PARCELS_PER_TRUCK), fleet_mix,
+                    cities[:num_depots], seed + 2)
+    return config
+
+
+def benchmark_problem(config: Dict[str, Union[str, bool]],
+                      configurations: Optional[List[Dict[str, str]]] = None,
+                      num_parcels: Optional[int] = None) \
+        -> Dict[str, Union[Dict[str, float], List[RunResult]]]:
+    """Read the problem whose files are named in <config>, run each of
+    <configurations> on it, and return the time spent reading it under
+    'read' and a list of the results of each configuration under 'runs'.
+
+    The result of each configuration has its keys, plus 'phases', the time
+    in seconds spent in each phase of its run, and 'stats', the statistics of
+    its schedule.  If its algorithm is too slow for <num_parcels> parcels (see
+    SLOW_ALGORITHMS), it is not run, and has 'skipped' set to True instead.
+
+    If <configurations> is None, use ALGORITHM_CONFIGURATIONS.
+    """
+    if configurations is None:
+        configurations = ALGORITHM_CONFIGURATIONS
+    problem = LoadedProblem(config)
+    runs = []
+    for item in configurations:
+        run = dict(item)
+        limit = SLOW_ALGORITHMS.get(item['algorithm'])
+        if limit is not None and num_parcels is not None \
+                and num_parcels > limit:
+            run['skipped'] = True
+            runs.append(run)
+            continue
+
+        full_config = dict(config)
+        full_config.update(item)
+        start = time.perf_counter()
+        experiment = SchedulingExperiment(full_config, problem)
+        setup = time.perf_counter() - start
+        run['stats'] = experiment.run()
+        run['phases'] = {'setup': setup}
+        run['phases'].update(experiment.phase_times)
+        runs.append(run)
+    return {'read': problem.read_times, 'runs': runs}
+
+
+def run_benchmarks(directory: str, sizes: Optional[List[int]] = None,
+                   output: Optional[str] = None,
+                   configurations: Optional[List[Dict[str, str]]] = None,
+                   **problem_options: Union[int, tuple]) \
+        -> Dict[str, Union[str, List[Dict]]]:
+    """Generate a problem in <directory> for each number of parcels in
+    <sizes>, benchmark <configurations> on each as in benchmark_problem,
+    and return the results, which are also written as JSON to <output>.
+
+    Each problem is generated by generate_problem with <problem_options>,
+    and is described in the results by its number of 'parcels' and those
+    options.  The results also record the Python version and platform they
+    were run on, and when they were started.
+
+    If <sizes> is None, use BENCHMARK_SIZES.  If <output> is None, write to
+    'benchmark.json' in <directory>.
+    """
+    if sizes is None:
+        sizes = BENCHMARK_SIZES
+    if output is None:
+        output = os.path.join(directory, 'benchmark.json')
+
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'problems': []}
+    for size in sizes:
+        config = generate_problem(directory, size, **problem_options)
+        problem = {'parcels': size}
+        problem.update(problem_options)
+        problem.update(benchmark_problem(config, configurations, size))
+        results['problems'].append(problem)
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['run_benchmarks'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'json',
+                                   'os', 'platform', 'time', 'experiment',
+                                   'explore', 'generator'],
+        'disable': ['E1136'],
+    })
+    run_benchmarks('data/benchmark')
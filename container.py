@@ -17,10 +17,13 @@ Sophia Huynh, Maryam Majedi, and Jaisie Sin.
 
 ===== Module Description =====
 
-This module contains the Container and PriorityQueue classes.
+This module contains the Container and PriorityQueue classes, as well as
+HeapPriorityQueue, a binary-heap PriorityQueue with the same FIFO-priority
+order and O(log n) add and remove.
 """
 
 from typing import Any, List, Callable
+from heapq import heappush, heappop
 
 
 class Container:
@@ -163,10 +166,148 @@ class PriorityQueue(Container):
         return not self._queue
 
 
+class _HeapEntry:
+    """An item stored in a HeapPriorityQueue, together with the order in which
+    it was added.
+
+    === Public Attributes ===
+    item: The item that was added to the queue.
+    seq: The number of items added to the queue before <item>.
+    higher_priority: The priority function of the queue holding this entry.
+    """
+    __slots__ = ('item', 'seq', 'higher_priority')
+    item: Any
+    seq: int
+    higher_priority: Callable[[Any, Any], bool]
+
+    def __init__(self, item: Any, seq: int,
+                 higher_priority: Callable[[Any, Any], bool]) -> None:
+        """Initialize a new entry for <item>, added in position <seq>.
+        """
+        self.item = item
+        self.seq = seq
+        self.higher_priority = higher_priority
+
+    def __lt__(self, other: '_HeapEntry') -> bool:
+        """Return True iff this entry must be removed before <other>.
+
+        >>> a = _HeapEntry('fred', 0, _shorter)
+        >>> b = _HeapEntry('arju', 1, _shorter)
+        >>> c = _HeapEntry('o', 2, _shorter)
+        >>> a < b
+        True
+        >>> b < a
+        False
+        >>> c < a
+        True
+        """
+        if self.higher_priority(self.item, other.item):
+            return True
+        if self.higher_priority(other.item, self.item):
+            return False
+        return self.seq < other.seq
+
+
+class HeapPriorityQueue(Container):
+    """A queue of items that operates in FIFO-priority order, stored in a
+    binary heap.
+
+    Items are removed in exactly the same order as from a PriorityQueue created
+    with the same <higher_priority> function: the item with the highest
+    priority first, and ties in first-in-first-out (FIFO) order.  Unlike
+    PriorityQueue, both add and remove take O(log n) time.
+
+    === Private Attributes ===
+    _heap:
+      The entries of this queue, arranged as a binary min-heap so that
+      <_heap>[0] holds the next item to be removed.
+    _higher_priority:
+      A function that compares two items by their priority.
+      If <_higher_priority>(x, y) is true, then x has higher priority than y
+      and should be removed from the queue before y.
+    _added:
+      The number of items that have ever been added to this queue.
+
+    === Representation Invariants ===
+    - all items in <_heap> are of the same type.
+    - the items in <_heap> are appropriate arguments for the
+      function <_higher_priority>.
+    - <_heap> satisfies the heap property for _HeapEntry.__lt__.
+    - every entry in <_heap> has a distinct seq that is less than <_added>.
+    """
+    _heap: List[_HeapEntry]
+    _higher_priority: Callable[[Any, Any], bool]
+    _added: int
+
+    def __init__(self, higher_priority: Callable[[Any, Any], bool]) -> None:
+        """Initialize this to an empty HeapPriorityQueue. For any two elements
+        x and y of the queue, if <higher_priority>(x, y) is true, then x has
+        higher priority than y.
+
+        >>> pq = HeapPriorityQueue(str.__lt__)
+        >>> pq.is_empty()
+        True
+        """
+        self._heap = []
+        self._higher_priority = higher_priority
+        self._added = 0
+
+    def add(self, item: Any) -> None:
+        """Add <item> to this HeapPriorityQueue.
+
+        >>> pq = HeapPriorityQueue(_shorter)
+        >>> pq.add('fred')
+        >>> pq.add('arju')
+        >>> pq.add('monalisa')
+        >>> pq.add('o')
+        >>> len(pq._heap)
+        4
+        """
+        heappush(self._heap,
+                 _HeapEntry(item, self._added, self._higher_priority))
+        self._added += 1
+
+    def remove(self) -> Any:
+        """Remove and return the next item from this HeapPriorityQueue.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> # When we hit the tie, the one that was added first will be
+        >>> # removed first.
+        >>> pq = HeapPriorityQueue(_shorter)
+        >>> pq.add('fred')
+        >>> pq.add('arju')
+        >>> pq.add('monalisa')
+        >>> pq.add('hat')
+        >>> pq.remove()
+        'hat'
+        >>> pq.remove()
+        'fred'
+        >>> pq.remove()
+        'arju'
+        >>> pq.remove()
+        'monalisa'
+        """
+        return heappop(self._heap).item
+
+    def is_empty(self) -> bool:
+        """Return True iff this HeapPriorityQueue is empty.
+
+        >>> pq = HeapPriorityQueue(str.__lt__)
+        >>> pq.is_empty()
+        True
+        >>> pq.add('fred')
+        >>> pq.is_empty()
+        False
+        """
+        return not self._heap
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'heapq'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
@@ -22,8 +22,96 @@ and look up distances between cities. This class does not read distances
 from the map file. (All reading from files is done in module experiment.)
 Instead, it provides public methods that can be called to store and look up
 distances.
+
+A DistanceMap can also be compiled into a DistanceMatrix, which interns city
+names to integer ids in a CityTable and stores every distance in a dense
+integer matrix for O(1) lookups by id.  A DistanceMap can be completed with
+shortest-path distances for the pairs of cities that it does not list, using
+Floyd-Warshall on small maps and Dijkstra from every city on large ones.
 """
-from typing import Dict, Tuple
+from typing import Dict, Tuple, List, Optional, Sequence, Iterator, Any
+from array import array
+from heapq import heappush, heappop
+
+# Maps with at most this many cities are completed with Floyd-Warshall when
+# the method is 'auto'; larger maps use Dijkstra from every city.
+FLOYD_WARSHALL_MAX_CITIES = 100
+
+# The distance used for pairs of cities with no path between them while
+# computing shortest paths.
+_INF = float('inf')
+
+
+class CityTable:
+    """A table that interns city names to consecutive integer ids.
+
+    === Public Attributes ===
+    names:
+        The interned city names, where names[i] is the city with id i.
+
+    === Private Attributes ===
+    _ids:
+        Maps each interned city name to its id.
+
+    === Representation Invariants ===
+    - <_ids>[<names>[i]] == i for every id i.
+
+    === Sample Usage ===
+    >>> cities = CityTable()
+    >>> cities.intern('Toronto')
+    0
+    >>> cities.intern('Hamilton')
+    1
+    >>> cities.intern('Toronto')
+    0
+    >>> cities.names[1]
+    'Hamilton'
+    >>> cities.ranks()
+    [1, 0]
+    """
+    names: List[str]
+    _ids: Dict[str, int]
+
+    def __init__(self) -> None:
+        """Initialize an empty CityTable.
+        """
+        self.names = []
+        self._ids = {}
+
+    def __len__(self) -> int:
+        """Return the number of cities in this table.
+        """
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        """Return the id of the city <name>, adding it to this table if it is
+        not there yet.
+        """
+        i = self._ids.get(name)
+        if i is None:
+            i = len(self.names)
+            self._ids[name] = i
+            self.names.append(name)
+        return i
+
+    def lookup(self, name: str) -> int:
+        """Return the id of the city <name>, or -1 if it is not in this table.
+
+        >>> cities = CityTable()
+        >>> cities.lookup('York')
+        -1
+        """
+        return self._ids.get(name, -1)
+
+    def ranks(self) -> List[int]:
+        """Return a list whose item i is the position of the city with id i
+        when all cities in this table are sorted by name.
+        """
+        result = [0] * len(self.names)
+        for rank, i in enumerate(sorted(range(len(self.names)),
+                                        key=self.names.__getitem__)):
+            result[i] = rank
+        return result
 
 
 class DistanceMap:
@@ -32,6 +120,16 @@ class DistanceMap:
     === Private Attributes ===
     _dist:
         The distance from city 'a' to city 'b' AND city 'b' to 'a'.
+    _matrix:
+        The most recently compiled DistanceMatrix of this map, or None.
+    _complete:
+        If complete has been called, a DistanceMatrix with the distances in
+        <_dist> and the shortest-path distance for every other pair of cities.
+        If use_matrix has been called, the DistanceMatrix this map uses for
+        all of its distances.  Otherwise None.
+    _in_matrix:
+        True iff the distances of this map are only in <_complete>, and not
+        in <_dist>.
 
     === Sample Usage ===
     >>> m = DistanceMap()
@@ -54,14 +152,22 @@ class DistanceMap:
     - Each key in the _dist dictionary is a tuple of two cities.
     - If a key of cities (a, b) exists, then a key of cities (b, a) must exist.
     - Distance are positive integers.
+    - <_matrix> is None or a compiled form of exactly the distances in <_dist>
+      (or in <_complete>, if it is not None).
     """
     _dist: Dict[Tuple[str, str], int]
+    _matrix: Optional['DistanceMatrix']
+    _complete: Optional['DistanceMatrix']
+    _in_matrix: bool
 
     def __init__(self) -> None:
         """Initialize a new DistanceMap.
         """
 
         self._dist = {}
+        self._matrix = None
+        self._complete = None
+        self._in_matrix = False
 
     def add_distance(self, a: str, b: str, d_ab: int, d_ba: int = -1) -> None:
         """Add a distance between to our distance map.
@@ -72,8 +178,15 @@ class DistanceMap:
         if d_ba == -1:
             d_ba = d_ab
 
+        if self._in_matrix:
+            for x, y, d in self._complete.known_distances():
+                self._dist[(x, y)] = d
+            self._in_matrix = False
+
         self._dist[(a, b)] = d_ab
         self._dist[(b, a)] = d_ba
+        self._matrix = None
+        self._complete = None
 
     def distance(self, a: str, b: str) -> int:
         """Return the distance between city a and city b.
@@ -91,15 +204,519 @@ class DistanceMap:
         >>> m.distance('Vaughn', 'Mississauga')
         -1
         """
+        if self._complete is not None:
+            return self._complete.distance(a, b)
         if (a, b) in self._dist:
             return self._dist[(a, b)]
         return -1
 
+    def compile(self, cities: Optional[CityTable] = None) -> 'DistanceMatrix':
+        """Return a new DistanceMatrix with the distances in this map, with
+        city ids from <cities>.  Cities in this map that are not yet in
+        <cities> are added to it.  If <cities> is None, a new CityTable is
+        used.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'York', 5, 9)
+        >>> cities = CityTable()
+        >>> cities.intern('Hamilton')
+        0
+        >>> dm = m.compile(cities)
+        >>> dm.distance_by_id(cities.lookup('York'), cities.lookup('Toronto'))
+        9
+        >>> dm.distance_by_id(0, cities.lookup('Toronto'))
+        -1
+        """
+        if cities is None:
+            cities = CityTable()
+        if self._complete is None:
+            known = [(a, b, d) for (a, b), d in self._dist.items()]
+        else:
+            known = list(self._complete.known_distances())
+        for a, b, _ in known:
+            cities.intern(a)
+            cities.intern(b)
+
+        matrix = DistanceMatrix(cities)
+        for a, b, d in known:
+            matrix.set_distance(cities.lookup(a), cities.lookup(b), d)
+        return matrix
+
+    def complete(self, keep_paths: bool = False, method: str = 'auto') -> None:
+        """Complete this map with the length of the shortest path between every
+        pair of different cities whose distance is not listed.  Listed
+        distances are kept as they are, and pairs with no path between them
+        stay at -1.
+
+        <method> is 'floyd-warshall', 'dijkstra', or 'auto' to use
+        Floyd-Warshall for maps with at most FLOYD_WARSHALL_MAX_CITIES cities
+        and Dijkstra from every city otherwise.  If <keep_paths> is True, the
+        shortest paths can then be looked up with path.
+
+        Adding a distance to this map afterwards undoes the completion.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> m.add_distance('Hamilton', 'London', 12, 14)
+        >>> m.add_distance('Ottawa', 'Kingston', 30)
+        >>> m.distance('Toronto', 'London')
+        -1
+        >>> m.complete(keep_paths=True)
+        >>> m.distance('Toronto', 'London')
+        21
+        >>> m.distance('London', 'Toronto')
+        23
+        >>> m.distance('Toronto', 'Ottawa')
+        -1
+        >>> m.path('London', 'Toronto')
+        ['London', 'Hamilton', 'Toronto']
+        """
+        matrix = self.compile()
+        self._complete = matrix.shortest_paths(keep_paths, method)
+        self._matrix = self._complete
+        if self._in_matrix:
+            for a, b, d in matrix.known_distances():
+                self._dist[(a, b)] = d
+            self._in_matrix = False
+
+    def path(self, a: str, b: str) -> List[str]:
+        """Return the cities on a shortest path from city <a> to city <b>,
+        including both, or an empty list if there is no such path.
+
+        If the distance from <a> to <b> is listed, the path is just [a, b],
+        so that its length is always distance(a, b), even when a path through
+        other cities is shorter.
+
+        Precondition: complete has been called with <keep_paths> True, and no
+        distance has been added since.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('A', 'B', 10)
+        >>> m.add_distance('A', 'C', 1)
+        >>> m.add_distance('C', 'B', 1)
+        >>> m.add_distance('B', 'D', 3)
+        >>> m.complete(keep_paths=True)
+        >>> m.distance('A', 'B'), m.path('A', 'B')
+        (10, ['A', 'B'])
+        >>> m.distance('A', 'D'), m.path('A', 'D')
+        (5, ['A', 'C', 'B', 'D'])
+        """
+        return self._complete.path(a, b)
+
+    def nearest_depots(self, depots: List[str],
+                       k: int) -> Dict[str, List[str]]:
+        """Return a table that maps each city in this map, and each of
+        <depots>, to the (at most) <k> depots in <depots> with the shortest
+        known distance from the depot to that city, nearest first.  Ties go
+        to the depot that comes first in <depots>, and a depot is at distance
+        0 from itself.  Cities that no depot has a known distance to are left
+        out.
+
+        This takes O(C * D log D) time for C cities and D depots.
+
+        Precondition: k > 0
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> m.add_distance('Ottawa', 'Kingston', 30)
+        >>> m.add_distance('Toronto', 'Kingston', 26)
+        >>> table = m.nearest_depots(['Toronto', 'Ottawa'], 1)
+        >>> table['Hamilton'], table['Kingston'], table['Ottawa']
+        (['Toronto'], ['Toronto'], ['Ottawa'])
+        >>> m.nearest_depots(['Toronto', 'Ottawa'], 2)['Kingston']
+        ['Toronto', 'Ottawa']
+        """
+        matrix = self.matrix()
+        ids = [matrix.cities.lookup(depot) for depot in depots]
+        table = {}
+        for c, city in enumerate(matrix.cities.names):
+            near = []
+            for j, d_id in enumerate(ids):
+                d = 0 if d_id == c else matrix.distance_by_id(d_id, c)
+                if d >= 0:
+                    near.append((d, j))
+            if near:
+                table[city] = [depots[j] for _, j in sorted(near)[:k]]
+        for j, depot in enumerate(depots):
+            if ids[j] < 0:
+                table[depot] = [depot]
+        return table
+
+    def use_matrix(self, matrix: 'DistanceMatrix') -> None:
+        """Replace all distances in this map with the known distances in
+        <matrix>, which this map then reads from directly instead of copying
+        them.  Adding a distance afterwards copies them into this map first.
+
+        >>> source = DistanceMap()
+        >>> source.add_distance('Toronto', 'York', 5, 9)
+        >>> m = DistanceMap()
+        >>> m.use_matrix(source.compile())
+        >>> m.distance('York', 'Toronto')
+        9
+        >>> m.add_distance('York', 'Hamilton', 22)
+        >>> m.distance('Toronto', 'York'), m.distance('Hamilton', 'York')
+        (5, 22)
+        """
+        self._dist = {}
+        self._complete = matrix
+        self._matrix = matrix
+        self._in_matrix = True
+
+    def matrix(self, cities: Optional[CityTable] = None) -> 'DistanceMatrix':
+        """Return a DistanceMatrix with the distances in this map.
+
+        If <cities> is given, the matrix uses its city ids, as in compile.
+        Otherwise it uses whichever CityTable was used last, or a new one.
+        The matrix is only compiled again if this map or the CityTable has
+        changed since the last call.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'York', 5, 9)
+        >>> m.matrix() is m.matrix()
+        True
+        >>> m.matrix().distance('York', 'Toronto')
+        9
+        >>> cities = CityTable()
+        >>> m.matrix(cities).cities is cities
+        True
+        """
+        if self._matrix is None or (cities is not None and
+                                    self._matrix.cities is not cities):
+            self._matrix = self.compile(cities)
+        return self._matrix
+
+
+class DistanceMatrix:
+    """Distances between cities, stored in a dense matrix indexed by the city
+    ids of a CityTable.
+
+    === Public Attributes ===
+    cities:
+        The table of city ids used to index this matrix.
+
+    === Private Attributes ===
+    _n:
+        The number of rows and columns in this matrix.
+    _dist:
+        The matrix, flattened in row-major order, so that the distance from
+        the city with id a to the city with id b is <_dist>[a * <_n> + b].
+        Distances that are not known are -1.
+    _pred:
+        None, or a matrix laid out like <_dist> in which the entry for a and b
+        is the id of the city just before b on a shortest path from a to b, or
+        -1 if there is no such path.
+
+    === Representation Invariants ===
+    - len(<_dist>) == <_n> * <_n>
+    - <_n> <= len(<cities>)
+    - <_pred> is None or len(<_pred>) == <_n> * <_n>
+
+    === Sample Usage ===
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'York', 5, 9)
+    >>> m.add_distance('Hamilton', 'York', 22)
+    >>> dm = m.compile()
+    >>> t, y = dm.cities.lookup('Toronto'), dm.cities.lookup('York')
+    >>> dm.distance_by_id(t, y)
+    5
+    >>> dm.distance('Hamilton', 'Toronto')
+    -1
+    >>> dm.distances([t, y], [y, t])
+    [5, 9]
+    """
+    cities: CityTable
+    _n: int
+    _dist: Sequence[int]
+    _pred: Optional[Sequence[int]]
+
+    def __init__(self, cities: CityTable,
+                 dist: Optional[Sequence[int]] = None,
+                 pred: Optional[Sequence[int]] = None) -> None:
+        """Initialize a matrix over the cities currently in <cities>.
+
+        If <dist> is given, use it as the flattened matrix without copying it;
+        otherwise no distance between any two cities is known.  If <pred> is
+        given, use it as the shortest paths of the matrix without copying it,
+        as returned by flat_paths.
+
+        Precondition: <dist> is None or len(<dist>) == len(<cities>) ** 2, and
+                      <pred> is None or len(<pred>) == len(<cities>) ** 2
+        """
+        self.cities = cities
+        self._n = len(cities)
+        if dist is None:
+            dist = array('q', [-1]) * (self._n * self._n)
+        self._dist = dist
+        self._pred = pred
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this matrix for pickling, with the matrix and
+        its paths copied into arrays if they are views of a file, since views
+        cannot be pickled.
+        """
+        state = dict(self.__dict__)
+        for name in ['_dist', '_pred']:
+            if isinstance(state[name], memoryview):
+                state[name] = array(state[name].format, state[name])
+        return state
+
+    def flat(self) -> Sequence[int]:
+        """Return this matrix, flattened in row-major order, so that the
+        distance from the city with id a to the city with id b is at index
+        a * n + b, where n was the number of cities in <self>.cities when this
+        matrix was created.  Unknown distances are -1.
+
+        The result is not a copy, and must not be mutated.
+        """
+        return self._dist
+
+    def flat_paths(self) -> Optional[Sequence[int]]:
+        """Return the shortest paths of this matrix, laid out like flat, so
+        that the entry for a and b is the id of the city just before b on a
+        shortest path from a to b, or -1 if there is no such path.  Return
+        None if this matrix was not returned by shortest_paths with
+        <keep_paths> True.
+
+        The result is not a copy, and must not be mutated.
+        """
+        return self._pred
+
+    def known_distances(self) -> Iterator[Tuple[str, str, int]]:
+        """Yield a tuple (a, b, d) for every pair of cities a and b whose
+        distance d in this matrix is known.
+        """
+        n = self._n
+        names = self.cities.names
+        for i, d in enumerate(self._dist):
+            if d != -1:
+                yield names[i // n], names[i % n], d
+
+    def set_distance(self, a: int, b: int, d: int) -> None:
+        """Record that the distance from the city with id <a> to the city with
+        id <b> is <d>.
+
+        Precondition: <a> and <b> are ids of cities in this matrix.
+        """
+        self._dist[a * self._n + b] = d
+
+    def distance_by_id(self, a: int, b: int) -> int:
+        """Return the distance from the city with id <a> to the city with id
+        <b>, or -1 if it is not known.
+        """
+        n = self._n
+        if 0 <= a < n and 0 <= b < n:
+            return self._dist[a * n + b]
+        return -1
+
+    def distance(self, a: str, b: str) -> int:
+        """Return the distance from city <a> to city <b>, or -1 if it is not
+        known.
+        """
+        return self.distance_by_id(self.cities.lookup(a),
+                                   self.cities.lookup(b))
+
+    def distances(self, a: Sequence[int], b: Sequence[int]) -> List[int]:
+        """Return the distance from the city with id <a>[i] to the city with
+        id <b>[i], for every index i, or -1 where it is not known.
+
+        Precondition: len(<a>) == len(<b>)
+        """
+        n = self._n
+        dist = self._dist
+        return [dist[x * n + y] if 0 <= x < n and 0 <= y < n else -1
+                for x, y in zip(a, b)]
+
+    def route_distance(self, route: Sequence[int]) -> int:
+        """Return the length of the closed route that visits the cities with
+        ids in <route> in order and then returns to <route>[0].  Unknown
+        distances count as -1.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> m.add_distance('Hamilton', 'York', 12)
+        >>> m.add_distance('York', 'Toronto', 25)
+        >>> dm = m.compile()
+        >>> dm.route_distance([dm.cities.lookup(c) for c in
+        ...                    ['Toronto', 'Hamilton', 'York']])
+        46
+        >>> dm.route_distance([dm.cities.lookup('Toronto')])
+        0
+        """
+        if len(route) <= 1:
+            return 0
+        return sum(self.distances(route, list(route[1:]) + [route[0]]))
+
+    def shortest_paths(self, keep_paths: bool = False,
+                       method: str = 'auto') -> 'DistanceMatrix':
+        """Return a new matrix over the same cities in which every unknown
+        distance between two different cities is replaced by the length of the
+        shortest path between them through the known distances.  Known
+        distances are kept as they are, and pairs with no path between them
+        stay at -1.
+
+        <method> is as in DistanceMap.complete.  If <keep_paths> is True, the
+        new matrix also records shortest paths for path and path_by_id.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('A', 'B', 1)
+        >>> m.add_distance('B', 'C', 2)
+        >>> m.add_distance('C', 'D', 3)
+        >>> dm = m.compile()
+        >>> for method in ['floyd-warshall', 'dijkstra']:
+        ...     sp = dm.shortest_paths(True, method)
+        ...     print(sp.distance('A', 'D'), sp.path('D', 'A'))
+        6 ['D', 'C', 'B', 'A']
+        6 ['D', 'C', 'B', 'A']
+        """
+        if method == 'auto':
+            if self._n <= FLOYD_WARSHALL_MAX_CITIES:
+                method = 'floyd-warshall'
+            else:
+                method = 'dijkstra'
+
+        if method == 'floyd-warshall':
+            rows, preds = self._floyd_warshall(keep_paths)
+        else:
+            rows, preds = self._dijkstra_all(keep_paths)
+
+        n = self._n
+        result = DistanceMatrix(self.cities)
+        result._n = n
+        result._dist = array('q', self._dist)
+        dist = result._dist
+        for a in range(n):
+            row = rows[a]
+            for b in range(n):
+                if a != b and dist[a * n + b] == -1 and row[b] != _INF:
+                    dist[a * n + b] = row[b]
+        if keep_paths:
+            result._pred = array('l', [p for row in preds for p in row])
+        return result
+
+    def _adjacency(self) -> List[List[Tuple[int, int]]]:
+        """Return, for the city with each id a, a list of (b, d) for every
+        city b with a known distance d from a.
+        """
+        n = self._n
+        adj = [[] for _ in range(n)]
+        for i, d in enumerate(self._dist):
+            a, b = divmod(i, n)
+            if d != -1 and a != b:
+                adj[a].append((b, d))
+        return adj
+
+    def _floyd_warshall(self, keep_paths: bool) \
+            -> Tuple[List[List[float]], List[List[int]]]:
+        """Return the matrix of shortest-path distances between the cities in
+        this matrix, with _INF for unreachable pairs, as a list of rows.  If
+        <keep_paths> is True, also return the matrix of predecessors on the
+        shortest paths; otherwise return an empty list in its place.
+        """
+        n = self._n
+        rows = [[_INF] * n for _ in range(n)]
+        preds = [[-1] * n for _ in range(n)] if keep_paths else []
+        for a, edges in enumerate(self._adjacency()):
+            for b, d in edges:
+                rows[a][b] = d
+                if keep_paths:
+                    preds[a][b] = a
+            rows[a][a] = 0
+
+        for k in range(n):
+            row_k = rows[k]
+            for i in range(n):
+                d_ik = rows[i][k]
+                if d_ik == _INF or i == k:
+                    continue
+                row_i = rows[i]
+                if not keep_paths:
+                    rows[i] = [d if d <= d_ik + d_kj else d_ik + d_kj
+                               for d, d_kj in zip(row_i, row_k)]
+                    continue
+                pred_i, pred_k = preds[i], preds[k]
+                for j in range(n):
+                    d = d_ik + row_k[j]
+                    if d < row_i[j]:
+                        row_i[j] = d
+                        pred_i[j] = pred_k[j]
+        return rows, preds
+
+    def _dijkstra_all(self, keep_paths: bool) \
+            -> Tuple[List[List[float]], List[List[int]]]:
+        """Return the same as _floyd_warshall, computed with Dijkstra's
+        algorithm from every city.
+        """
+        n = self._n
+        adj = self._adjacency()
+        rows = []
+        preds = []
+        for source in range(n):
+            row = [_INF] * n
+            pred = [-1] * n
+            row[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, a = heappop(heap)
+                if d > row[a]:
+                    continue
+                for b, d_ab in adj[a]:
+                    if d + d_ab < row[b]:
+                        row[b] = d + d_ab
+                        pred[b] = a
+                        heappush(heap, (d + d_ab, b))
+            rows.append(row)
+            if keep_paths:
+                preds.append(pred)
+        return rows, preds
+
+    def path_by_id(self, a: int, b: int) -> List[int]:
+        """Return the ids of the cities on a shortest path from the city with
+        id <a> to the city with id <b>, including both, or an empty list if
+        there is no such path.  If the distance from <a> to <b> was known
+        before shortest_paths and is longer than the shortest path, return
+        [a, b], so that the path is as long as the distance in this matrix.
+
+        Precondition: this matrix was returned by shortest_paths with
+        <keep_paths> True.
+        """
+        n = self._n
+        if not (0 <= a < n and 0 <= b < n) or a == b:
+            return []
+        if self._pred[a * n + b] == -1:
+            return []
+
+        result = [b]
+        length = 0
+        end = b
+        while end != a:
+            start = self._pred[a * n + end]
+            length += self._dist[start * n + end]
+            result.append(start)
+            end = start
+        if length != self._dist[a * n + b]:
+            # Every leg is a known distance, so the shortest path is only
+            # shorter than the matrix entry when that entry was known.
+            return [a, b]
+        result.reverse()
+        return result
+
+    def path(self, a: str, b: str) -> List[str]:
+        """Return the cities on a shortest path from city <a> to city <b>,
+        including both, or an empty list if there is no such path.
+
+        Precondition: this matrix was returned by shortest_paths with
+        <keep_paths> True.
+        """
+        names = self.cities.names
+        return [names[i] for i in self.path_by_id(self.cities.lookup(a),
+                                                  self.cities.lookup(b))]
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'heapq'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
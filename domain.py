@@ -20,8 +20,8 @@ Sophia Huynh, Maryam Majedi, and Jaisie Sin.
 This module contains the classes required to represent the entities
 in the simulation: Parcel, Truck and Fleet.
 """
-from typing import List, Dict
-from distance_map import DistanceMap
+from typing import List, Dict, Optional
+from distance_map import DistanceMap, DistanceMatrix
 
 
 class Parcel:
@@ -51,6 +51,7 @@ class Parcel:
     - Parcel have a unique id that cannot be duplicated.
     - Parcel don't have their source as a destination.
     """
+    __slots__ = ('p_id', 'p_vol', 'source', 'dest')
     p_id: int
     p_vol: int
     source: str
@@ -78,6 +79,17 @@ class Truck:
     avail: The available volume in the truck.
     par: The parcels conatained by the truck
     route: The trucks route to deliver parcels.
+    fleet: The fleet this truck was added to, or None.
+
+    === Private Attributes ===
+    _matrix:
+        The DistanceMatrix that <_open_dist> was computed with, or None if
+        the route length is not being tracked yet.
+    _hops:
+        The number of stops at the start of <route> covered by <_open_dist>.
+    _open_dist:
+        The length of the route through its first <_hops> stops, without the
+        return to the depot.
 
     === Sample Usage ===
     >>> t1 = Truck(888, 70, 'Toronto')
@@ -104,12 +116,18 @@ class Truck:
     - No parcels have the depot as their destination.
     - All trucks have a unique id that cannont be duplicated.
     """
+    __slots__ = ('t_id', 'cap', 'dep', 'avail', 'par', 'route', 'fleet',
+                 '_matrix', '_hops', '_open_dist')
     t_id: int
     cap: int
     dep: str
     avail: int
     par: List[Parcel]
     route: List[str]
+    fleet: Optional['Fleet']
+    _matrix: Optional[DistanceMatrix]
+    _hops: int
+    _open_dist: int
 
     def __init__(self, t_id: int, cap: int, dep: str) -> None:
         """Initialize a truck.
@@ -121,6 +139,10 @@ class Truck:
         self.avail = cap
         self.par = []
         self.route = [dep]
+        self.fleet = None
+        self._matrix = None
+        self._hops = 1
+        self._open_dist = 0
 
     def pack(self, parcel: Parcel) -> bool:
         """Pack the given parcel in the truck if there is enough space
@@ -138,10 +160,17 @@ class Truck:
         """
 
         if parcel.p_vol <= self.avail:
+            old_avail = self.avail
+            route_grew = False
             self.par.append(parcel)
             self.avail -= parcel.p_vol
             if self.route[-1] != parcel.dest:
                 self.route.append(parcel.dest)
+                route_grew = True
+                if self._matrix is not None:
+                    self._extend_distance()
+            if self.fleet is not None:
+                self.fleet.truck_packed(self, old_avail, route_grew)
             return True
         return False
 
@@ -250,25 +279,113 @@ class Truck:
         >>> t2 = Truck(1541, 200, 'Mississauga')
         >>> t2.truck_distance(m)
         0
+        >>> m.add_distance('York', 'Hamilton', 17)
+        >>> p5 = Parcel(346, 5, 'Chicago', 'Hamilton')
+        >>> t1.pack(p5)
+        True
+        >>> t1.truck_distance(m)
+        62
         """
-        x = 0
+        if len(self.route) <= 1:
+            return 0
 
-        if len(self.route) > 1:
-            for i in range(len(self.route) - 1):
-                x += dmap.distance(self.route[i], self.route[i+1])
-            x += dmap.distance(self.route[-1], self.route[0])
-            return x
-        return x
+        matrix = dmap.matrix()
+        if matrix is not self._matrix:
+            self._matrix = matrix
+            self._hops = 1
+            self._open_dist = 0
+        self._extend_distance()
+        return self._open_dist + matrix.distance(self.route[-1],
+                                                 self.route[0])
+
+    def set_route(self, route: List[str]) -> None:
+        """Replace the route of this truck with <route>, such as a shorter
+        ordering of the same stops.
+
+        Precondition: route[0] is this truck's depot, and <route> visits the
+        destination of every parcel on this truck.
+
+        >>> t1 = Truck(1423, 100, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t1.pack(Parcel(2, 5, 'Toronto', 'York'))
+        True
+        >>> t1.set_route(['Toronto', 'York', 'Hamilton'])
+        >>> t1.route
+        ['Toronto', 'York', 'Hamilton']
+        """
+        self.route = list(route)
+        self._route_changed()
+
+    def _route_changed(self) -> None:
+        """Forget the distance computed for the old route of this truck, and
+        update the statistics of its fleet for the new one.
+        """
+        self._matrix = None
+        self._hops = 1
+        self._open_dist = 0
+        if self.fleet is not None:
+            self.fleet.truck_rerouted(self)
+
+    def _extend_distance(self) -> None:
+        """Add the legs of the route that are not yet covered to
+        <self._open_dist>, so that it covers the whole route.
+
+        Precondition: <self._matrix> is not None.
+        """
+        if self._hops < len(self.route):
+            lookup = self._matrix.cities.lookup
+            ids = [lookup(city) for city in self.route[self._hops - 1:]]
+            self._open_dist += sum(self._matrix.distances(ids[:-1], ids[1:]))
+            self._hops = len(self.route)
 
 
 class Fleet:
     """ A fleet of trucks for making deliveries.
 
+    Statistics are kept up to date as trucks in the fleet are packed, so each
+    one takes O(1) time, even in the middle of scheduling.
+
     ===== Public Attributes =====
     trucks:
       List of all Truck objects in this fleet.
+
+    ===== Private Attributes =====
+    _nonempty:
+      The number of non-empty trucks in this fleet.
+    _unused:
+      The total available space in non-empty trucks in this fleet.
+    _fullness:
+      The sum of the fullness of non-empty trucks in this fleet.
+    _dmap:
+      The DistanceMap that <_distance> was computed with, or None if
+      distances are not being tracked yet.
+    _matrix:
+      The DistanceMatrix of <_dmap> when <_distance> was computed.
+    _dists:
+      Maps the id of each truck in this fleet to its distance travelled
+      according to <_dmap>.
+    _distance:
+      The sum of the values in <_dists>.
+    _by_depot:
+      Maps each depot to the trucks in this fleet that start there, in the
+      order they were added.
+
+    ===== Representation Invariants =====
+    - Trucks are only added to this fleet with add_truck.
+    - Every truck in this fleet has its fleet attribute set to this fleet.
+    - Every truck in this fleet is in <_by_depot>[truck.dep], and nowhere else
+      in <_by_depot>.
     """
     trucks: List[Truck]
+    _nonempty: int
+    _unused: int
+    _fullness: float
+    _dmap: Optional[DistanceMap]
+    _matrix: Optional[DistanceMatrix]
+    _dists: Dict[int, int]
+    _distance: int
+    _by_depot: Dict[str, List[Truck]]
 
     def __init__(self) -> None:
         """Create a Fleet with no trucks.
@@ -278,6 +395,14 @@ class Fleet:
         0
         """
         self.trucks = []
+        self._nonempty = 0
+        self._unused = 0
+        self._fullness = 0.0
+        self._dmap = None
+        self._matrix = None
+        self._dists = {}
+        self._distance = 0
+        self._by_depot = {}
 
     def add_truck(self, truck: Truck) -> None:
         """Add <truck> to this fleet.
@@ -292,6 +417,67 @@ class Fleet:
         1
         """
         self.trucks.append(truck)
+        self._by_depot.setdefault(truck.dep, []).append(truck)
+        truck.fleet = self
+        self._count_truck(truck)
+
+    def _count_truck(self, truck: Truck) -> None:
+        """Add the current state of <truck>, which has just been added to this
+        fleet, to the statistics of this fleet.
+        """
+        if not truck.empty_truck():
+            self._nonempty += 1
+            self._unused += truck.avail
+            self._fullness += truck.fullness()
+        if self._dmap is not None:
+            d = truck.truck_distance(self._dmap)
+            self._dists[truck.t_id] = d
+            self._distance += d
+
+    def truck_packed(self, truck: Truck, old_avail: int,
+                     route_grew: bool) -> None:
+        """Update the statistics of this fleet after a parcel was packed onto
+        <truck>, which had <old_avail> available space before.  <route_grew>
+        is True iff a city was added to the truck's route.
+
+        This is called by Truck.pack.
+
+        Precondition: <truck> is in this fleet.
+
+        >>> f = Fleet()
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> f.add_truck(t)
+        >>> t.pack(Parcel(1, 4, 'Toronto', 'Hamilton'))
+        True
+        >>> f.num_nonempty_trucks(), f.total_unused_space()
+        (1, 6)
+        """
+        if old_avail == truck.cap:
+            self._nonempty += 1
+            self._unused += truck.avail
+            self._fullness += truck.fullness()
+        else:
+            self._unused -= old_avail - truck.avail
+            self._fullness += (truck.fullness()
+                               - ((truck.cap - old_avail) / truck.cap) * 100)
+
+        if route_grew and self._dmap is not None:
+            d = truck.truck_distance(self._dmap)
+            self._distance += d - self._dists[truck.t_id]
+            self._dists[truck.t_id] = d
+
+    def truck_rerouted(self, truck: Truck) -> None:
+        """Update the statistics of this fleet after the route of <truck> was
+        replaced.
+
+        This is called by Truck.set_route.
+
+        Precondition: <truck> is in this fleet.
+        """
+        if self._dmap is not None:
+            d = truck.truck_distance(self._dmap)
+            self._distance += d - self._dists[truck.t_id]
+            self._dists[truck.t_id] = d
 
     def __str__(self) -> str:
         """Produce a string representation of this fleet
@@ -321,6 +507,34 @@ class Fleet:
         """
         return len(self.trucks)
 
+    def depots(self) -> List[str]:
+        """Return the depots of the trucks in this fleet, in the order that
+        their first truck was added.
+
+        >>> f = Fleet()
+        >>> f.add_truck(Truck(1, 10, 'Toronto'))
+        >>> f.add_truck(Truck(2, 10, 'Ottawa'))
+        >>> f.add_truck(Truck(3, 10, 'Toronto'))
+        >>> f.depots()
+        ['Toronto', 'Ottawa']
+        """
+        return list(self._by_depot)
+
+    def trucks_at(self, depot: str) -> List[Truck]:
+        """Return the trucks in this fleet that start at <depot>, in the
+        order they were added.
+
+        >>> f = Fleet()
+        >>> f.add_truck(Truck(1, 10, 'Toronto'))
+        >>> f.add_truck(Truck(2, 10, 'Ottawa'))
+        >>> f.add_truck(Truck(3, 10, 'Toronto'))
+        >>> [t.t_id for t in f.trucks_at('Toronto')]
+        [1, 3]
+        >>> f.trucks_at('York')
+        []
+        """
+        return list(self._by_depot.get(depot, []))
+
     def num_nonempty_trucks(self) -> int:
         """Return the number of non-empty trucks in this fleet.
 
@@ -347,11 +561,7 @@ class Fleet:
         >>> f.num_nonempty_trucks()
         2
         """
-        x = 0
-        for truck in self.trucks:
-            if not truck.empty_truck():
-                x += 1
-        return x
+        return self._nonempty
 
     def parcel_allocations(self) -> Dict[int, List[int]]:
         """Return a dictionary in which each key is the ID of a truck in this
@@ -417,12 +627,7 @@ class Fleet:
         >>> f.total_unused_space()
         11024
         """
-        total_avail = 0
-        for truck in self.trucks:
-            if not truck.empty_truck():
-                total_avail += truck.avail
-
-        return total_avail
+        return self._unused
 
     def _total_fullness(self) -> float:
         """Return the sum of truck.fullness() for each non-empty truck in the
@@ -451,12 +656,7 @@ class Fleet:
         >>> f._total_fullness()
         130.0
         """
-        x = 0
-        for truck in self.trucks:
-            if not truck.empty_truck():
-                x += truck.fullness()
-
-        return x
+        return self._fullness
 
     def average_fullness(self) -> float:
         """Return the average percent fullness of all non-empty trucks in the
@@ -510,13 +710,22 @@ class Fleet:
         >>> f.add_truck(t2)
         >>> f.total_distance_travelled(m)
         36
+        >>> t1.pack(Parcel(3, 5, 'Toronto', 'London'))
+        True
+        >>> m.add_distance('Hamilton', 'London', 4)
+        >>> m.add_distance('London', 'Toronto', 11)
+        >>> f.total_distance_travelled(m)
+        42
         """
-        td = 0
-
-        for truck in self.trucks:
-            td += truck.truck_distance(dmap)
-
-        return td
+        if dmap is not self._dmap or dmap.matrix() is not self._matrix:
+            self._dmap = dmap
+            self._dists = {}
+            for truck in self.trucks:
+                self._dists[truck.t_id] = truck.truck_distance(dmap)
+            self._distance = sum(self._dists.values())
+            self._matrix = dmap.matrix()
+
+        return self._distance
 
     def average_distance_travelled(self, dmap: DistanceMap) -> float:
         """Return the average distance travelled by the trucks in this fleet,
@@ -23,12 +23,48 @@ run the experiment, generate statistics as the result of the experiment, and
 (optionally) report the statistics.
 
 This module is responsible for all the reading of data from the data files.
+A LoadedProblem reads the data for one problem once, so that it can be shared
+by many experiments.  This module also provides run_random_replicas, which
+runs many independent random schedules of one problem across a pool of
+processes.
+
+The text data files can also be converted to binary input files, which are
+memory-mapped when loaded instead of being parsed.
 """
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Optional, Tuple, Iterator, Sequence
 import json
-from scheduler import RandomScheduler, GreedyScheduler, Scheduler
+import mmap
+import os
+import struct
+import time
+from array import array
+from hashlib import sha256
+from random import Random
+from concurrent.futures import ProcessPoolExecutor
+from scheduler import RandomScheduler, GreedyScheduler, Scheduler, \
+    InsertionScheduler, FirstFitScheduler, BestFitScheduler, \
+    WorstFitScheduler, BranchAndBoundScheduler, OPTIMIZE_TIME_BUDGET, \
+    VERBOSE_EVERY
 from domain import Parcel, Truck, Fleet
-from distance_map import DistanceMap
+from distance_map import DistanceMap, DistanceMatrix, CityTable
+from store import ParcelStore, FleetStore
+from routing import improve_routes, ROUTE_TIME_BUDGET, EXACT_ROUTE_MAX_STOPS
+from partition import PartitionedScheduler
+from profiling import PhaseHook, ChromeTrace
+
+# The default number of parcels in each batch read by read_parcel_batches.
+PARCEL_BATCH_SIZE = 100000
+
+# The number of bins in each histogram of a run report.
+REPORT_BINS = 10
+
+# The length of the bar for the fullest bin of a histogram in a text report.
+_REPORT_BAR = 40
+
+# The bin-packing scheduler for each of their 'algorithm' config values.
+_BIN_PACKING_SCHEDULERS = {'first-fit': FirstFitScheduler,
+                           'best-fit': BestFitScheduler,
+                           'worst-fit': WorstFitScheduler}
 
 
 class SchedulingExperiment:
@@ -37,7 +73,12 @@ class SchedulingExperiment:
     To complete an experiment involves four stages:
 
     1. Read in all data from necessary files, and create corresponding objects.
-    2. Run a scheduling algorithm to assign parcels to trucks.
+    2. Run a scheduling algorithm to assign parcels to trucks.  If the
+       configuration has the optional key 'parcel_batch_size', parcels are
+       not read in stage 1; instead they are read and scheduled in batches of
+       that size, so that they never all need to be in memory at once.
+       If the configuration has the optional key 'improve_routes' set to True,
+       the route of every truck is then shortened with routing.improve_routes.
     3. Compute statistics showing how good the assignment of parcels to trucks
        is.
     4. Report the statistics from the experiment.
@@ -45,17 +86,39 @@ class SchedulingExperiment:
     === Public Attributes ===
     verbose:
       If <verbose> is True, print step-by-step details regarding the scheduling
-      algorithm as it runs.
+      algorithm as it runs, sampled every 'verbose_every' parcels.
     scheduler:
       The scheduler to use in this experiment.
     parcels:
-      The parcels to schedule in this experiment.
+      The parcels to schedule in this experiment.  Empty if parcels are
+      streamed in batches.
     fleet:
       The trucks that parcels are scheduled to in this experiment.
     dmap:
       The distances between cities in this experiment.
+    phase_times:
+      The time, in seconds, that the last run spent in each of its phases:
+      'schedule', 'improve_routes' (if routes are improved) and
+      'compute_stats'.
+    hooks:
+      The hooks told as each phase of this experiment starts and ends,
+      including reading the problem if this experiment read it.
 
     === Private Attributes ===
+    _parcel_file:
+      The file that parcels are streamed from, or None if they were all read
+      into <parcels> up front.
+    _batch_size:
+      The number of parcels in each streamed batch.
+    _route_budget:
+      The time in seconds spent improving the route of each truck after
+      scheduling, or None if routes are not improved.
+    _route_processes:
+      The number of processes that routes are improved over, as in
+      routing.improve_routes.
+    _route_exact_stops:
+      The largest number of different stops for which a route is solved
+      exactly when routes are improved.
     _stats:
       A dictionary of statistics. <_stats>'s value is undefined until
       <self>._compute_stats is called, at which point it contains keys and
@@ -64,6 +127,13 @@ class SchedulingExperiment:
       A list of parcels. <_unscheduled>'s value is undefined until <self>.run
       is called, at which point it contains the list of parcels that could
       not be scheduled in the experiment.
+    _trace:
+      The trace of the phases of this experiment, or None if it is not
+      traced.
+    _trace_file:
+      The file that <_trace> is written to after each run.
+    _report_format:
+      The format that reports are printed in: 'text' or 'json'.
 
     === Representation Invariants ===
     - <fleet> contains at least one truck
@@ -76,30 +146,117 @@ class SchedulingExperiment:
     parcels: List[Parcel]
     fleet: Fleet
     dmap: DistanceMap
+    phase_times: Dict[str, float]
+    hooks: List[PhaseHook]
+    _parcel_file: Optional[str]
+    _batch_size: int
+    _route_budget: Optional[float]
+    _route_processes: Optional[int]
+    _route_exact_stops: int
     _stats: Dict[str, Union[int, float]]
     _unscheduled: List[Parcel]
+    _trace: Optional[ChromeTrace]
+    _trace_file: Optional[str]
+    _report_format: str
 
-    def __init__(self, config: Dict[str, Union[str, bool]]) -> None:
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 problem: Optional['LoadedProblem'] = None,
+                 hooks: Optional[List[PhaseHook]] = None) -> None:
         """Initialize a new experiment with the configuration specified in
         <config>.
 
+        If <problem> is given, take the parcels, map and an empty fleet from it
+        instead of reading them from the files named in <config>.  Each of
+        <hooks> is told as each phase starts and ends.
+
         Precondition: <config> contains keys and values as specified
-        in Assignment 1.
+        in Assignment 1, except that 'algorithm' may also be 'insertion' (see
+        scheduler.InsertionScheduler) or 'branch-and-bound' (see
+        scheduler.BranchAndBoundScheduler), which take the same parcel and
+        truck orders as 'greedy', or one of the bin-packing algorithms
+        'first-fit', 'best-fit' and 'worst-fit', which take no orders.  The
+        branch-and-bound algorithm searches for 'optimize_time_budget' seconds
+        (OPTIMIZE_TIME_BUDGET by default).  If <config> has the key
+        'partitions', the greedy algorithm is split into at most that many
+        partitions of nearby destinations (see partition.PartitionedScheduler)
+        and scheduled over 'partition_processes' processes (1 by default).
+        If it has the key 'nearby_depots', the greedy algorithm only puts each
+        parcel on trucks from that many depots nearest its destination (see
+        scheduler.DepotIndex); trucks name their own depots in the truck file
+        (see read_trucks).  <config> may also contain the optional keys
+        'seed' (for the random algorithm), 'complete_map', 'keep_paths' and
+        'map_cache_dir' (as the arguments of read_distance_map), and
+        'parcel_batch_size' (to stream parcels in batches of that size).  It
+        may also contain 'improve_routes', to improve routes after scheduling,
+        with 'route_time_budget' seconds per truck (ROUTE_TIME_BUDGET by
+        default) over 'route_processes' processes (1 by default), solving
+        routes with at most 'exact_route_max_stops' stops exactly
+        (EXACT_ROUTE_MAX_STOPS by default).  If it has 'profile' set to True,
+        the greedy algorithm, partitioned or not, counts its work (see
+        profiling.ScheduleCounters), and the counts are added to the
+        statistics; the other algorithms do not count their work.  If it has
+        'trace_file', the phases of each run (and of reading the problem, if
+        this experiment reads it) and the counts are written to that file as a
+        Chrome trace (see profiling.ChromeTrace).
+        A verbose run prints every 'verbose_every'th parcel placed
+        (VERBOSE_EVERY by default), and reports are printed in
+        'report_format', 'text' or 'json' ('text' by default).
+
+        Raise ValueError if 'verbose_every' is less than 1.
         """
+        verbose_every = config.get('verbose_every', VERBOSE_EVERY)
+        if verbose_every < 1:
+            raise ValueError(f'verbose_every must be at least 1, not '
+                             f'{verbose_every}')
         self.verbose = config['verbose']
+        self.hooks = list(hooks) if hooks is not None else []
+        self._trace = None
+        self._trace_file = config.get('trace_file')
+        if self._trace_file is not None:
+            self._trace = ChromeTrace()
+            self.hooks.append(self._trace)
+
+        if problem is None:
+            problem = LoadedProblem(config, self.hooks)
+        self.parcels = problem.parcels
+        self.fleet = problem.fresh_fleet()
+        self.dmap = problem.dmap
 
-        if config['algorithm'] == 'greedy':
-            self.scheduler = GreedyScheduler(config)
+        if config['algorithm'] == 'greedy' and 'partitions' in config:
+            self.scheduler = PartitionedScheduler(
+                config, self.dmap, config['partitions'],
+                config.get('partition_processes', 1))
+        elif config['algorithm'] == 'greedy':
+            self.scheduler = GreedyScheduler(config, self.dmap)
+        elif config['algorithm'] == 'insertion':
+            self.scheduler = InsertionScheduler(config, self.dmap)
+        elif config['algorithm'] == 'branch-and-bound':
+            self.scheduler = BranchAndBoundScheduler(
+                config, self.dmap,
+                config.get('optimize_time_budget', OPTIMIZE_TIME_BUDGET))
+        elif config['algorithm'] in _BIN_PACKING_SCHEDULERS:
+            self.scheduler = _BIN_PACKING_SCHEDULERS[config['algorithm']]()
         else:
-            self.scheduler = RandomScheduler()
+            self.scheduler = RandomScheduler(config.get('seed'))
+        self.scheduler.verbose_every = verbose_every
+        self._report_format = config.get('report_format', 'text')
+
+        self._parcel_file = None
+        self._batch_size = config.get('parcel_batch_size', PARCEL_BATCH_SIZE)
+        if 'parcel_batch_size' in config:
+            self._parcel_file = config['parcel_file']
 
-        self.parcels = read_parcels(config['parcel_file'])
-        self.fleet = read_trucks(config['truck_file'],
-                                 config['depot_location'])
-        self.dmap = read_distance_map(config['map_file'])
+        self._route_budget = None
+        if config.get('improve_routes', False):
+            self._route_budget = config.get('route_time_budget',
+                                            ROUTE_TIME_BUDGET)
+        self._route_processes = config.get('route_processes', 1)
+        self._route_exact_stops = config.get('exact_route_max_stops',
+                                             EXACT_ROUTE_MAX_STOPS)
 
         self._stats = {}
         self._unscheduled = []
+        self.phase_times = {}
 
     def run(self, report: bool = False) -> Dict[str, Union[int, float]]:
         """Run the experiment and return statistics on the outcome.
@@ -112,13 +269,47 @@ class SchedulingExperiment:
 
         If <self.verbose> is True, print step-by-step details
         regarding the scheduling algorithm as it runs.
+
+        If parcels are streamed, each batch is scheduled in turn onto the
+        trucks as the earlier batches left them.  The greedy algorithm then
+        only orders parcels within each batch, so its schedule can differ from
+        scheduling every parcel at once.
         """
-        unscheduled = self.scheduler.schedule(self.parcels,
-                                              self.fleet.trucks)
-        for i in unscheduled:
-            self._unscheduled.append(i)
+        if self._parcel_file is None:
+            batches = [self.parcels]
+        else:
+            batches = read_parcel_batches(self._parcel_file,
+                                          self._batch_size)
 
+        start = _start_phase(self.hooks, 'schedule')
+        for batch in batches:
+            unscheduled = self.scheduler.schedule(batch, self.fleet.trucks,
+                                                  self.verbose)
+            for i in unscheduled:
+                self._unscheduled.append(i)
+        self.phase_times['schedule'] = _end_phase(self.hooks, 'schedule',
+                                                  start)
+
+        if self._route_budget is not None:
+            start = _start_phase(self.hooks, 'improve_routes')
+            improve_routes(self.fleet, self.dmap, self._route_budget,
+                           self._route_processes, self._route_exact_stops)
+            self.phase_times['improve_routes'] = _end_phase(
+                self.hooks, 'improve_routes', start)
+
+        start = _start_phase(self.hooks, 'compute_stats')
         self._compute_stats()
+        self.phase_times['compute_stats'] = _end_phase(
+            self.hooks, 'compute_stats', start)
+
+        counters = None
+        if self.scheduler.counters is not None:
+            counters = self.scheduler.counters.as_dict()
+            self._stats.update(counters)
+        if self._trace is not None:
+            if counters is not None:
+                self._trace.add_counters('schedule', counters)
+            self._trace.write(self._trace_file)
         if report:
             self._print_report()
         return self._stats
@@ -131,15 +322,8 @@ class SchedulingExperiment:
         Precondition: _run has already been called.
         """
 
-        self._stats = {
-            'fleet': self.fleet.num_trucks(),
-            'unused_trucks': (self.fleet.num_trucks() -
-                              self.fleet.num_nonempty_trucks()),
-            'avg_distance': self.fleet.average_distance_travelled(self.dmap),
-            'avg_fullness': self.fleet.average_fullness(),
-            'unused_space': self.fleet.total_unused_space(),
-            'unscheduled': len(self._unscheduled)
-        }
+        self._stats = _fleet_stats(self.fleet, self.dmap,
+                                   len(self._unscheduled))
 
     def _print_report(self) -> None:
         """Report on the statistics for this experiment.
@@ -148,13 +332,357 @@ class SchedulingExperiment:
         the content and format of the report is your choice; we
         will not call your run method with <report> set to True.
 
+        The report has the statistics, the time spent in each phase, and
+        histograms of the trucks' fullness, distance travelled and number of
+        parcels (see fleet_histograms).  It is printed as text, or as JSON if
+        the report format is 'json'.
+
         Precondition: _compute_stats has already been called.
         """
+        histograms = fleet_histograms(self.fleet, self.dmap)
+        if self._report_format == 'json':
+            print(json.dumps({'stats': self._stats,
+                              'phases': self.phase_times,
+                              'histograms': histograms}, indent=2))
+            return
+
+        print('=== Statistics ===')
+        for key, value in self._stats.items():
+            print(f'{key}: {value}')
+        print('=== Phases (seconds) ===')
+        for phase, seconds in self.phase_times.items():
+            print(f'{phase}: {seconds:.6f}')
+        for name, histogram in histograms.items():
+            print(f'=== Trucks by {name} ===')
+            _print_histogram(histogram)
+
+
+class LoadedProblem:
+    """The data for a scheduling problem, read from its files once so that it
+    can be shared by many experiments.
+
+    === Public Attributes ===
+    parcels:
+      The parcels to schedule, in a ParcelStore if they were loaded from a
+      binary parcel file.  Schedulers do not mutate them, so they are shared
+      by every experiment on this problem.
+    trucks:
+      The trucks of the problem, all empty.  These are never packed; each
+      experiment packs its own copies from fresh_fleet.
+    dmap:
+      The distances between cities.
+    read_times:
+      The time, in seconds, spent reading each kind of file: the phases
+      'read_parcels', 'read_trucks' and 'read_distance_map'.  The hooks
+      given when the problem is read are told as each phase starts and ends.
+
+    === Sample Usage ===
+    >>> problem = LoadedProblem({'depot_location': 'Toronto',
+    ...                          'parcel_file': 'data/parcel-data-small.txt',
+    ...                          'truck_file': 'data/truck-data-small.txt',
+    ...                          'map_file': 'data/map-data.txt'})
+    >>> fleet = problem.fresh_fleet()
+    >>> fleet.num_trucks(), fleet.num_nonempty_trucks()
+    (3, 0)
+    >>> fleet.trucks[0] is problem.trucks[0]
+    False
+    """
+    parcels: List[Parcel]
+    trucks: List[Truck]
+    dmap: DistanceMap
+    read_times: Dict[str, float]
+
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 hooks: Optional[List[PhaseHook]] = None) -> None:
+        """Read the problem whose files are specified in <config>, telling
+        each of <hooks> as reading each kind of file starts and ends.
+
+        If <config> has the optional key 'parcel_batch_size', parcels are left
+        to be streamed by each experiment, and <parcels> is empty.
+
+        Any of the files may be a binary input file of the right kind instead
+        (see binary_kind), in which case it is memory-mapped instead of read.
+        The trucks in a binary truck file start at the depot it was written
+        with.
+
+        Precondition: <config> contains the keys 'parcel_file', 'truck_file',
+        'depot_location' and 'map_file' as specified in Assignment 1, and may
+        contain the optional map keys described in SchedulingExperiment.
+        """
+        if hooks is None:
+            hooks = []
+        self.read_times = {}
+
+        start = _start_phase(hooks, 'read_parcels')
+        if 'parcel_batch_size' in config:
+            self.parcels = []
+        elif binary_kind(config['parcel_file']) == 'parcels':
+            self.parcels = load_parcel_store(config['parcel_file'])
+        else:
+            self.parcels = read_parcels(config['parcel_file'])
+        self.read_times['read_parcels'] = _end_phase(hooks, 'read_parcels',
+                                                     start)
+
+        start = _start_phase(hooks, 'read_trucks')
+        if binary_kind(config['truck_file']) == 'trucks':
+            self.trucks = load_trucks(config['truck_file'])
+        else:
+            self.trucks = read_trucks(config['truck_file'],
+                                      config['depot_location']).trucks
+        self.read_times['read_trucks'] = _end_phase(hooks, 'read_trucks',
+                                                    start)
+
+        start = _start_phase(hooks, 'read_distance_map')
+        if binary_kind(config['map_file']) == 'map':
+            self.dmap = load_distance_map(config['map_file'],
+                                          config.get('complete_map', False),
+                                          config.get('keep_paths', False))
+        else:
+            self.dmap = read_distance_map(config['map_file'],
+                                          config.get('complete_map', False),
+                                          config.get('keep_paths', False),
+                                          config.get('map_cache_dir'))
+        self.read_times['read_distance_map'] = _end_phase(
+            hooks, 'read_distance_map', start)
+
+    def fresh_fleet(self) -> Fleet:
+        """Return a new Fleet with an empty copy of each truck in this problem.
+        If the parcels were loaded from a binary file, the fleet is a
+        FleetStore over them.
+        """
+        if isinstance(self.parcels, ParcelStore):
+            fleet = FleetStore(self.parcels)
+            for truck in self.trucks:
+                fleet.add_truck(truck)
+            return fleet
+        return _empty_fleet(self.trucks)
+
+
+# ----- Reports -----
+
+
+def fleet_histograms(fleet: Fleet, dmap: DistanceMap,
+                     bins: int = REPORT_BINS) \
+        -> Dict[str, Dict[str, List[float]]]:
+    """Return histograms of the 'fullness', 'distance' travelled according
+    to <dmap> and number of 'parcels' of every truck in <fleet>.
+
+    Each histogram has <bins> bins of equal width, given by their 'edges' and
+    the 'counts' of trucks in them.  Bin i holds the values from edges[i] up
+    to but not including edges[i + 1], except that the last bin also holds
+    its upper edge.  Fullness runs from 0 to 100 percent, and the others from
+    0 to their largest value.  The trucks are visited once.
+
+    Precondition: bins > 0
+
+    >>> f = Fleet()
+    >>> t1 = Truck(1, 10, 'Toronto')
+    >>> t1.pack(Parcel(1, 10, 'Toronto', 'Hamilton'))
+    True
+    >>> t2 = Truck(2, 20, 'Toronto')
+    >>> t2.pack(Parcel(2, 5, 'Toronto', 'Hamilton'))
+    True
+    >>> t2.pack(Parcel(3, 5, 'Toronto', 'London'))
+    True
+    >>> f.add_truck(t1)
+    >>> f.add_truck(t2)
+    >>> f.add_truck(Truck(3, 10, 'Toronto'))
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Hamilton', 'London', 4)
+    >>> m.add_distance('London', 'Toronto', 11)
+    >>> histograms = fleet_histograms(f, m, 2)
+    >>> histograms['fullness']
+    {'edges': [0.0, 50.0, 100.0], 'counts': [1, 2]}
+    >>> histograms['distance']
+    {'edges': [0.0, 12.0, 24.0], 'counts': [1, 2]}
+    >>> histograms['parcels']
+    {'edges': [0.0, 1.0, 2.0], 'counts': [1, 2]}
+    """
+    fullness = []
+    distance = []
+    parcels = []
+    for truck in fleet.trucks:
+        fullness.append(truck.fullness())
+        distance.append(truck.truck_distance(dmap))
+        parcels.append(truck.num_par())
+
+    return {'fullness': _histogram(fullness, 100, bins),
+            'distance': _histogram(distance, max(distance, default=0), bins),
+            'parcels': _histogram(parcels, max(parcels, default=0), bins)}
+
+
+def _histogram(values: List[float], top: float,
+               bins: int) -> Dict[str, List[float]]:
+    """Return a histogram of <values> with <bins> bins of equal width from 0
+    to <top>, as in fleet_histograms.  If <top> is 0, each bin has width 1.
+
+    Precondition: 0 <= v <= top for every v in <values>, and bins > 0
+
+    >>> _histogram([0, 1, 3, 4], 4, 2)
+    {'edges': [0.0, 2.0, 4.0], 'counts': [2, 2]}
+    """
+    width = top / bins if top > 0 else 1
+    counts = [0] * bins
+    for value in values:
+        counts[min(int(value / width), bins - 1)] += 1
+    return {'edges': [i * width for i in range(bins + 1)], 'counts': counts}
+
+
+def _print_histogram(histogram: Dict[str, List[float]]) -> None:
+    """Print <histogram>, as returned by fleet_histograms, with one line
+    per bin and a bar as long as its count relative to the fullest bin.
+
+    >>> _print_histogram({'edges': [0.0, 5.0, 10.0], 'counts': [4, 1]})
+    [     0.0,      5.0)      4 ########################################
+    [     5.0,     10.0]      1 ##########
+    """
+    edges, counts = histogram['edges'], histogram['counts']
+    most = max(counts, default=0)
+    for i, count in enumerate(counts):
+        bar = '#' * (count * _REPORT_BAR // most) if most else ''
+        close = ']' if i == len(counts) - 1 else ')'
+        line = f'[{edges[i]:8.1f}, {edges[i + 1]:8.1f}{close} {count:6d} {bar}'
+        print(line.rstrip())
 
 
 # ----- Helper functions -----
 
 
+def _start_phase(hooks: List[PhaseHook], phase: str) -> float:
+    """Tell each of <hooks> that the phase named <phase> has started, and
+    return the time it started, as from time.perf_counter.
+    """
+    for hook in hooks:
+        hook.phase_started(phase)
+    return time.perf_counter()
+
+
+def _end_phase(hooks: List[PhaseHook], phase: str, start: float) -> float:
+    """Tell each of <hooks> that the phase named <phase>, which started at
+    <start>, has ended, and return the time it took in seconds.
+    """
+    seconds = time.perf_counter() - start
+    for hook in hooks:
+        hook.phase_ended(phase, seconds)
+    return seconds
+
+
+def _empty_fleet(trucks: List[Truck]) -> Fleet:
+    """Return a new Fleet with an empty copy of each truck in <trucks>, with
+    the same id, capacity and depot.
+    """
+    fleet = Fleet()
+    for truck in trucks:
+        fleet.add_truck(Truck(truck.t_id, truck.cap, truck.dep))
+    return fleet
+
+
+def _fleet_stats(fleet: Fleet, dmap: DistanceMap,
+                 unscheduled: int) -> Dict[str, Union[int, float]]:
+    """Return the statistics for a schedule onto <fleet> that left
+    <unscheduled> parcels unscheduled.  Keys and values are as specified in
+    Step 6 of Assignment 1.
+
+    Precondition: At least one truck in <fleet> is non-empty.
+    """
+    num_trucks = fleet.num_trucks()
+    nonempty = fleet.num_nonempty_trucks()
+    return {
+        'fleet': num_trucks,
+        'unused_trucks': num_trucks - nonempty,
+        'avg_distance': fleet.total_distance_travelled(dmap) / nonempty,
+        'avg_fullness': fleet.average_fullness(),
+        'unused_space': fleet.total_unused_space(),
+        'unscheduled': unscheduled
+    }
+
+
+# ----- Random replicas -----
+
+# The problem shared by all replicas run in this process.  It is set once per
+# worker process by _init_replica_worker, so that the parcels, trucks and map
+# are not sent again with every replica.
+_replica_problem: Tuple[List[Parcel], List[Truck], Optional[DistanceMap]] = \
+    ([], [], None)
+
+
+def _random_schedule(parcels: List[Parcel], trucks: List[Truck],
+                     seed: int) -> Tuple[Fleet, List[Parcel]]:
+    """Schedule <parcels> onto empty copies of <trucks> with a RandomScheduler
+    seeded with <seed>.  Return the resulting fleet and the parcels that did
+    not get scheduled.
+    """
+    fleet = _empty_fleet(trucks)
+    unscheduled = RandomScheduler(seed).schedule(parcels, fleet.trucks)
+    return fleet, unscheduled
+
+
+def _replica_stats(parcels: List[Parcel], trucks: List[Truck],
+                   dmap: DistanceMap,
+                   seed: int) -> Dict[str, Union[int, float]]:
+    """Return the statistics for the random replica with <seed>, with the
+    seed recorded under the key 'seed'.
+    """
+    fleet, unscheduled = _random_schedule(parcels, trucks, seed)
+    stats = _fleet_stats(fleet, dmap, len(unscheduled))
+    stats['seed'] = seed
+    return stats
+
+
+def _init_replica_worker(parcels: List[Parcel], trucks: List[Truck],
+                         dmap: DistanceMap) -> None:
+    """Record the problem shared by all replicas run in this worker process.
+    """
+    global _replica_problem
+    _replica_problem = (parcels, trucks, dmap)
+
+
+def _run_replica(seed: int) -> Dict[str, Union[int, float]]:
+    """Return the statistics for the random replica with <seed> on the problem
+    recorded by _init_replica_worker.
+    """
+    parcels, trucks, dmap = _replica_problem
+    return _replica_stats(parcels, trucks, dmap, seed)
+
+
+def run_random_replicas(parcels: List[Parcel], trucks: List[Truck],
+                        dmap: DistanceMap, n: int,
+                        seed: Union[None, int, Random] = None,
+                        processes: Optional[int] = None) \
+        -> Tuple[List[Dict[str, Union[int, float]]], Fleet]:
+    """Run <n> independent random schedules of <parcels> onto empty copies of
+    <trucks>, spread over a pool of <processes> worker processes, and return
+    the statistics for every replica along with the fleet of the best one.
+
+    The statistics are as specified in Step 6 of Assignment 1, plus the key
+    'seed' holding the seed of that replica's RandomScheduler.  They are in
+    the same order for the same <seed>, however many processes are used.  The
+    best replica is the one with the fewest unscheduled parcels, with ties
+    broken by the smallest average distance; its fleet is rebuilt in this
+    process from its seed.
+
+    If <processes> is None, use one process per CPU.  If it is 1, run every
+    replica in this process.  Neither <parcels> nor <trucks> is mutated.
+
+    Precondition: n > 0, and every replica packs at least one truck.
+    """
+    rng = seed if isinstance(seed, Random) else Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(n)]
+
+    if processes == 1:
+        stats = [_replica_stats(parcels, trucks, dmap, s) for s in seeds]
+    else:
+        with ProcessPoolExecutor(processes,
+                                 initializer=_init_replica_worker,
+                                 initargs=(parcels, trucks, dmap)) as pool:
+            stats = list(pool.map(_run_replica, seeds))
+
+    best = min(stats, key=lambda s: (s['unscheduled'], s['avg_distance']))
+    fleet, _ = _random_schedule(parcels, trucks, best['seed'])
+    return stats, fleet
+
+
 def read_parcels(parcel_file: str) -> List[Parcel]:
     """Read parcel data from <parcel_file> and return.
 
@@ -163,25 +691,93 @@ def read_parcels(parcel_file: str) -> List[Parcel]:
     """
     x = []
     # read and add the parcels to the list.
+    for batch in read_parcel_batches(parcel_file):
+        x.extend(batch)
+
+    return x
+
+
+def read_parcel_batches(parcel_file: str,
+                        batch_size: int = PARCEL_BATCH_SIZE) \
+        -> Iterator[List[Parcel]]:
+    """Read parcel data from <parcel_file> and yield it in lists of
+    <batch_size> parcels, in the order they appear in the file.  The last list
+    may be shorter.  Blank lines are skipped.
+
+    Only one batch is held in memory at a time.  Parcels with the same source
+    or destination share a single string for the city name.  <parcel_file>
+    may also be a binary parcel file, in which case the parcels are views
+    into it.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data in
+                  the form specified in Assignment 1, and batch_size > 0.
+
+    >>> batches = read_parcel_batches('data/parcel-data-small.txt', 2)
+    >>> [[p.p_id for p in batch] for batch in batches]
+    [[53, 764], [644]]
+    """
+    if binary_kind(parcel_file) == 'parcels':
+        store = load_parcel_store(parcel_file)
+        for start in range(0, len(store), batch_size):
+            yield [store[i] for i in
+                   range(start, min(start + batch_size, len(store)))]
+        return
+
+    cities = {}
+    batch = []
     with open(parcel_file, 'r') as file:
         for line in file:
-            tokens = line.strip().split(',')
-            pid = int(tokens[0].strip())
+            if line.isspace():
+                continue
+            # int ignores the whitespace around each number, so only the
+            # city names need to be stripped.
+            tokens = line.split(',')
             source = tokens[1].strip()
             destination = tokens[2].strip()
-            volume = int(tokens[3].strip())
-            x.append(Parcel(pid, volume, source, destination))
-
-    return x
+            batch.append(Parcel(int(tokens[0]), int(tokens[3]),
+                                cities.setdefault(source, source),
+                                cities.setdefault(destination, destination)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
 
 
-def read_distance_map(distance_map_file: str) -> DistanceMap:
+def read_distance_map(distance_map_file: str, complete: bool = False,
+                      keep_paths: bool = False,
+                      cache_dir: Optional[str] = None) -> DistanceMap:
     """Read distance data from <distance_map_file> and return a DistanceMap
     that records it.
 
+    If <complete> is True, complete the map with shortest-path distances for
+    the pairs of cities it does not list, keeping the shortest paths if
+    <keep_paths> is True (see DistanceMap.complete).  If <cache_dir> is also
+    given, the completed map is saved in that directory as a binary map file
+    (see write_distance_map_binary), named by the hash of the file's contents
+    and the version of the binary format, and loaded from there the next time
+    the same file is read.  A cache file that cannot be loaded is written
+    again.
+
+    Cache files are only ever loaded as binary map files, so they cannot run
+    code, but anyone who can write to <cache_dir> can change the distances
+    that are read from it.  <cache_dir> must only be writable by users who
+    are trusted with the maps.
+
     Precondition: <distance_map_file> is the path to a file containing distance
                   data in the form specified in Assignment 1.
     """
+    cache_file = None
+    if complete and cache_dir is not None:
+        cache_file = _map_cache_file(distance_map_file, keep_paths, cache_dir)
+        if os.path.exists(cache_file):
+            try:
+                return load_distance_map(cache_file, True, keep_paths)
+            except (ValueError, struct.error):
+                # The file is damaged, or is not a cached map of this kind,
+                # so it is replaced below.
+                pass
+
     m = DistanceMap()
     with open(distance_map_file, 'r') as file:
         for line in file:
@@ -193,27 +789,282 @@ def read_distance_map(distance_map_file: str) -> DistanceMap:
                 else distance1
             m.add_distance(c1, c2, distance1, distance2)
 
+    if complete:
+        m.complete(keep_paths)
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_matrix_binary(m.matrix(), cache_file, True)
+
     return m
 
 
+def _map_cache_file(distance_map_file: str, keep_paths: bool,
+                    cache_dir: str) -> str:
+    """Return the path in <cache_dir> of the cached completed map for the
+    current contents of <distance_map_file>, in the current version of the
+    binary format.
+    """
+    digest = sha256()
+    with open(distance_map_file, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    kind = 'paths' if keep_paths else 'distances'
+    return os.path.join(cache_dir, f'{digest.hexdigest()}-{kind}'
+                                   f'-v{_BINARY_VERSION}.bin')
+
+
 def read_trucks(truck_file: str, depot_location: str) -> Fleet:
     """Read truck data from <truck_file> and return a Fleet containing these
     trucks, with each truck starting at the <depot_location>.
 
+    A line may also have a third column naming the depot of that truck, which
+    then starts there instead of at <depot_location>.
+
     Precondition: <truck_file> is a path to a file containing truck data in the
                   form specified in Assignment 1.
     """
     f = Fleet()
+    depots = {}
     with open(truck_file, 'r') as file:
         for line in file:
             tokens = line.strip().split(',')
             tid = int(tokens[0])
             capacity = int(tokens[1])
-            f.add_truck(Truck(tid, capacity, depot_location))
+            depot = depot_location
+            if len(tokens) > 2:
+                depot = tokens[2].strip()
+                depot = depots.setdefault(depot, depot)
+            f.add_truck(Truck(tid, capacity, depot))
 
     return f
 
 
+# ----- Binary input files -----
+
+# The first 8 bytes of each kind of binary input file.
+_PARCEL_MAGIC = b'A1PARCEL'
+_TRUCK_MAGIC = b'A1TRUCKS'
+_MAP_MAGIC = b'A1DISTMP'
+
+# The header of a binary input file: its magic, the version of the format it
+# was written in, the number of records, the number of cities in its city
+# table, the size in bytes of the city names, flags (for a map, _MAP_COMPLETE
+# if it is complete and _MAP_PATHS if it also holds shortest paths; for
+# trucks, _TRUCK_DEPOTS if each truck has its own depot), and
+# _BYTE_ORDER_MARK as written by the machine that wrote the file.
+_HEADER = struct.Struct('=8sqqqqqq')
+_BINARY_VERSION = 2
+_BYTE_ORDER_MARK = 0x0102030405060708
+_MAP_COMPLETE = 1
+_MAP_PATHS = 2
+_TRUCK_DEPOTS = 1
+
+
+def binary_kind(file_name: str) -> Optional[str]:
+    """Return 'parcels', 'trucks' or 'map' if <file_name> is a binary input
+    file of that kind, and None if it is not a binary input file.
+
+    >>> binary_kind('data/parcel-data-small.txt') is None
+    True
+    """
+    with open(file_name, 'rb') as file:
+        magic = file.read(len(_PARCEL_MAGIC))
+    return {_PARCEL_MAGIC: 'parcels', _TRUCK_MAGIC: 'trucks',
+            _MAP_MAGIC: 'map'}.get(magic)
+
+
+def _write_binary(binary_file: str, magic: bytes, count: int,
+                  names: List[str], flags: int,
+                  columns: List[Sequence[int]]) -> None:
+    """Write a binary input file to <binary_file> with <count> records, the
+    city table <names>, <flags>, and each of <columns> as one contiguous
+    block, in order.  Columns must be int64 arrays, followed by int32 arrays.
+    """
+    table = '\n'.join(names).encode('utf-8')
+    with open(binary_file + '.tmp', 'wb') as file:
+        file.write(_HEADER.pack(magic, _BINARY_VERSION, count, len(names),
+                                len(table), flags, _BYTE_ORDER_MARK))
+        file.write(table)
+        file.write(bytes(-len(table) % 8))
+        for column in columns:
+            file.write(column)
+    os.replace(binary_file + '.tmp', binary_file)
+
+
+def _map_binary(binary_file: str, magic: bytes) \
+        -> Tuple[CityTable, int, int, memoryview]:
+    """Memory-map the binary input file <binary_file> and return its city
+    table, number of records, flags, and a read-only view of the column
+    blocks after its city table.
+
+    Raise a ValueError if <binary_file> does not start with <magic>, was
+    written in another version of the format, or was written on a machine
+    with a different byte order.
+    """
+    with open(binary_file, 'rb') as file:
+        data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    kind, version, count, num_cities, names_size, flags, mark = \
+        _HEADER.unpack_from(data)
+    if kind != magic:
+        raise ValueError(f'{binary_file} is not a binary {magic} file')
+    if version != _BINARY_VERSION:
+        raise ValueError(f'{binary_file} was written in version {version} of '
+                         f'the binary format, not {_BINARY_VERSION}')
+    if mark != _BYTE_ORDER_MARK:
+        raise ValueError(f'{binary_file} was written with another byte order')
+
+    start = _HEADER.size
+    cities = CityTable()
+    if num_cities > 0:
+        names = str(data[start:start + names_size], 'utf-8').split('\n')
+        for name in names:
+            cities.intern(name)
+    start += names_size + -names_size % 8
+    return cities, count, flags, data[start:]
+
+
+def write_parcels_binary(parcel_file: str, binary_file: str) -> None:
+    """Convert the parcel data in <parcel_file> to a binary parcel file
+    written to <binary_file>, which load_parcel_store can map back in.
+
+    The file holds the interned city names, then the parcel ids and volumes
+    as 64-bit integers and the source and destination city ids as 32-bit
+    integers, each as one contiguous column.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data in
+                  the form specified in Assignment 1.
+    """
+    store = ParcelStore()
+    for batch in read_parcel_batches(parcel_file):
+        for parcel in batch:
+            store.add_parcel(parcel)
+    _write_binary(binary_file, _PARCEL_MAGIC, len(store), store.cities.names,
+                  0, [store.p_ids, store.p_vols, array('i', store.sources),
+                      array('i', store.dests)])
+
+
+def load_parcel_store(binary_file: str) -> ParcelStore:
+    """Return a ParcelStore of the parcels in the binary parcel file
+    <binary_file>, written by write_parcels_binary.
+
+    The file is memory-mapped, and the columns of the store are read-only
+    views straight into it, so nothing is parsed or copied but the city names.
+    """
+    cities, n, _, data = _map_binary(binary_file, _PARCEL_MAGIC)
+    store = ParcelStore(cities)
+    store.p_ids = data[:8 * n].cast('q')
+    store.p_vols = data[8 * n:16 * n].cast('q')
+    store.sources = data[16 * n:20 * n].cast('i')
+    store.dests = data[20 * n:24 * n].cast('i')
+    return store
+
+
+def write_trucks_binary(truck_file: str, depot_location: str,
+                        binary_file: str) -> None:
+    """Convert the truck data in <truck_file>, with each truck starting at
+    <depot_location> unless the file names its depot, to a binary truck file
+    written to <binary_file>, which load_trucks can read back.
+
+    The file holds the depot names, then the truck ids and capacities as
+    64-bit integers and the depot ids as 32-bit integers, each as one
+    contiguous column.
+
+    Precondition: <truck_file> is a path to a file containing truck data in the
+                  form specified in Assignment 1.
+    """
+    trucks = read_trucks(truck_file, depot_location).trucks
+    depots = CityTable()
+    depots.intern(depot_location)
+    deps = array('i', [depots.intern(t.dep) for t in trucks])
+    _write_binary(binary_file, _TRUCK_MAGIC, len(trucks), depots.names,
+                  _TRUCK_DEPOTS,
+                  [array('q', [t.t_id for t in trucks]),
+                   array('q', [t.cap for t in trucks]), deps])
+
+
+def load_trucks(binary_file: str) -> List[Truck]:
+    """Return empty trucks for the trucks in the binary truck file
+    <binary_file>, written by write_trucks_binary.
+    """
+    cities, n, flags, data = _map_binary(binary_file, _TRUCK_MAGIC)
+    t_ids = data[:8 * n].cast('q')
+    caps = data[8 * n:16 * n].cast('q')
+    if flags & _TRUCK_DEPOTS:
+        deps = [cities.names[i] for i in data[16 * n:20 * n].cast('i')]
+    else:
+        deps = [cities.names[0]] * n
+    return [Truck(tid, cap, dep) for tid, cap, dep in zip(t_ids, caps, deps)]
+
+
+def write_distance_map_binary(distance_map_file: str, binary_file: str,
+                              complete: bool = False,
+                              keep_paths: bool = False) -> None:
+    """Convert the distance data in <distance_map_file> to a binary map file
+    written to <binary_file>, which load_distance_map can map back in.  If
+    <complete> is True, the map is completed (see DistanceMap.complete)
+    before it is written, so that it never needs to be completed again.  Its
+    shortest paths are then written too if <keep_paths> is True; otherwise it
+    can no longer be loaded with its paths kept.
+
+    The file holds the interned city names, then the flattened distance
+    matrix (see DistanceMatrix.flat) as 64-bit integers, and then, if its
+    shortest paths are written, the flattened paths (see
+    DistanceMatrix.flat_paths) as 64-bit integers.
+
+    Precondition: <distance_map_file> is the path to a file containing distance
+                  data in the form specified in Assignment 1.
+    """
+    m = read_distance_map(distance_map_file, complete, complete and keep_paths)
+    _write_matrix_binary(m.matrix(), binary_file, complete)
+
+
+def _write_matrix_binary(matrix: DistanceMatrix, binary_file: str,
+                         complete: bool) -> None:
+    """Write the distances in <matrix>, and its shortest paths if it has
+    them, to the binary map file <binary_file>, marked as complete if
+    <complete> is True.
+    """
+    flags = _MAP_COMPLETE if complete else 0
+    columns = [matrix.flat()]
+    paths = matrix.flat_paths()
+    if paths is not None:
+        flags |= _MAP_PATHS
+        columns.append(array('q', paths))
+    _write_binary(binary_file, _MAP_MAGIC, len(matrix.cities),
+                  matrix.cities.names, flags, columns)
+
+
+def load_distance_map(binary_file: str, complete: bool = False,
+                      keep_paths: bool = False) -> DistanceMap:
+    """Return a DistanceMap of the distances in the binary map file
+    <binary_file>, written by write_distance_map_binary.
+
+    The file is memory-mapped, and the map reads its distances, and its
+    shortest paths if the file holds them, straight from it.  If <complete>
+    is True and the file does not hold a complete map, or <keep_paths> is
+    True and the file does not hold shortest paths, the map is completed as
+    in read_distance_map, which copies it.
+
+    Raise ValueError if <keep_paths> is True and the file holds a complete
+    map without its shortest paths, whose roads can no longer be told apart
+    from shortest paths.
+    """
+    cities, n, flags, data = _map_binary(binary_file, _MAP_MAGIC)
+    has_paths = flags & _MAP_PATHS
+    if keep_paths and flags & _MAP_COMPLETE and not has_paths:
+        raise ValueError(f'{binary_file} holds a complete map, so it has no '
+                         f'paths to keep')
+    if len(data) < 8 * n * n * (2 if has_paths else 1):
+        raise ValueError(f'{binary_file} is too short for {n} cities')
+    pred = data[8 * n * n:16 * n * n].cast('q') if has_paths else None
+    m = DistanceMap()
+    m.use_matrix(DistanceMatrix(cities, data[:8 * n * n].cast('q'), pred))
+    if (keep_paths and not has_paths) or \
+            (complete and not flags & _MAP_COMPLETE):
+        m.complete(keep_paths)
+    return m
+
+
 def simple_check(config_file: str) -> None:
     """Configure and run a single experiment on the scheduling problem
     defined in <config_file>.
@@ -234,10 +1085,15 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-io': ['read_parcels', 'read_distance_map', 'read_trucks',
-                       '_print_report', 'simple_check'],
+                       '_map_cache_file', 'binary_kind', '_write_binary',
+                       '_map_binary', '_print_report', '_print_histogram',
+                       'simple_check'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'json', 'scheduler', 'domain',
-                                   'distance_map'],
+                                   'json', 'mmap', 'os', 'struct',
+                                   'time', 'array', 'hashlib', 'random',
+                                   'concurrent.futures', 'scheduler',
+                                   'domain', 'distance_map', 'store',
+                                   'routing', 'partition', 'profiling'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
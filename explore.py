@@ -19,23 +19,110 @@ Sophia Huynh, Maryam Majedi, and Jaisie Sin.
 
 This module reads from a json file (whose name is hard-coded in the
 compare_algorithms block) to determine the parcel, truck and map files to use.
-It then constructs all nine possible algorithm configurations, and runs each
-on this same data.  Results are printed to a csv file called 'results.csv'.
+It then constructs all nine possible algorithm configurations, plus two of the
+cheapest insertion algorithm, one of each bin-packing algorithm and one of
+the branch-and-bound algorithm, and runs each on this same data.  The data
+files are read only once, and shared by all of the experiments.  The
+experiments can also be run in parallel over a pool of processes.  Results are
+printed to a csv file called 'results.csv'.
 
 You have no tasks associated with this module.  It is provided to you so that
 you can compare the performance of the algorithms and notice any patterns or
 conclusions you might draw.  You may also find that reviewing the comparison
 reveals bugs in your code.
 """
-from typing import TextIO, Dict, Union
+from typing import TextIO, Dict, Union, List, Optional
 import json
-from experiment import SchedulingExperiment
+from concurrent.futures import ProcessPoolExecutor
+from experiment import SchedulingExperiment, LoadedProblem
+
+# The problem shared by all experiments run in this process.  It is set once
+# per worker process by _init_worker, so that the parsed input is not sent
+# again with every configuration.
+_worker_problem: Optional[LoadedProblem] = None
+
+
+# List of possible configurations for the scheduling algorithm.
+ALGORITHM_CONFIGURATIONS = [
+    # --- Random
+    {'algorithm': 'random',
+     'parcel_priority': 'NA',
+     'parcel_order': 'NA',
+     'truck_order': 'NA'},
+    # --- Greedy by volume, with 4 sub-configurations
+    {'algorithm': 'greedy',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-decreasing',
+     'truck_order': 'non-decreasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-decreasing',
+     'truck_order': 'non-increasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-decreasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-increasing'},
+    # --- Greedy by destination, with 4 sub-configurations
+    {'algorithm': 'greedy',
+     'parcel_priority': 'destination',
+     'parcel_order': 'non-decreasing',
+     'truck_order': 'non-decreasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'destination',
+     'parcel_order': 'non-decreasing',
+     'truck_order': 'non-increasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'destination',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-decreasing'},
+    {'algorithm': 'greedy',
+     'parcel_priority': 'destination',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-increasing'},
+    # --- Cheapest insertion, largest parcels first, with 2 tie-breaks
+    {'algorithm': 'insertion',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-decreasing'},
+    {'algorithm': 'insertion',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-increasing'},
+    # --- Bin packing, largest parcels first
+    {'algorithm': 'first-fit',
+     'parcel_priority': 'NA',
+     'parcel_order': 'NA',
+     'truck_order': 'NA'},
+    {'algorithm': 'best-fit',
+     'parcel_priority': 'NA',
+     'parcel_order': 'NA',
+     'truck_order': 'NA'},
+    {'algorithm': 'worst-fit',
+     'parcel_priority': 'NA',
+     'parcel_order': 'NA',
+     'truck_order': 'NA'},
+    # --- Branch and bound, warm-started from the greedy schedule
+    {'algorithm': 'branch-and-bound',
+     'parcel_priority': 'volume',
+     'parcel_order': 'non-increasing',
+     'truck_order': 'non-increasing'}
+]
+
+# The width of the algorithm column of a results table, wide enough for the
+# name of every algorithm above.
+ALGORITHM_WIDTH = max(len(item['algorithm'])
+                      for item in ALGORITHM_CONFIGURATIONS)
 
 
 def print_table_title(file: TextIO) -> None:
     """Print the title row of a results table in csv format to <file>.
     """
-    file.write('Algorithm,Parcel Priority,Parcel Order  ,Truck Order   ,'
+    file.write(f'{"Algorithm":<{ALGORITHM_WIDTH}},'
+               + 'Parcel Priority,Parcel Order  ,Truck Order   ,'
                + 'Unused Trucks,Unused Space,Avg dist,Avg fullness,'
                + 'Unsched Parcels\n')
 
@@ -48,7 +135,7 @@ def print_table_row(config: Dict[str, Union[str, bool]],
     <stats> is the stats that resulted.
     <file> is the file to write to.
     """
-    file.write(f'{config["algorithm"]:<9},'
+    file.write(f'{config["algorithm"]:<{ALGORITHM_WIDTH}},'
                f'{config["parcel_priority"]:<15},'
                f'{config["parcel_order"]:<14},'
                f'{config["truck_order"]:<14},'
@@ -59,11 +146,38 @@ def print_table_row(config: Dict[str, Union[str, bool]],
                f'{stats["unscheduled"]}\n')
 
 
-def compare_algorithms(config_file: str) -> None:
+def _init_worker(problem: LoadedProblem) -> None:
+    """Record the problem shared by all experiments run in this worker
+    process.
+    """
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _run_configuration(config: Dict[str, Union[str, bool]]) \
+        -> Dict[str, Union[int, float]]:
+    """Run an experiment with <config> on the problem recorded by _init_worker
+    and return its statistics.
+    """
+    return SchedulingExperiment(config, _worker_problem).run(report=False)
+
+
+def compare_algorithms(config_file: str, processes: Optional[int] = 1,
+                       extra_configurations: Optional[
+                           List[Dict[str, str]]] = None) -> None:
     """Compare all algorithms on a single problem.
 
-    Run the random algorithm and every configuration of the greedy
-    algorithm on the scheduling problem defined in <config_file>.
+    Run the random algorithm, every configuration of the greedy algorithm,
+    the cheapest insertion algorithm, the bin-packing algorithms and the
+    branch-and-bound algorithm on the scheduling problem defined in
+    <config_file>, followed by any <extra_configurations>.  Each of those has
+    the same keys as the configurations in ALGORITHM_CONFIGURATIONS, plus any
+    optional keys accepted by SchedulingExperiment.
+
+    If <processes> is 1, run the experiments one after another in this
+    process.  Otherwise run them over a pool of <processes> worker processes,
+    or one per CPU if it is None.  The parsed problem is sent once to each
+    worker, and rows are always written in the order of the configurations.
 
     Precondition: <config_file> a path to a json file with keys and values
     as in the dictionary format defined in Assignment 1.
@@ -76,61 +190,40 @@ def compare_algorithms(config_file: str) -> None:
     # If it has any other keys, we will ignore them.  Instead of taking the
     # algorithm configuration from a file, we try all possible configurations.
 
-    # List of possible configurations for the scheduling algorithm.
-    algorithm_configurations = [
-        # --- Random
-        {'algorithm': 'random',
-         'parcel_priority': 'NA',
-         'parcel_order': 'NA',
-         'truck_order': 'NA'},
-        # --- Greedy by volume, with 4 sub-configurations
-        {'algorithm': 'greedy',
-         'parcel_priority': 'volume',
-         'parcel_order': 'non-decreasing',
-         'truck_order': 'non-decreasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'volume',
-         'parcel_order': 'non-decreasing',
-         'truck_order': 'non-increasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'volume',
-         'parcel_order': 'non-increasing',
-         'truck_order': 'non-decreasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'volume',
-         'parcel_order': 'non-increasing',
-         'truck_order': 'non-increasing'},
-        # --- Greedy by destination, with 4 sub-configurations
-        {'algorithm': 'greedy',
-         'parcel_priority': 'destination',
-         'parcel_order': 'non-decreasing',
-         'truck_order': 'non-decreasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'destination',
-         'parcel_order': 'non-decreasing',
-         'truck_order': 'non-increasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'destination',
-         'parcel_order': 'non-increasing',
-         'truck_order': 'non-decreasing'},
-        {'algorithm': 'greedy',
-         'parcel_priority': 'destination',
-         'parcel_order': 'non-increasing',
-         'truck_order': 'non-increasing'}
-    ]
+    algorithm_configurations = list(ALGORITHM_CONFIGURATIONS)
+    if extra_configurations is not None:
+        algorithm_configurations.extend(extra_configurations)
+
+    # Start with the basic configuration <config>, and add the algorithm
+    # details from each item in our list of configurations.
+    configs = []
+    for item in algorithm_configurations:
+        config = basic_config.copy()
+        config.update(item)
+        configs.append(config)
+
+    # Read the parcels, trucks and map once.  Each experiment gets its own
+    # empty fleet from <problem>.
+    problem = LoadedProblem(basic_config)
 
     with open('data/results.csv', 'w') as file:
         print_table_title(file)
-        for item in algorithm_configurations:
-            # Start with the basic configuration <config>, and add the
-            # algorithm details from this item in our list of configurations.
-            config = basic_config.copy()
-            config.update(item)
-            # Run an experiment on this configuration and print the results
-            # to our csv file.
-            expt = SchedulingExperiment(config)
-            results = expt.run(report=False)
-            print_table_row(config, results, file)
+        if processes == 1:
+            for config in configs:
+                # Run an experiment on this configuration and print the
+                # results to our csv file.
+                expt = SchedulingExperiment(config, problem)
+                results = expt.run(report=False)
+                print_table_row(config, results, file)
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                     initargs=(problem,)) as pool:
+                # map yields results in the order of <configs>, so rows are
+                # written in the same order as when run one after another.
+                for config, results in zip(configs,
+                                           pool.map(_run_configuration,
+                                                    configs)):
+                    print_table_row(config, results, file)
 
 
 if __name__ == '__main__':
@@ -138,7 +231,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': ['compare_algorithms'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'json', 'experiment'],
+                                   'json', 'concurrent.futures',
+                                   'experiment'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
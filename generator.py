@@ -21,20 +21,43 @@ This module generates random parcel and truck data and writes each to a file.
 Values defined in the module control the amount of data, the range of possible
 values, etc.
 
+generate writes a small demo problem.  generate_map, generate_parcels and
+generate_trucks write problems of any size, with a random road network between
+cities, a choice of volume distributions and a mix of truck sizes.  Lines are
+generated and written in chunks, so each parcel takes O(1) time and memory
+does not grow with the number of parcels.
+
 You have no tasks associated with this module.  It is provided to you to assist
 in testing.  However, your best test cases will likely be very small ones that
 you hand-craft to force important conditions to arise.
 """
 
-from random import randint, choice
+from typing import List, Optional, Sequence, Tuple
+from random import Random
+import math
+
+# The number of lines generated before they are written out together.
+_CHUNK = 1 << 16
+
+# A distribution of volumes: its kind ('uniform', 'exponential' or 'normal'),
+# and the smallest and largest volume it gives.
+VolumeDistribution = Tuple[str, int, int]
+
+# A mix of trucks: the capacity of each kind of truck, and its weight in the
+# fleet.
+FleetMix = Sequence[Tuple[int, float]]
 
 
 def generate(parcel_filename: str = 'data/demo-parcel-data.txt',
-             truck_filename: str = 'data/demo-truck-data.txt') -> None:
+             truck_filename: str = 'data/demo-truck-data.txt',
+             seed: Optional[int] = None) -> None:
     """Generate random truck and parcel data, and save to the files
     <parcel_filename> and <truck_filename> respectively. File format is as
-    defined in Assignment 1.
+    defined in Assignment 1.  If <seed> is given, the same data is generated
+    every time.
     """
+    rng = Random(seed)
+
     # Set constants controlling parcel data
     num_ids_to_pick_from = 20
     num_ids = 15
@@ -44,21 +67,16 @@ def generate(parcel_filename: str = 'data/demo-parcel-data.txt',
 
     depot = 'Toronto'
 
-    # Generate some random parcels
-    ids = list(range(num_ids_to_pick_from))
+    # Generate some random parcels, with ids picked without repeats.
     with open(parcel_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            source = choice(cities)
+        for id_ in rng.sample(range(num_ids_to_pick_from), num_ids):
+            source = rng.choice(cities)
             temp = cities.copy()
             temp.remove(source)
             if source != depot:
                 temp.remove(depot)
-            destination = choice(temp)
-            volume = randint(min_volume, max_volume)
+            destination = rng.choice(temp)
+            volume = rng.randint(min_volume, max_volume)
             file.write(f'{id_}, {source}, {destination}, {volume}\n')
 
     # Set constants controlling truck data
@@ -67,19 +85,169 @@ def generate(parcel_filename: str = 'data/demo-parcel-data.txt',
     min_volume = 20
     max_volume = 50
 
-    # Generate some random trucks
-    ids = list(range(num_ids_to_pick_from))
+    # Generate some random trucks, with ids picked without repeats.
     with open(truck_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            volume = randint(min_volume, max_volume)
+        for id_ in rng.sample(range(num_ids_to_pick_from), num_ids):
+            volume = rng.randint(min_volume, max_volume)
             file.write(f'{id_}, {volume}\n')
 
 
+def generate_map(map_filename: str, num_cities: int, degree: int = 4,
+                 seed: Optional[int] = None, size: int = 1000) -> List[str]:
+    """Generate a random road network between <num_cities> cities, save it to
+    the file <map_filename> in the map format defined in Assignment 1, and
+    return the names of the cities.
+
+    Cities are random points in a <size> by <size> square.  Each city has a
+    road to each of its <degree> nearest cities, plus the roads of a minimum
+    spanning tree, so that every city can reach every other.  The length of a
+    road is the straight-line distance between its cities, rounded, and at
+    least 1.  This takes O(n^2 log n) time for n cities.
+
+    Precondition: num_cities > 0 and degree >= 0
+
+    >>> import os, tempfile
+    >>> map_file = os.path.join(tempfile.mkdtemp(), 'map.txt')
+    >>> generate_map(map_file, 3, 1, seed=1)
+    ['City0', 'City1', 'City2']
+    >>> with open(map_file) as file:
+    ...     len(file.readlines())
+    2
+    """
+    rng = Random(seed)
+    cities = [f'City{i}' for i in range(num_cities)]
+    points = [(rng.random() * size, rng.random() * size)
+              for _ in range(num_cities)]
+
+    def length(a: int, b: int) -> int:
+        return max(1, round(math.dist(points[a], points[b])))
+
+    roads = set()
+    for a in range(num_cities):
+        nearest = sorted(range(num_cities), key=lambda b: length(a, b))
+        for b in [b for b in nearest if b != a][:degree]:
+            roads.add((min(a, b), max(a, b)))
+
+    # Prim's algorithm joins the cities with a minimum spanning tree.
+    joined = [False] * num_cities
+    closest = [(math.inf, -1)] * num_cities
+    a = 0
+    for _ in range(num_cities - 1):
+        joined[a] = True
+        for b in range(num_cities):
+            if not joined[b] and length(a, b) < closest[b][0]:
+                closest[b] = (length(a, b), a)
+        a = min((b for b in range(num_cities) if not joined[b]),
+                key=lambda b: closest[b][0])
+        roads.add((min(a, closest[a][1]), max(a, closest[a][1])))
+
+    with open(map_filename, 'w') as file:
+        file.write(''.join(f'{cities[a]}, {cities[b]}, {length(a, b)}\n'
+                           for a, b in sorted(roads)))
+    return cities
+
+
+def generate_parcels(parcel_filename: str, num_parcels: int,
+                     cities: List[str], depot: str,
+                     volumes: VolumeDistribution = ('uniform', 5, 25),
+                     seed: Optional[int] = None) -> None:
+    """Generate <num_parcels> random parcels between <cities>, and save them
+    to the file <parcel_filename> in the parcel format defined in Assignment 1.
+
+    Parcels have the ids 0 to num_parcels - 1, in order, and volumes drawn
+    from <volumes> (see volume_sample).  Sources are any of <cities>, and
+    destinations are any of them but <depot>.
+
+    Precondition: <cities> has at least one city other than <depot>.
+
+    >>> import os, tempfile
+    >>> parcel_file = os.path.join(tempfile.mkdtemp(), 'parcels.txt')
+    >>> generate_parcels(parcel_file, 2, ['York', 'Toronto'], 'York', seed=1)
+    >>> with open(parcel_file) as file:
+    ...     [line.split(', ')[2] for line in file]
+    ['Toronto', 'Toronto']
+    """
+    rng = Random(seed)
+    destinations = [city for city in cities if city != depot]
+    with open(parcel_filename, 'w') as file:
+        for start in range(0, num_parcels, _CHUNK):
+            k = min(_CHUNK, num_parcels - start)
+            sources = rng.choices(cities, k=k)
+            dests = rng.choices(destinations, k=k)
+            vols = volume_sample(rng, volumes, k)
+            file.write(''.join(
+                f'{start + i}, {sources[i]}, {dests[i]}, {vols[i]}\n'
+                for i in range(k)))
+
+
+def generate_trucks(truck_filename: str, num_trucks: int,
+                    fleet_mix: FleetMix = ((50, 1.0),),
+                    depots: Optional[List[str]] = None,
+                    seed: Optional[int] = None) -> None:
+    """Generate <num_trucks> random trucks, and save them to the file
+    <truck_filename> in the truck format defined in Assignment 1.
+
+    Trucks have the ids 0 to num_trucks - 1, in order, and each has one of
+    the capacities in <fleet_mix>, chosen with the weights given there.  If
+    <depots> has more than one depot, each truck also starts at one of them,
+    chosen at random, in a third column.
+
+    >>> import os, tempfile
+    >>> truck_file = os.path.join(tempfile.mkdtemp(), 'trucks.txt')
+    >>> generate_trucks(truck_file, 3, [(100, 1.0)])
+    >>> with open(truck_file) as file:
+    ...     file.read()
+    '0, 100\\n1, 100\\n2, 100\\n'
+    """
+    rng = Random(seed)
+    caps = [cap for cap, _ in fleet_mix]
+    weights = [weight for _, weight in fleet_mix]
+    with open(truck_filename, 'w') as file:
+        for start in range(0, num_trucks, _CHUNK):
+            k = min(_CHUNK, num_trucks - start)
+            chosen = rng.choices(caps, weights, k=k)
+            if depots is None or len(depots) <= 1:
+                lines = [f'{start + i}, {chosen[i]}\n' for i in range(k)]
+            else:
+                starts = rng.choices(depots, k=k)
+                lines = [f'{start + i}, {chosen[i]}, {starts[i]}\n'
+                         for i in range(k)]
+            file.write(''.join(lines))
+
+
+def volume_sample(rng: Random, volumes: VolumeDistribution,
+                  k: int) -> List[int]:
+    """Return <k> volumes drawn with <rng> from the distribution <volumes>:
+    'uniform' over its range, 'exponential' with a mean a quarter of the way
+    into its range, or 'normal' around the middle of its range with a standard
+    deviation of a sixth of it.  Volumes outside the range are clamped to it.
+
+    Raise a ValueError if the kind of distribution is not one of these.
+
+    >>> vols = volume_sample(Random(1), ('exponential', 5, 25), 1000)
+    >>> min(vols) >= 5 and max(vols) <= 25
+    True
+    """
+    kind, low, high = volumes
+    span = high - low
+    random = rng.random
+    if kind == 'uniform':
+        return [low + int(random() * (span + 1)) for _ in range(k)]
+    if kind == 'exponential':
+        rate = 4 / span if span > 0 else 1.0
+        draws = [rng.expovariate(rate) for _ in range(k)]
+    elif kind == 'normal':
+        sigma = span / 6
+        draws = [rng.gauss(span / 2, sigma) for _ in range(k)]
+    else:
+        raise ValueError(f'unknown volume distribution: {kind}')
+    return [low + min(span, max(0, round(d))) for d in draws]
+
+
 if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
     import python_ta
     python_ta.check_all(config='.pylintrc')
     generate()
@@ -0,0 +1,324 @@
+"""Assignment 1 - Partitioned scheduling
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module splits a scheduling problem into geographic partitions that are
+scheduled independently, so that the work can be spread over a pool of
+processes and each truck only serves nearby destinations.
+
+cluster_destinations groups the destinations of the parcels into clusters of
+nearby cities by k-medoids over the distances in a DistanceMap, weighting each
+city by the volume bound for it.  allocate_trucks then gives each cluster a
+share of the trucks in proportion to its volume.  PartitionedScheduler
+schedules the parcels of each cluster onto its trucks with the greedy
+algorithm, and finally schedules the parcels that did not fit in their own
+partition onto whatever space is left in the whole fleet.
+"""
+from typing import List, Dict, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from domain import Parcel, Truck
+from distance_map import DistanceMap
+from scheduler import Scheduler, GreedyScheduler
+from profiling import ScheduleCounters
+
+# The most rounds of k-medoids refinement done by cluster_destinations.
+MEDOID_ROUNDS = 20
+
+# The distance used between cities whose distance is not known.  It is longer
+# than any known distance, so a city only joins a cluster it has no known
+# distance to if there is no other choice.
+_UNKNOWN = 1 << 62
+
+# The parcels of a partition, as their volume, source and destination, and its
+# trucks, as their available space, depot and route.
+PartitionTask = Tuple[List[Tuple[int, str, str]],
+                      List[Tuple[int, str, List[str]]]]
+
+# What all partitions are scheduled with, as the arguments of GreedyScheduler:
+# the greedy configuration, the distances and the depots of the whole fleet.
+PartitionShared = Tuple[Dict[str, Union[str, bool]], DistanceMap, List[str]]
+
+# The greedy setup shared by all partitions scheduled in this process.  It is
+# set once per worker process by _init_partition_worker.
+_partition_shared: Optional[PartitionShared] = None
+
+
+def cluster_destinations(volumes: Dict[str, int], dmap: DistanceMap,
+                         k: int) -> List[List[str]]:
+    """Return the cities in <volumes>, which maps each city to the volume of
+    parcels bound for it, grouped into at most <k> clusters of nearby cities
+    according to <dmap>.
+
+    Clusters are found by k-medoids: the first medoid is the city with the
+    most volume, and each next one is the city whose volume times its distance
+    to the nearest medoid is largest.  Then, for at most MEDOID_ROUNDS rounds,
+    every city joins the cluster of its nearest medoid, and each cluster's
+    medoid moves to the member with the least volume-weighted distance to the
+    rest of the cluster.  Ties go to the city that comes first in <volumes>.
+    Cities in each cluster are in the order of <volumes>, and each cluster
+    holds at least one city.
+
+    Precondition: k > 0
+
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Toronto', 'Ottawa', 40)
+    >>> m.add_distance('Hamilton', 'Ottawa', 49)
+    >>> m.add_distance('Ottawa', 'Kingston', 20)
+    >>> m.add_distance('Toronto', 'Kingston', 26)
+    >>> m.add_distance('Hamilton', 'Kingston', 35)
+    >>> volumes = {'Toronto': 5, 'Ottawa': 10, 'Hamilton': 3, 'Kingston': 4}
+    >>> cluster_destinations(volumes, m, 2)
+    [['Ottawa', 'Kingston'], ['Toronto', 'Hamilton']]
+    >>> cluster_destinations(volumes, m, 1)
+    [['Toronto', 'Ottawa', 'Hamilton', 'Kingston']]
+    """
+    cities = list(volumes)
+    if not cities:
+        return []
+    matrix = dmap.matrix()
+    ids = [matrix.cities.lookup(city) for city in cities]
+    weights = [volumes[city] for city in cities]
+    n = len(cities)
+
+    def dist(a: int, b: int) -> int:
+        # a and b are positions in <cities>.
+        if a == b:
+            return 0
+        if ids[a] < 0 or ids[b] < 0:
+            return _UNKNOWN
+        d = matrix.distance_by_id(ids[a], ids[b])
+        return d if d >= 0 else _UNKNOWN
+
+    medoids = [max(range(n), key=lambda c: (weights[c], -c))]
+    nearest = [dist(medoids[0], c) for c in range(n)]
+    while len(medoids) < k:
+        far = max(range(n), key=lambda c: (weights[c] * nearest[c], -c))
+        if nearest[far] == 0:
+            break
+        medoids.append(far)
+        nearest = [min(nearest[c], dist(far, c)) for c in range(n)]
+
+    members = []
+    for _ in range(MEDOID_ROUNDS):
+        members = [[] for _ in medoids]
+        for c in range(n):
+            j = min(range(len(medoids)),
+                    key=lambda j: (dist(medoids[j], c), j))
+            members[j].append(c)
+        moved = [min(group, key=lambda m: (sum(weights[c] * dist(m, c)
+                                                for c in group), m))
+                 for group in members]
+        if moved == medoids:
+            break
+        medoids = moved
+
+    return [[cities[c] for c in group] for group in members]
+
+
+def allocate_trucks(avail: List[int], volumes: List[int]) -> List[List[int]]:
+    """Return, for each cluster whose parcels have total volume volumes[c],
+    the positions in <avail> of the trucks allocated to it, in increasing
+    order.  <avail> holds the available space of each truck.
+
+    Trucks are allocated most space first, each to the cluster whose share of
+    the space allocated so far falls furthest below its share of the volume,
+    with ties going to the cluster that comes first.
+
+    Precondition: volumes[c] > 0 for every cluster c.
+
+    >>> allocate_trucks([10, 10, 20, 10], [30, 10])
+    [[0, 2, 3], [1]]
+    >>> allocate_trucks([10, 10, 10], [70, 10])
+    [[0, 1, 2], []]
+    """
+    total_avail = sum(avail)
+    total_volume = sum(volumes)
+    allocated = [0] * len(volumes)
+    trucks = [[] for _ in volumes]
+    for i in sorted(range(len(avail)), key=lambda i: -avail[i]):
+        # Compare shares without division: cluster c is short by
+        # volumes[c] / total_volume - allocated[c] / total_avail.
+        c = max(range(len(volumes)),
+                key=lambda c: (volumes[c] * total_avail
+                               - allocated[c] * total_volume, -c))
+        allocated[c] += avail[i]
+        trucks[c].append(i)
+    return [sorted(positions) for positions in trucks]
+
+
+class PartitionedScheduler(Scheduler):
+    """Schedule parcels by splitting the problem into partitions of nearby
+    destinations, each with its own share of the trucks, and scheduling the
+    partitions independently with the greedy algorithm.
+
+    Parcels that do not fit on the trucks of their own partition are then
+    scheduled greedily onto the whole fleet, so a parcel is only left
+    unscheduled if no truck has room for it at the end.  If the greedy
+    configuration has 'profile' set to True, <counters> sums the work done in
+    every partition and in that last pass.
+
+    === Private Attributes ===
+    _config:
+        The configuration of the greedy algorithm used in every partition.
+    _dmap:
+        The distances that destinations are clustered by.
+    _partitions:
+        The most partitions to split a problem into.
+    _processes:
+        The number of processes that partitions are scheduled over, or None
+        for one per CPU.
+
+    === Sample Usage ===
+    >>> m = DistanceMap()
+    >>> m.add_distance('York', 'Toronto', 5)
+    >>> m.add_distance('York', 'Ottawa', 40)
+    >>> m.add_distance('Toronto', 'Ottawa', 38)
+    >>> config = {'parcel_priority': 'volume',
+    ...           'parcel_order': 'non-increasing',
+    ...           'truck_order': 'non-increasing'}
+    >>> trucks = [Truck(1, 10, 'York'), Truck(2, 10, 'York')]
+    >>> parcels = [Parcel(1, 4, 'York', 'Toronto'),
+    ...            Parcel(2, 5, 'York', 'Ottawa'),
+    ...            Parcel(3, 6, 'York', 'Toronto'),
+    ...            Parcel(4, 3, 'York', 'Ottawa')]
+    >>> PartitionedScheduler(config, m, 2).schedule(parcels, trucks)
+    []
+    >>> [t.route for t in trucks]
+    [['York', 'Toronto'], ['York', 'Ottawa']]
+    """
+    _config: Dict[str, Union[str, bool]]
+    _dmap: DistanceMap
+    _partitions: int
+    _processes: Optional[int]
+
+    def __init__(self, config: Dict[str, Union[str, bool]], dmap: DistanceMap,
+                 partitions: int, processes: Optional[int] = 1) -> None:
+        """Initialize a scheduler that splits problems into at most
+        <partitions> partitions by the distances in <dmap>, and schedules
+        them over a pool of <processes> processes with the greedy algorithm
+        configured by <config>, as in GreedyScheduler.
+
+        If <processes> is None, use one process per CPU.  If it is 1, schedule
+        every partition in this process.
+
+        Precondition: partitions > 0
+        """
+        self._config = config
+        self._dmap = dmap
+        self._partitions = partitions
+        self._processes = processes
+        if config.get('profile', False):
+            self.counters = ScheduleCounters()
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> partition by partition, and return
+        a list of the parcels that did not get scheduled onto any truck.
+
+        Every partition is scheduled onto copies of its trucks, and the
+        parcels are then packed onto <trucks> in the same order, so the
+        result is the same however many processes are used.
+        """
+        parcels = list(parcels)
+        volumes = {}
+        for p in parcels:
+            volumes[p.dest] = volumes.get(p.dest, 0) + p.p_vol
+        clusters = cluster_destinations(volumes, self._dmap,
+                                        min(self._partitions,
+                                            max(len(trucks), 1)))
+        cluster_of = {city: c for c, cities in enumerate(clusters)
+                      for city in cities}
+        groups = [[] for _ in clusters]
+        for p in parcels:
+            groups[cluster_of[p.dest]].append(p)
+        allocated = allocate_trucks(
+            [truck.avail for truck in trucks],
+            [sum(volumes[city] for city in cities) for cities in clusters])
+
+        tasks = []
+        for group, positions in zip(groups, allocated):
+            tasks.append(([(p.p_vol, p.source, p.dest) for p in group],
+                          [(trucks[i].avail, trucks[i].dep,
+                            list(trucks[i].route)) for i in positions]))
+        # Nearby depots are chosen among the depots of the whole fleet, so a
+        # parcel whose nearest depot is in another partition is left over.
+        shared = (self._config, self._dmap,
+                  list(dict.fromkeys(truck.dep for truck in trucks)))
+        if self._processes == 1:
+            loads = [_schedule_partition(shared, task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(self._processes,
+                                     initializer=_init_partition_worker,
+                                     initargs=(shared,)) as pool:
+                loads = list(pool.map(_schedule_in_worker, tasks))
+
+        scheduled = set()
+        for group, positions, (load, counts) in zip(groups, allocated, loads):
+            if self.counters is not None:
+                self.counters.add(counts)
+            for i, packed in zip(positions, load):
+                for k in packed:
+                    trucks[i].pack(group[k])
+                    scheduled.add(id(group[k]))
+
+        leftovers = [p for p in parcels if id(p) not in scheduled]
+        scheduler = GreedyScheduler(self._config, self._dmap)
+        unsked = scheduler.schedule(leftovers, trucks)
+        if self.counters is not None:
+            self.counters.add(scheduler.counters.as_dict())
+        return unsked
+
+
+def _schedule_partition(shared: PartitionShared, task: PartitionTask) \
+        -> Tuple[List[List[int]], Dict[str, int]]:
+    """Schedule the parcels of the partition <task> onto copies of its trucks
+    with the greedy algorithm set up by <shared>.  Return, for each truck,
+    the positions of the parcels packed onto it in the order they were
+    packed, and the counts of the work done (see ScheduleCounters.as_dict),
+    which are empty if the work is not counted.
+    """
+    parcels = [Parcel(k, vol, source, dest)
+               for k, (vol, source, dest) in enumerate(task[0])]
+    trucks = []
+    for i, (avail, dep, route) in enumerate(task[1]):
+        truck = Truck(i, avail, dep)
+        truck.set_route(route)
+        trucks.append(truck)
+    scheduler = GreedyScheduler(*shared)
+    scheduler.schedule(parcels, trucks)
+    counts = {}
+    if scheduler.counters is not None:
+        counts = scheduler.counters.as_dict()
+    return [truck.parcel_ids() for truck in trucks], counts
+
+
+def _init_partition_worker(shared: PartitionShared) -> None:
+    """Record the greedy configuration, distances and depots shared by all
+    partitions scheduled in this worker process.
+    """
+    global _partition_shared
+    _partition_shared = shared
+
+
+def _schedule_in_worker(task: PartitionTask) \
+        -> Tuple[List[List[int]], Dict[str, int]]:
+    """Schedule the partition <task> as set up by _init_partition_worker,
+    as _schedule_partition does.
+    """
+    return _schedule_partition(_partition_shared, task)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'concurrent.futures', 'domain',
+                                   'distance_map', 'scheduler', 'profiling'],
+        'disable': ['E1136'],
+    })
@@ -0,0 +1,317 @@
+"""Profiling hooks and counters
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module contains the instrumentation used to find where a scheduling
+experiment spends its time.
+
+A PhaseHook is told as each phase of an experiment starts and ends: reading
+each input file, scheduling, improving routes and computing statistics.
+ChromeTrace is a PhaseHook that records the phases as events in the Chrome
+trace format, which can be opened in chrome://tracing or Perfetto.
+
+ScheduleCounters counts the work GreedyScheduler does to order and place
+parcels: the trucks it checks, the searches of its truck index, the candidate
+trucks it chooses among, and the comparisons made by sorting, by priority
+queues and between candidates.  Counting is opt-in, and a scheduler without
+counters does no counting at all.
+"""
+from typing import Any, Callable, Dict, List, Union
+import json
+import os
+import time
+
+
+class PhaseHook:
+    """Something to be told as each phase of an experiment starts and ends.
+
+    Phases are named as in SchedulingExperiment.phase_times and
+    LoadedProblem.read_times.  This class does nothing when told; subclasses
+    override the methods for the events they want.
+    """
+
+    def phase_started(self, phase: str) -> None:
+        """Record that the phase named <phase> has started.
+        """
+
+    def phase_ended(self, phase: str, seconds: float) -> None:
+        """Record that the phase named <phase> has ended after <seconds>
+        seconds.
+        """
+
+
+class ChromeTrace(PhaseHook):
+    """A PhaseHook that records each phase as a complete event in the Chrome
+    trace format, and can also record counters.
+
+    === Public Attributes ===
+    events:
+        The recorded trace events, in the order they ended.
+
+    === Private Attributes ===
+    _started:
+        Maps each phase that has started but not ended to the time it started,
+        in microseconds.
+
+    === Sample Usage ===
+    >>> trace = ChromeTrace()
+    >>> trace.phase_started('schedule')
+    >>> trace.phase_ended('schedule', 0.25)
+    >>> trace.add_counters('scheduler', {'trucks_scanned': 12})
+    >>> [(e['name'], e['ph']) for e in trace.events]
+    [('schedule', 'X'), ('scheduler', 'C')]
+    >>> trace.events[0]['dur']
+    250000.0
+    """
+    events: List[Dict[str, Any]]
+    _started: Dict[str, float]
+
+    def __init__(self) -> None:
+        """Initialize a trace with no events.
+        """
+        self.events = []
+        self._started = {}
+
+    def phase_started(self, phase: str) -> None:
+        """Record that the phase named <phase> has started.
+        """
+        self._started[phase] = _now()
+
+    def phase_ended(self, phase: str, seconds: float) -> None:
+        """Record the phase named <phase>, which took <seconds> seconds, as a
+        complete event.  If its start was not recorded, it is taken to have
+        started <seconds> seconds ago.
+        """
+        duration = seconds * 1e6
+        start = self._started.pop(phase, _now() - duration)
+        self.events.append({'name': phase, 'cat': 'phase', 'ph': 'X',
+                            'ts': start, 'dur': duration,
+                            'pid': os.getpid(), 'tid': 0})
+
+    def add_counters(self, name: str,
+                     counters: Dict[str, Union[int, float]]) -> None:
+        """Record the current values of <counters> as a counter event named
+        <name>.
+        """
+        self.events.append({'name': name, 'cat': 'counters', 'ph': 'C',
+                            'ts': _now(), 'args': dict(counters),
+                            'pid': os.getpid(), 'tid': 0})
+
+    def write(self, filename: str) -> None:
+        """Write the recorded events to the file <filename> as a JSON trace.
+        """
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, file)
+
+
+class ScheduleCounters:
+    """Counts of the work GreedyScheduler does to order and place parcels.
+
+    Each parcel is counted between parcel_started and parcel_finished, so
+    that the most work done for one parcel is known as well as the total.
+
+    === Public Attributes ===
+    parcels_considered:
+        The number of parcels a truck was looked for.
+    trucks_scanned:
+        The number of trucks checked for those parcels: every truck when the
+        fleet is scanned, or the truck at the position found by each search of
+        an index.
+    max_trucks_scanned:
+        The most trucks checked for one parcel.
+    index_lookups:
+        The number of sorted lists of trucks searched by an index.
+    index_comparisons:
+        The number of key comparisons made by those searches, counted as the
+        most a binary search of each list can make.
+    candidates_queued:
+        The number of trucks with room for a parcel that it was chosen among:
+        those put in a priority queue when the fleet is scanned, or those
+        found by the searches of an index.
+    max_candidates_queued:
+        The most candidate trucks for one parcel.
+    queue_comparisons:
+        The number of comparisons made to choose among candidate trucks and by
+        priority queues of parcels.
+    sort_comparisons:
+        The number of comparisons made by sorting parcels.
+
+    === Private Attributes ===
+    _scanned:
+        The trucks checked so far for the parcel being placed.
+    _queued:
+        The candidate trucks found so far for the parcel being placed.
+
+    === Sample Usage ===
+    >>> counters = ScheduleCounters()
+    >>> counters.parcel_started()
+    >>> counters.scanned(10)
+    >>> counters.queued(3)
+    >>> less = counters.counting(lambda a, b: a < b)
+    >>> less(1, 2), less(3, 2)
+    (True, False)
+    >>> counters.parcel_finished()
+    >>> sorted([3, 1, 2], key=counters.counting_key(abs))
+    [1, 2, 3]
+    >>> d = counters.as_dict()
+    >>> d['trucks_scanned'], d['candidates_queued'], d['queue_comparisons']
+    (10, 3, 2)
+    >>> d['sort_comparisons'] > 0
+    True
+    """
+    parcels_considered: int
+    trucks_scanned: int
+    max_trucks_scanned: int
+    index_lookups: int
+    index_comparisons: int
+    candidates_queued: int
+    max_candidates_queued: int
+    queue_comparisons: int
+    sort_comparisons: int
+    _scanned: int
+    _queued: int
+
+    def __init__(self) -> None:
+        """Initialize counters that are all zero.
+        """
+        self.parcels_considered = 0
+        self.trucks_scanned = 0
+        self.max_trucks_scanned = 0
+        self.index_lookups = 0
+        self.index_comparisons = 0
+        self.candidates_queued = 0
+        self.max_candidates_queued = 0
+        self.queue_comparisons = 0
+        self.sort_comparisons = 0
+        self._scanned = 0
+        self._queued = 0
+
+    def parcel_started(self) -> None:
+        """Start counting the work done to place one more parcel.
+        """
+        self.parcels_considered += 1
+        self._scanned = 0
+        self._queued = 0
+
+    def parcel_finished(self) -> None:
+        """Add the work done to place the current parcel to the totals.
+        """
+        self.trucks_scanned += self._scanned
+        self.max_trucks_scanned = max(self.max_trucks_scanned, self._scanned)
+        self.candidates_queued += self._queued
+        self.max_candidates_queued = max(self.max_candidates_queued,
+                                         self._queued)
+
+    def scanned(self, trucks: int) -> None:
+        """Count that <trucks> trucks were checked for the current parcel.
+        """
+        self._scanned += trucks
+
+    def queued(self, candidates: int) -> None:
+        """Count that <candidates> candidate trucks were found for the current
+        parcel.
+        """
+        self._queued += candidates
+
+    def searched(self, comparisons: int, scanned: bool, fits: bool) -> None:
+        """Count a search of a sorted list of trucks for the current parcel,
+        which made at most <comparisons> key comparisons, checked a truck if
+        <scanned> is True, and found a candidate if <fits> is True.
+        """
+        self.index_lookups += 1
+        self.index_comparisons += comparisons
+        if scanned:
+            self._scanned += 1
+        if fits:
+            self._queued += 1
+
+    def counting(self, order: Callable[[Any, Any], bool]) \
+            -> Callable[[Any, Any], bool]:
+        """Return a function that compares like <order>, and counts each
+        comparison it makes in <queue_comparisons>.
+        """
+        def counted(a: Any, b: Any) -> bool:
+            self.queue_comparisons += 1
+            return order(a, b)
+        return counted
+
+    def counting_key(self, key: Callable[[Any], Any]) \
+            -> Callable[[Any], '_CountedKey']:
+        """Return a sort key function that sorts like <key>, and counts each
+        comparison made by the sort in <sort_comparisons>.
+        """
+        def counted(item: Any) -> _CountedKey:
+            return _CountedKey(key(item), self)
+        return counted
+
+    def add(self, counts: Dict[str, int]) -> None:
+        """Add <counts>, as returned by as_dict for other counters, to these
+        counters.  The most work for one parcel is the larger of the two.
+        """
+        for name, value in counts.items():
+            if name.startswith('max_'):
+                setattr(self, name, max(getattr(self, name), value))
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return a dictionary mapping the name of each counter to its value.
+        """
+        return {'parcels_considered': self.parcels_considered,
+                'trucks_scanned': self.trucks_scanned,
+                'max_trucks_scanned': self.max_trucks_scanned,
+                'index_lookups': self.index_lookups,
+                'index_comparisons': self.index_comparisons,
+                'candidates_queued': self.candidates_queued,
+                'max_candidates_queued': self.max_candidates_queued,
+                'queue_comparisons': self.queue_comparisons,
+                'sort_comparisons': self.sort_comparisons}
+
+
+class _CountedKey:
+    """A sort key that counts the comparisons made with it.
+
+    === Public Attributes ===
+    key:
+        The underlying sort key.
+    counters:
+        The counters whose <sort_comparisons> each comparison is counted in.
+    """
+    key: Any
+    counters: ScheduleCounters
+
+    def __init__(self, key: Any, counters: ScheduleCounters) -> None:
+        """Initialize a counted sort key for <key>.
+        """
+        self.key = key
+        self.counters = counters
+
+    def __lt__(self, other: '_CountedKey') -> bool:
+        """Return whether this key sorts before <other>, and count the
+        comparison.
+        """
+        self.counters.sort_comparisons += 1
+        return self.key < other.key
+
+
+def _now() -> float:
+    """Return the current time in microseconds, as used in trace events.
+    """
+    return time.perf_counter() * 1e6
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['ChromeTrace.write'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'json',
+                                   'os', 'time'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
@@ -0,0 +1,337 @@
+"""Assignment 1 - Route improvement
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module shortens the routes of trucks after they have been scheduled.
+Truck.pack adds the destination of each parcel to the end of the truck's route
+unless the route already ends there, so a route follows the order in which its
+parcels were packed and can visit a city many times.
+
+improve_route shortens a single route by local search, with 2-opt moves (which
+reverse a stretch of the route) and Or-opt moves (which move one to three
+consecutive stops elsewhere, or drop a stop the route visits again anyway).
+Routes with at most EXACT_ROUTE_MAX_STOPS different stops are instead solved
+exactly by dynamic programming over subsets of stops (Held-Karp).  Many trucks
+share the same stops, so exact routes are cached by their set of stops.
+
+improve_routes improves the route of every truck in a fleet, optionally across
+a pool of processes.  Routes are only changed if that shortens them, so the
+distance a fleet travels never grows.
+"""
+from typing import List, Optional, Sequence, Tuple, Dict, FrozenSet
+import time
+from collections import Counter
+from operator import add
+from concurrent.futures import ProcessPoolExecutor
+from distance_map import DistanceMap, DistanceMatrix
+from domain import Fleet
+
+# The default time, in seconds, spent improving the route of each truck.
+ROUTE_TIME_BUDGET = 0.1
+
+# The default largest number of different stops for which a route is solved
+# exactly rather than improved by local search.
+EXACT_ROUTE_MAX_STOPS = 12
+
+# The length used for a leg whose distance is not known.  It is longer than
+# any route, so no move ever adds such a leg to a route.
+_UNKNOWN = 1 << 62
+
+# Exact routes, keyed by their depot and the set of cities they visit.  A
+# cache is only valid for the distances it was filled with.
+RouteCache = Dict[Tuple[str, FrozenSet[str]], List[str]]
+
+# The matrix, time budget, size limit for exact routes, and cache of exact
+# routes shared by all routes improved in this process.  They are set once per
+# worker process by _init_route_worker, so that the matrix is not sent again
+# with every route.
+_worker_args: Tuple[Optional[DistanceMatrix], Optional[float], int,
+                    RouteCache] = (None, None, 0, {})
+
+
+def improve_route(route: Sequence[str], matrix: DistanceMatrix,
+                  time_budget: Optional[float] = None,
+                  exact_max_stops: int = EXACT_ROUTE_MAX_STOPS,
+                  cache: Optional[RouteCache] = None) -> List[str]:
+    """Return a route that starts at the same depot as <route>, visits every
+    city that <route> visits, and is no longer than <route> according to the
+    distances in <matrix>.
+
+    If <route> has at most <exact_max_stops> different stops, the shortest
+    route that visits each of them once is used, looked up in or added to
+    <cache> if it is given.  Otherwise, or if that route is longer than
+    <route> (which can only happen when going through a city twice is a
+    shortcut), local search moves are made until no 2-opt or Or-opt move
+    shortens the route, or until <time_budget> seconds have passed, if it is
+    not None.  Legs whose distance is unknown are never added.
+
+    Precondition: <route> does not visit the same city twice in a row.
+
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Toronto', 'York', 6)
+    >>> m.add_distance('Hamilton', 'York', 12)
+    >>> m.add_distance('Hamilton', 'London', 4)
+    >>> m.add_distance('London', 'Toronto', 11)
+    >>> m.add_distance('London', 'York', 15)
+    >>> route = ['Toronto', 'Hamilton', 'York', 'London', 'York']
+    >>> improve_route(route, m.matrix(), exact_max_stops=0)
+    ['Toronto', 'London', 'Hamilton', 'York']
+    >>> cache = {}
+    >>> improve_route(route, m.matrix(), cache=cache)
+    ['Toronto', 'London', 'Hamilton', 'York']
+    >>> len(cache)
+    1
+    """
+    if len(route) <= 2:
+        return list(route)
+
+    names = list(dict.fromkeys(route))
+    ids = {name: i for i, name in enumerate(names)}
+    cost = [[0 if a == b else _leg(matrix.distance(a, b)) for b in names]
+            for a in names]
+    tour = [ids[city] for city in route] + [ids[route[0]]]
+
+    if len(names) - 1 <= exact_max_stops:
+        key = (route[0], frozenset(names))
+        exact = None if cache is None else cache.get(key)
+        if exact is None:
+            exact = [names[i] for i in _held_karp(cost)]
+            if cache is not None:
+                cache[key] = exact
+        candidate = [ids[city] for city in exact] + [0]
+        if _tour_length(candidate, cost) <= _tour_length(tour, cost):
+            return list(exact)
+
+    deadline = None
+    if time_budget is not None:
+        deadline = time.perf_counter() + time_budget
+    while deadline is None or time.perf_counter() < deadline:
+        if not (_or_opt(tour, cost) or _two_opt(tour, cost)):
+            break
+
+    result = [names[tour[0]]]
+    for city in tour[1:-1]:
+        if names[city] != result[-1]:
+            result.append(names[city])
+    return result
+
+
+def _tour_length(tour: List[int], cost: List[List[int]]) -> int:
+    """Return the length of <tour>, where cost[a][b] is the length of the leg
+    from city a to city b.
+    """
+    return sum(cost[a][b] for a, b in zip(tour, tour[1:]))
+
+
+def _held_karp(cost: List[List[int]]) -> List[int]:
+    """Return a shortest route that starts at city 0 and visits every other
+    city once, before returning to city 0, where cost[a][b] is the length of
+    the leg from city a to city b.
+
+    This takes O(2^k * k^2) time for k cities other than city 0.
+    """
+    k = len(cost) - 1
+    if k == 0:
+        return [0]
+    # Longer than any route, even one made of legs of unknown length.
+    inf = _UNKNOWN * (k + 2)
+    # into[j][i] is the length of the leg from stop i to stop j, where stop i
+    # is city i + 1.
+    into = [[cost[i + 1][j + 1] for i in range(k)] for j in range(k)]
+
+    # best[mask][j] is the length of the shortest route from city 0 that
+    # visits exactly the stops in the bitmask <mask> and ends at stop j, or
+    # <inf> if stop j is not in <mask>.
+    best = [[inf] * k for _ in range(1 << k)]
+    for j in range(k):
+        best[1 << j][j] = cost[0][j + 1]
+    for mask in range(1, 1 << k):
+        row = best[mask]
+        rest = mask
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            prev = mask ^ low
+            if prev:
+                j = low.bit_length() - 1
+                row[j] = min(map(add, best[prev], into[j]))
+
+    mask = (1 << k) - 1
+    j = min(range(k), key=lambda i: best[mask][i] + cost[i + 1][0])
+    order = []
+    while True:
+        order.append(j + 1)
+        prev = mask ^ (1 << j)
+        if not prev:
+            break
+        row, col = best[prev], into[j]
+        j = min(range(k), key=lambda i: row[i] + col[i])
+        mask = prev
+    order.append(0)
+    order.reverse()
+    return order
+
+
+def _leg(d: int) -> int:
+    """Return the length to use for a leg of distance <d>, which is -1 if the
+    distance is not known.
+    """
+    return d if d >= 0 else _UNKNOWN
+
+
+def _or_opt(tour: List[int], cost: List[List[int]]) -> bool:
+    """Make the first Or-opt move that shortens <tour>, and return True, or
+    return False if there is no such move.
+
+    <tour> is a route of city ids that starts and ends at the depot, and
+    cost[a][b] is the length of the leg from city a to city b.  A move takes
+    one to three consecutive stops out of <tour> and puts them back, in the
+    same order, between two other stops.  A single stop that <tour> also
+    visits elsewhere may instead be dropped.
+    """
+    m = len(tour)
+    visits = Counter(tour[:-1])
+    for size in (1, 2, 3):
+        for i in range(1, m - size):
+            first, last = tour[i], tour[i + size - 1]
+            before, after = tour[i - 1], tour[i + size]
+            gain = (cost[before][first] + cost[last][after]
+                    - cost[before][after])
+            if size == 1 and visits[first] > 1 and gain >= 0:
+                del tour[i]
+                return True
+            if gain <= 0:
+                continue
+            for j in range(m - 1):
+                if i - 1 <= j < i + size:
+                    continue
+                c, d = tour[j], tour[j + 1]
+                if cost[c][first] + cost[last][d] - cost[c][d] < gain:
+                    segment = tour[i:i + size]
+                    del tour[i:i + size]
+                    if j > i:
+                        j -= size
+                    tour[j + 1:j + 1] = segment
+                    return True
+    return False
+
+
+def _two_opt(tour: List[int], cost: List[List[int]]) -> bool:
+    """Make the first 2-opt move that shortens <tour>, and return True, or
+    return False if there is no such move.
+
+    <tour> and <cost> are as in _or_opt.  A move reverses the stops from
+    position i to position j of <tour>.  Legs may have different lengths in
+    each direction, so the legs inside the reversed stretch are counted too.
+    """
+    m = len(tour)
+    # forward[k] and backward[k] are the lengths of the first k legs of tour,
+    # travelled forwards and backwards.
+    forward = [0] * m
+    backward = [0] * m
+    for k in range(1, m):
+        a, b = tour[k - 1], tour[k]
+        forward[k] = forward[k - 1] + cost[a][b]
+        backward[k] = backward[k - 1] + cost[b][a]
+
+    for i in range(1, m - 2):
+        before, first = tour[i - 1], tour[i]
+        old_in = cost[before][first] - forward[i] + backward[i]
+        for j in range(i + 1, m - 1):
+            last, after = tour[j], tour[j + 1]
+            delta = (cost[before][last] + cost[first][after]
+                     - cost[last][after] - old_in
+                     + (backward[j] - forward[j]))
+            if delta < 0:
+                tour[i:j + 1] = tour[j:i - 1:-1]
+                return True
+    return False
+
+
+def _init_route_worker(matrix: DistanceMatrix, time_budget: Optional[float],
+                       exact_max_stops: int) -> None:
+    """Record the matrix, time budget and size limit for exact routes shared
+    by all routes improved in this worker process, with an empty cache.
+    """
+    global _worker_args
+    _worker_args = (matrix, time_budget, exact_max_stops, {})
+
+
+def _improve_in_worker(route: List[str]) -> List[str]:
+    """Return <route> improved with the arguments recorded by
+    _init_route_worker.
+    """
+    return improve_route(route, *_worker_args)
+
+
+def improve_routes(fleet: Fleet, dmap: DistanceMap,
+                   time_budget: Optional[float] = ROUTE_TIME_BUDGET,
+                   processes: Optional[int] = None,
+                   exact_max_stops: int = EXACT_ROUTE_MAX_STOPS) -> None:
+    """Improve the route of every truck in <fleet> with improve_route,
+    according to the distances in <dmap>, spending at most <time_budget>
+    seconds on each truck that is not solved exactly, and solving routes with
+    at most <exact_max_stops> stops exactly.  Exact routes are cached for the
+    duration of the call.
+
+    The routes are improved over a pool of <processes> worker processes.  If
+    <processes> is None, use one process per CPU.  If it is 1, improve every
+    route in this process.
+
+    >>> from domain import Truck, Parcel
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Hamilton', 'London', 4)
+    >>> m.add_distance('London', 'Toronto', 11)
+    >>> f = Fleet()
+    >>> t = Truck(1423, 10, 'Toronto')
+    >>> f.add_truck(t)
+    >>> for i, city in enumerate(['Hamilton', 'London', 'Hamilton']):
+    ...     t.pack(Parcel(i, 1, 'Toronto', city))
+    True
+    True
+    True
+    >>> f.total_distance_travelled(m)
+    26
+    >>> improve_routes(f, m, processes=1)
+    >>> t.route
+    ['Toronto', 'London', 'Hamilton']
+    >>> f.total_distance_travelled(m)
+    24
+    """
+    trucks = [truck for truck in fleet.trucks if len(truck.route) > 2]
+    routes = [list(truck.route) for truck in trucks]
+    matrix = dmap.matrix()
+
+    if processes == 1:
+        cache = {}
+        improved = [improve_route(route, matrix, time_budget, exact_max_stops,
+                                  cache) for route in routes]
+    else:
+        with ProcessPoolExecutor(processes,
+                                 initializer=_init_route_worker,
+                                 initargs=(matrix, time_budget,
+                                           exact_max_stops)) as pool:
+            improved = list(pool.map(_improve_in_worker, routes))
+
+    for truck, old, new in zip(trucks, routes, improved):
+        if new != old:
+            truck.set_route(new)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'time',
+                                   'collections', 'operator',
+                                   'concurrent.futures',
+                                   'distance_map', 'domain'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
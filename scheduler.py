@@ -19,12 +19,42 @@ Sophia Huynh, Maryam Majedi, and Jaisie Sin.
 
 This module contains the abstract Scheduler class, as well as the two
 subclasses RandomScheduler and GreedyScheduler, which implement the two
-scheduling algorithms described in the handout.
+scheduling algorithms described in the handout, GreedySession, which
+schedules parcels greedily as they arrive, and InsertionScheduler, which
+places each parcel where it lengthens a route the least.  The bin-packing
+schedulers FirstFitScheduler, BestFitScheduler and WorstFitScheduler fill
+trucks by volume alone, using FirstFitTree, BestFitIndex and WorstFitHeap to
+find each truck without scanning the fleet, and BranchAndBoundScheduler
+searches for a schedule that leaves as few parcels unscheduled as possible.
+It also contains TruckIndex, which GreedyScheduler uses to find the best
+truck for each parcel without scanning the whole fleet, DepotIndex, which
+does the same among the trucks of the depots nearest each parcel, and
+FirstFitTree, which RandomScheduler uses to find the first truck that fits
+each parcel.  Schedulers that schedule verbosely print a PlacementTrace,
+which samples the parcels placed instead of printing every one.
 """
-from typing import List, Dict, Callable
-from random import shuffle
-from container import PriorityQueue
+from typing import List, Dict, Callable, Optional, Tuple, Union, Sequence
+from random import Random, shuffle
+import time
+from operator import attrgetter
+from bisect import bisect_left, bisect_right, insort
+from heapq import heapify, heapreplace
+from container import HeapPriorityQueue
 from domain import Parcel, Truck
+from distance_map import DistanceMap, DistanceMatrix
+from store import ParcelStore
+from profiling import ScheduleCounters
+
+# The length used for a leg whose distance is not known.  It is longer than
+# any route, so InsertionScheduler only adds such a leg as a last resort.
+_UNKNOWN_LEG = 1 << 62
+
+# The default time, in seconds, that BranchAndBoundScheduler searches for.
+OPTIMIZE_TIME_BUDGET = 1.0
+
+# The default number of parcels placed between the lines printed by a
+# scheduler that schedules verbosely.
+VERBOSE_EVERY = 1000
 
 
 class Scheduler:
@@ -32,7 +62,20 @@ class Scheduler:
     what route each truck will take.
 
     This is an abstract class.  Only child classes should be instantiated.
+
+    === Public Attributes ===
+    verbose_every:
+        When scheduling verbosely, the number of parcels placed between the
+        lines printed by a PlacementTrace.
+    counters:
+        Counts of the work done by schedule to order and place parcels, over
+        every call, or None if this scheduler does not count its work.
+
+    === Representation Invariants ===
+    - verbose_every > 0
     """
+    verbose_every: int = VERBOSE_EVERY
+    counters: Optional[ScheduleCounters] = None
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
@@ -52,39 +95,320 @@ class Scheduler:
         the scheduling algorithm as it runs.  This is *only* for debugging
         purposes for your benefit, so the content and format of this
         information is your choice; we will not test your code with <verbose>
-        set to True.
+        set to True.  Schedulers that place parcels one at a time print a
+        PlacementTrace, sampled every <verbose_every> parcels.
         """
         raise NotImplementedError
 
 
+class PlacementTrace:
+    """A sampled trace of the parcels placed by a scheduler, which prints one
+    line for the first parcel and every <every>th parcel after it, and a
+    summary at the end, so that verbose scheduling of many parcels does not
+    print a line per parcel.
+
+    === Public Attributes ===
+    every:
+        The number of parcels placed between printed lines.
+    placed_count:
+        The number of parcels placed so far, including those left unscheduled.
+    unscheduled:
+        The number of those parcels that were left unscheduled.
+
+    === Representation Invariants ===
+    - every > 0
+
+    === Sample Usage ===
+    >>> trace = PlacementTrace(2)
+    >>> truck = Truck(1, 10, 'York')
+    >>> for i in range(3):
+    ...     parcel = Parcel(i, 4, 'York', 'Toronto')
+    ...     trace.placed(parcel, truck if truck.pack(parcel) else None)
+    placement 0: parcel 0 (volume 4) on truck 1 (6 left)
+    placement 2: parcel 2 (volume 4) unscheduled
+    >>> trace.finish()
+    3 parcels placed, 1 unscheduled
+    """
+    every: int
+    placed_count: int
+    unscheduled: int
+
+    def __init__(self, every: int) -> None:
+        """Initialize a trace that prints a line every <every> parcels.
+
+        Precondition: every > 0
+        """
+        self.every = every
+        self.placed_count = 0
+        self.unscheduled = 0
+
+    def placed(self, parcel: Parcel, truck: Optional[Truck]) -> None:
+        """Record that <parcel> was packed onto <truck>, or left unscheduled
+        if <truck> is None, and print it if it is sampled.
+        """
+        if self.placed_count % self.every == 0:
+            if truck is None:
+                where = 'unscheduled'
+            else:
+                where = f'on truck {truck.t_id} ({truck.avail} left)'
+            print(f'placement {self.placed_count}: parcel {parcel.p_id} '
+                  f'(volume {parcel.p_vol}) {where}')
+        self.placed_count += 1
+        if truck is None:
+            self.unscheduled += 1
+
+    def finish(self) -> None:
+        """Print a summary of the parcels placed.
+        """
+        print(f'{self.placed_count} parcels placed, '
+              f'{self.unscheduled} unscheduled')
+
+
+class FirstFitTree:
+    """A segment tree over the available space of a list of trucks that finds
+    the first truck with enough space for a parcel in O(log T) time, where T is
+    the number of trucks.
+
+    === Private Attributes ===
+    _size:
+        The number of leaves in the tree: the smallest power of two that is at
+        least the number of trucks.
+    _tree:
+        The nodes of the tree, stored as an array.  Node 1 is the root, the
+        children of node i are nodes 2i and 2i + 1, and the leaf for the truck
+        at position i is node <_size> + i.  Each node stores the maximum
+        available space among the trucks below it.
+
+    === Representation Invariants ===
+    - len(<_tree>) == 2 * <_size>
+    - Leaves past the last truck store -1.
+
+    === Sample Usage ===
+    >>> tree = FirstFitTree([10, 30, 20])
+    >>> tree.first_fit(15)
+    1
+    >>> tree.update(1, 5)
+    >>> tree.first_fit(15)
+    2
+    >>> tree.first_fit(25)
+    -1
+    """
+    _size: int
+    _tree: List[int]
+
+    def __init__(self, avail: List[int]) -> None:
+        """Initialize a tree over trucks with the available space in <avail>,
+        in order.
+        """
+        self._size = 1
+        while self._size < len(avail):
+            self._size *= 2
+
+        self._tree = [-1] * (2 * self._size)
+        self._tree[self._size:self._size + len(avail)] = avail
+        for node in range(self._size - 1, 0, -1):
+            self._tree[node] = max(self._tree[2 * node],
+                                   self._tree[2 * node + 1])
+
+    def update(self, i: int, avail: int) -> None:
+        """Record that the truck at position <i> now has <avail> available
+        space.
+        """
+        tree = self._tree
+        node = self._size + i
+        tree[node] = avail
+        node //= 2
+        while node >= 1:
+            best = max(tree[2 * node], tree[2 * node + 1])
+            if tree[node] == best:
+                # Nothing above this node can change either.
+                break
+            tree[node] = best
+            node //= 2
+
+    def first_fit(self, vol: int) -> int:
+        """Return the position of the first truck with at least <vol> available
+        space, or -1 if there is no such truck.
+        """
+        if self._tree[1] < vol:
+            return -1
+
+        node = 1
+        while node < self._size:
+            node *= 2
+            if self._tree[node] < vol:
+                node += 1
+        return node - self._size
+
+
+class BestFitIndex:
+    """A sorted list of the available space of a list of trucks that finds
+    the truck with the least available space that still fits a parcel with a
+    binary search.
+
+    === Private Attributes ===
+    _avail:
+        The available space of each truck, in order.
+    _keys:
+        A key (available space, position) for each truck, in sorted order.
+
+    === Representation Invariants ===
+    - <_keys> is sorted and holds exactly (<_avail>[i], i) for each position i.
+
+    === Sample Usage ===
+    >>> index = BestFitIndex([10, 30, 20])
+    >>> index.best_fit(15)
+    2
+    >>> index.update(2, 5)
+    >>> index.best_fit(15)
+    1
+    >>> index.best_fit(35)
+    -1
+    """
+    _avail: List[int]
+    _keys: List[Tuple[int, int]]
+
+    def __init__(self, avail: List[int]) -> None:
+        """Initialize an index over trucks with the available space in
+        <avail>, in order.
+        """
+        self._avail = list(avail)
+        self._keys = sorted((a, i) for i, a in enumerate(avail))
+
+    def update(self, i: int, avail: int) -> None:
+        """Record that the truck at position <i> now has <avail> available
+        space.
+        """
+        _remove_key(self._keys, (self._avail[i], i))
+        self._avail[i] = avail
+        insort(self._keys, (avail, i))
+
+    def best_fit(self, vol: int) -> int:
+        """Return the position of the truck with the least available space
+        that is at least <vol>, or -1 if there is no such truck.  Ties go to
+        the first such truck.
+        """
+        j = bisect_left(self._keys, (vol, -1))
+        if j < len(self._keys):
+            return self._keys[j][1]
+        return -1
+
+
+class WorstFitHeap:
+    """A heap of the available space of a list of trucks that finds the truck
+    with the most available space in O(1) time, and updates it in O(log T)
+    time, where T is the number of trucks.
+
+    === Private Attributes ===
+    _heap:
+        A key (negated available space, position) for each truck, in a
+        min-heap, so the truck with the most space is at the top.
+
+    === Sample Usage ===
+    >>> heap = WorstFitHeap([10, 30, 30])
+    >>> heap.worst_fit(15)
+    1
+    >>> heap.update_worst(5)
+    >>> heap.worst_fit(15)
+    2
+    >>> heap.worst_fit(35)
+    -1
+    """
+    _heap: List[Tuple[int, int]]
+
+    def __init__(self, avail: List[int]) -> None:
+        """Initialize a heap over trucks with the available space in <avail>,
+        in order.
+        """
+        self._heap = [(-a, i) for i, a in enumerate(avail)]
+        heapify(self._heap)
+
+    def worst_fit(self, vol: int) -> int:
+        """Return the position of the truck with the most available space, if
+        it is at least <vol>, or -1 otherwise.  Ties go to the first such
+        truck.
+        """
+        if self._heap and -self._heap[0][0] >= vol:
+            return self._heap[0][1]
+        return -1
+
+    def update_worst(self, avail: int) -> None:
+        """Record that the truck last returned by worst_fit now has <avail>
+        available space.
+        """
+        heapreplace(self._heap, (-avail, self._heap[0][1]))
+
+
 class RandomScheduler(Scheduler):
     """Randomly schedule the given <parcels> onto the given <trucks>.
 
+    === Private Attributes ===
+    _rng:
+        The source of randomness for this scheduler, or None to use the
+        global random number generator of module random.
+
     === Representation Invariants ===
     - Truck and parcels have a positive volume.
+
+    === Sample Usage ===
+    >>> parcels = [Parcel(i, 10, 'York', 'Toronto') for i in range(6)]
+    >>> trucks = [Truck(i, 20, 'York') for i in range(4)]
+    >>> RandomScheduler(148).schedule(parcels, trucks)
+    []
+    >>> [t.t_id for t in trucks]
+    [0, 1, 2, 3]
+    >>> allocations = [t.parcel_ids() for t in trucks]
+    >>> trucks = [Truck(i, 20, 'York') for i in range(4)]
+    >>> RandomScheduler(148).schedule(parcels, trucks)
+    []
+    >>> [t.parcel_ids() for t in trucks] == allocations
+    True
     """
+    _rng: Optional[Random]
+
+    def __init__(self, seed: Union[None, int, Random] = None) -> None:
+        """Initialize a scheduler that draws its random choices from <seed>.
+
+        <seed> may be a Random instance to draw from, or an int to seed a new
+        one.  If <seed> is None, the global random number generator is used.
+        """
+        if seed is None or isinstance(seed, Random):
+            self._rng = seed
+        else:
+            self._rng = Random(seed)
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
         """Randomly schedule the given parcels into randomly chosen trucks
         that have enough available space.
+
+        Neither <parcels> nor <trucks> is reordered.
         """
+        shuffle_ = shuffle if self._rng is None else self._rng.shuffle
 
         unsked = []
 
-        temp_p = parcels.copy()
-        shuffle(temp_p)
+        temp_p = list(parcels)
+        shuffle_(temp_p)
+
+        temp_t = trucks.copy()
+        shuffle_(temp_t)
 
-        shuffle(trucks)
+        # Finds the first truck in shuffled order that fits each parcel.
+        tree = FirstFitTree([truck.avail for truck in temp_t])
 
+        trace = PlacementTrace(self.verbose_every) if verbose else None
         for parcel in temp_p:
-            i = 0
-            while i < len(trucks) and parcel.p_vol > trucks[i].avail:
-                i += 1
-            if i == len(trucks):
+            i = tree.first_fit(parcel.p_vol)
+            if i == -1:
                 unsked.append(parcel)
             else:
-                trucks[i].pack(parcel)
+                temp_t[i].pack(parcel)
+                tree.update(i, temp_t[i].avail)
+            if trace is not None:
+                trace.placed(parcel, None if i == -1 else temp_t[i])
+        if trace is not None:
+            trace.finish()
         return unsked
 
 
@@ -137,6 +461,270 @@ def _non_decreasing_avail(a: Truck, b: Truck) -> bool:
     return a.avail < b.avail
 
 
+class TruckIndex:
+    """An index over a list of trucks that finds the truck GreedyScheduler
+    would choose for a parcel in O(log T) time, where T is the number of
+    trucks.
+
+    The trucks are kept in sorted lists ordered by available space: one list
+    for every city that is currently the last stop of some truck's route, and
+    one list for the whole fleet.  Trucks must be packed through this index
+    so that it stays up to date.
+
+    === Private Attributes ===
+    _trucks:
+        The indexed trucks, in their original order.
+    _most_avail:
+        True iff the truck with the most available space is preferred.
+        Otherwise the truck with the least available space that fits the
+        parcel is preferred.  Ties always go to the truck that comes first in
+        <_trucks>.
+    _positions:
+        Maps the id of each truck to its position in <_trucks>.
+    _keys:
+        The sort key of each truck in <_trucks>: its available space, and its
+        position (negated when <_most_avail> is True).
+    _all:
+        The keys of all trucks, in sorted order.
+    _by_city:
+        Maps each city to the sorted keys of the trucks whose route currently
+        ends in that city.
+    _counters:
+        The counters that every search is counted in, or None.
+
+    === Representation Invariants ===
+    - <_keys>[i] is in <_all> and in <_by_city>[<_trucks>[i].route[-1]] for
+      every position i, and these are its only occurrences.
+    - The ids of the trucks in <_trucks> are unique.
+
+    === Sample Usage ===
+    >>> t1 = Truck(1, 40, 'York')
+    >>> t2 = Truck(2, 25, 'York')
+    >>> index = TruckIndex([t1, t2], True)
+    >>> p1 = Parcel(17, 10, 'York', 'Toronto')
+    >>> index.choose(p1) is t1
+    True
+    >>> index.pack(t1, p1)
+    True
+    >>> p2 = Parcel(21, 20, 'York', 'Toronto')
+    >>> index.choose(p2) is t1
+    True
+    >>> p3 = Parcel(22, 31, 'York', 'Toronto')
+    >>> index.choose(p3) is None
+    True
+    """
+    _trucks: List[Truck]
+    _most_avail: bool
+    _positions: Dict[int, int]
+    _keys: List[Tuple[int, int]]
+    _all: List[Tuple[int, int]]
+    _by_city: Dict[str, List[Tuple[int, int]]]
+    _counters: Optional[ScheduleCounters]
+
+    def __init__(self, trucks: List[Truck], most_avail: bool,
+                 counters: Optional[ScheduleCounters] = None) -> None:
+        """Initialize an index over <trucks> in their current state, which
+        counts its searches in <counters> unless it is None.
+
+        If <most_avail> is True, prefer the truck with the most available
+        space; otherwise prefer the truck with the least available space that
+        still fits the parcel.
+        """
+        self._trucks = trucks
+        self._most_avail = most_avail
+        self._counters = counters
+        self._positions = {}
+        self._keys = []
+        self._by_city = {}
+
+        for i, truck in enumerate(trucks):
+            self._positions[truck.t_id] = i
+            key = self._key(i)
+            self._keys.append(key)
+            self._by_city.setdefault(truck.route[-1], []).append(key)
+
+        self._all = sorted(self._keys)
+        for keys in self._by_city.values():
+            keys.sort()
+
+    def _key(self, i: int) -> Tuple[int, int]:
+        """Return the sort key for the truck at position <i>.
+        """
+        if self._most_avail:
+            return self._trucks[i].avail, -i
+        return self._trucks[i].avail, i
+
+    def _best(self, keys: List[Tuple[int, int]], vol: int) -> Optional[Truck]:
+        """Return the preferred truck among the sorted <keys> that has at
+        least <vol> available space, or None if there is no such truck.
+        """
+        if self._most_avail:
+            fits = bool(keys) and keys[-1][0] >= vol
+            if self._counters is not None:
+                self._counters.searched(1, bool(keys), fits)
+            if fits:
+                return self._trucks[-keys[-1][1]]
+            return None
+
+        j = bisect_left(keys, (vol, -1))
+        if self._counters is not None:
+            self._counters.searched(len(keys).bit_length(), j < len(keys),
+                                    j < len(keys))
+        if j < len(keys):
+            return self._trucks[keys[j][1]]
+        return None
+
+    def choose(self, parcel: Parcel) -> Optional[Truck]:
+        """Return the truck that <parcel> should be packed onto, or None if
+        no truck has enough available space.
+
+        Trucks whose route ends at the parcel's destination are preferred over
+        all other trucks.
+        """
+        if parcel.dest in self._by_city:
+            truck = self._best(self._by_city[parcel.dest], parcel.p_vol)
+            if truck is not None:
+                return truck
+        return self._best(self._all, parcel.p_vol)
+
+    def pack(self, truck: Truck, parcel: Parcel) -> bool:
+        """Pack <parcel> onto <truck> and update this index.  Return True iff
+        the parcel was packed.
+
+        Precondition: <truck> is one of the trucks in this index.
+        """
+        i = self._positions[truck.t_id]
+        old_key = self._keys[i]
+        old_city = truck.route[-1]
+
+        if not truck.pack(parcel):
+            return False
+
+        _remove_key(self._all, old_key)
+        city_keys = self._by_city[old_city]
+        _remove_key(city_keys, old_key)
+        if not city_keys:
+            del self._by_city[old_city]
+
+        new_key = self._key(i)
+        self._keys[i] = new_key
+        insort(self._all, new_key)
+        insort(self._by_city.setdefault(truck.route[-1], []), new_key)
+        return True
+
+
+def _remove_key(keys: List[Tuple[int, int]], key: Tuple[int, int]) -> None:
+    """Remove <key> from the sorted list <keys>.
+
+    Precondition: <key> is in <keys>.
+
+    >>> keys = [(5, 0), (5, 2), (9, 1)]
+    >>> _remove_key(keys, (5, 2))
+    >>> keys
+    [(5, 0), (9, 1)]
+    """
+    del keys[bisect_left(keys, key)]
+
+
+class DepotIndex:
+    """An index over a list of trucks from several depots that finds the truck
+    GreedyScheduler would choose for a parcel, among only the trucks of the
+    depots nearest the parcel's destination.
+
+    Each depot has a TruckIndex over its own trucks, so a parcel is matched
+    against the k depots near its destination in O(k log T) time, instead of
+    against every truck.  Trucks must be packed through this index so that it
+    stays up to date.
+
+    === Private Attributes ===
+    _near:
+        The nearest-depot table: maps each city to the depots whose trucks
+        may carry parcels bound for it, nearest first.  Parcels bound for a
+        city not in the table may go on trucks from any depot.
+    _indexes:
+        Maps each depot to the TruckIndex over its trucks.
+    _positions:
+        Maps the id of each truck to its position among all the trucks, which
+        breaks ties between trucks of different depots.
+    _most_avail:
+        True iff the truck with the most available space is preferred.
+    _counters:
+        The counters that every search and comparison of candidates is
+        counted in, or None.
+
+    === Sample Usage ===
+    >>> t1 = Truck(1, 40, 'Toronto')
+    >>> t2 = Truck(2, 25, 'Ottawa')
+    >>> t3 = Truck(3, 30, 'Toronto')
+    >>> index = DepotIndex([t1, t2, t3], True,
+    ...                    {'Hamilton': ['Toronto'], 'Kingston': ['Ottawa']})
+    >>> index.choose(Parcel(1, 10, 'Toronto', 'Kingston')) is t2
+    True
+    >>> index.pack(t1, Parcel(2, 20, 'Toronto', 'Hamilton'))
+    True
+    >>> index.choose(Parcel(3, 15, 'Toronto', 'York')) is t3
+    True
+    """
+    _near: Dict[str, List[str]]
+    _indexes: Dict[str, TruckIndex]
+    _positions: Dict[int, int]
+    _most_avail: bool
+    _counters: Optional[ScheduleCounters]
+
+    def __init__(self, trucks: List[Truck], most_avail: bool,
+                 near: Dict[str, List[str]],
+                 counters: Optional[ScheduleCounters] = None) -> None:
+        """Initialize an index over <trucks> in their current state, which
+        only considers the trucks of the depots in near[c] for parcels bound
+        for city c, and counts its work in <counters> unless it is None.
+
+        If <most_avail> is True, prefer the truck with the most available
+        space; otherwise prefer the truck with the least available space that
+        still fits the parcel.
+        """
+        self._near = near
+        self._most_avail = most_avail
+        self._counters = counters
+        self._positions = {}
+        by_depot = {}
+        for i, truck in enumerate(trucks):
+            self._positions[truck.t_id] = i
+            by_depot.setdefault(truck.dep, []).append(truck)
+        self._indexes = {depot: TruckIndex(depot_trucks, most_avail, counters)
+                         for depot, depot_trucks in by_depot.items()}
+
+    def choose(self, parcel: Parcel) -> Optional[Truck]:
+        """Return the truck that <parcel> should be packed onto, or None if
+        no truck of a nearby depot has enough available space.
+
+        Trucks whose route ends at the parcel's destination are preferred over
+        all other trucks, as in TruckIndex.
+        """
+        best, best_key = None, None
+        for depot in self._near.get(parcel.dest, self._indexes):
+            if depot not in self._indexes:
+                continue
+            truck = self._indexes[depot].choose(parcel)
+            if truck is None:
+                continue
+            i = self._positions[truck.t_id]
+            key = (truck.route[-1] != parcel.dest,
+                   -truck.avail if self._most_avail else truck.avail, i)
+            if best_key is not None and self._counters is not None:
+                self._counters.queue_comparisons += 1
+            if best_key is None or key < best_key:
+                best, best_key = truck, key
+        return best
+
+    def pack(self, truck: Truck, parcel: Parcel) -> bool:
+        """Pack <parcel> onto <truck> and update this index.  Return True iff
+        the parcel was packed.
+
+        Precondition: <truck> is one of the trucks in this index.
+        """
+        return self._indexes[truck.dep].pack(truck, parcel)
+
+
 class GreedyScheduler(Scheduler):
     """Greedily schedule the given <parcels> onto the given <trucks>.
     This scheduler is deterministic and there can be 6 different outcomes
@@ -153,6 +741,31 @@ class GreedyScheduler(Scheduler):
     _t_order:
         This order in which we are considering which truck to pack. Either by
         non-increasing volume or non-decreasing volume.
+    _p_attr:
+        The parcel attribute to sort by that is equivalent to _p_order: the
+        parcel's volume 'p_vol' or destination 'dest'.
+    _p_reverse:
+        True iff sorting by _p_attr must be in non-increasing order to match
+        _p_order.
+    _sort_parcels:
+        If True, parcels are put in order with a single stable sort on _p_attr.
+        Otherwise they are put in order through a priority queue on _p_order.
+        Both give exactly the same order, including ties.
+    _t_most_avail:
+        True iff _t_order prefers the truck with the most available space.
+    _index_trucks:
+        If True, the truck for each parcel is found with a TruckIndex.
+        Otherwise every truck is scanned for each parcel.  Both choose exactly
+        the same trucks.
+    _nearby_depots:
+        The number of depots nearest its destination whose trucks a parcel
+        may go on, found with a DepotIndex, or None if a parcel may go on any
+        truck.
+    _dmap:
+        The distances that the nearest depots are found with, or None.
+    _depots:
+        The depots that the nearest depots are chosen among, or None for the
+        depots of the trucks being scheduled.
 
     === Representation Invariants ===
     - Truck and parcels have a positive volume.
@@ -161,82 +774,1065 @@ class GreedyScheduler(Scheduler):
 
     _p_order: Callable
     _t_order: Callable
+    _p_attr: str
+    _p_reverse: bool
+    _sort_parcels: bool
+    _t_most_avail: bool
+    _index_trucks: bool
+    _nearby_depots: Optional[int]
+    _dmap: Optional[DistanceMap]
+    _depots: Optional[List[str]]
+
+    def __init__(self, config: Dict,
+                 dmap: Optional[DistanceMap] = None,
+                 depots: Optional[List[str]] = None) -> None:
+        """Initializing priorities and orders.
 
-    def __init__(self, config: Dict) -> None:
-        """Initializing priorities and orders."""
+        If <config> has the optional key 'sort_parcels' set to False, parcels
+        are ordered through a priority queue instead of a single sort.  If it
+        has the optional key 'index_trucks' set to False, every truck is
+        scanned for each parcel instead of using a TruckIndex.  If it has the
+        optional key 'nearby_depots' set to k, each parcel only goes on trucks
+        from the k depots nearest its destination according to <dmap>, found
+        with a DepotIndex whether or not 'index_trucks' is set.  The nearest
+        depots are chosen among <depots>, or among the depots of the trucks
+        being scheduled if it is None; parcels whose nearest depots have no
+        trucks being scheduled are left unscheduled.  If it has the
+        optional key 'profile' set to True, the work done to order and place
+        parcels is counted in <counters>.
+
+        Precondition: <dmap> is not None if <config> has 'nearby_depots'.
+        """
 
         if config['parcel_priority'] == 'volume':
+            self._p_attr = 'p_vol'
             if config['parcel_order'] == 'non-increasing':
                 self._p_order = _non_increasing_vol
             else:
                 self._p_order = _non_decreasing_vol
         else:
+            self._p_attr = 'dest'
             if config['parcel_order'] == 'non-increasing':
                 self._p_order = _non_increasing_dest
             else:
                 self._p_order = _non_decreasing_dest
+        self._p_reverse = config['parcel_order'] == 'non-increasing'
+        self._sort_parcels = config.get('sort_parcels', True)
+        self._index_trucks = config.get('index_trucks', True)
 
         if config['truck_order'] == 'non-increasing':
             self._t_order = _non_increasing_avail
         else:
             self._t_order = _non_decreasing_avail
+        self._t_most_avail = config['truck_order'] == 'non-increasing'
+        self._nearby_depots = config.get('nearby_depots')
+        self._dmap = dmap
+        self._depots = depots
+
+        self.counters = None
+        if config.get('profile', False):
+            self.counters = ScheduleCounters()
+            self._p_order = self.counters.counting(self._p_order)
+            self._t_order = self.counters.counting(self._t_order)
+
+    def _order_parcels(self, parcels: Sequence[Parcel]) -> Sequence[Parcel]:
+        """Return a new sequence of <parcels> in the order they are to be
+        scheduled: highest priority first, and ties in the order they appear
+        in <parcels>.
+
+        If <parcels> is a ParcelStore, its columns are sorted directly.
+
+        >>> p1 = Parcel(1, 10, 'York', 'Toronto')
+        >>> p2 = Parcel(2, 20, 'York', 'London')
+        >>> p3 = Parcel(3, 10, 'York', 'Hamilton')
+        >>> config = {'parcel_priority': 'volume',
+        ...           'parcel_order': 'non-decreasing',
+        ...           'truck_order': 'non-increasing'}
+        >>> s = GreedyScheduler(config)
+        >>> [p.p_id for p in s._order_parcels([p1, p2, p3])]
+        [1, 3, 2]
+        >>> config['sort_parcels'] = False
+        >>> s = GreedyScheduler(config)
+        >>> [p.p_id for p in s._order_parcels([p1, p2, p3])]
+        [1, 3, 2]
+        """
+        if self._sort_parcels:
+            # sorted is stable even when reverse is True, so ties keep
+            # their FIFO order just like in the priority queue.
+            if self.counters is not None:
+                # A ParcelStore sorts to the same order, but does not count.
+                key = self.counters.counting_key(attrgetter(self._p_attr))
+                return sorted(parcels, key=key, reverse=self._p_reverse)
+            if isinstance(parcels, ParcelStore):
+                return parcels.sorted_views(self._p_attr, self._p_reverse)
+            return sorted(parcels, key=attrgetter(self._p_attr),
+                          reverse=self._p_reverse)
+
+        p_pq = HeapPriorityQueue(self._p_order)
+        for parcel in parcels:
+            p_pq.add(parcel)
+
+        ordered = []
+        while not p_pq.is_empty():
+            ordered.append(p_pq.remove())
+        return ordered
+
+    def _scan_trucks(self, p: Parcel,
+                     trucks: List[Truck]) -> Optional[Truck]:
+        """Return the truck in <trucks> that <p> should be packed onto, or None
+        if no truck has enough available space, by scanning every truck.
+        """
+        t_avail = []  # All trucks with available space
+        t_city = []   # All trucks with parcel’s dest and avail space.
+
+        # Last comparison by most or least avail
+        t_pq = HeapPriorityQueue(self._t_order)
+
+        for truck in trucks:
+            if p.p_vol <= truck.avail:
+                t_avail.append(truck)
+
+        for truck in t_avail:
+            if truck.route[-1] == p.dest:
+                t_city.append(truck)
+
+        if self.counters is not None:
+            self.counters.scanned(len(trucks))
+            self.counters.queued(len(t_city) if t_city else len(t_avail))
+
+        if t_city:
+            while t_city:
+                t_pq.add(t_city.pop(0))
+        elif t_avail and not t_city:
+            while t_avail:
+                t_pq.add(t_avail.pop(0))
+
+        if not t_pq.is_empty():
+            return t_pq.remove()
+        return None
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
         """Greedily schedule the given parcels into on trucks according to
         parcel and truck priorities.
+
+        <parcels> may also be a ParcelStore, with <trucks> the trucks of a
+        FleetStore over it.
         """
 
         unsked = []
+        index = self._make_index(trucks)
 
         # Putting the parcels in order
 
-        p_pq = PriorityQueue(self._p_order)
+        trace = PlacementTrace(self.verbose_every) if verbose else None
+        for p in self._order_parcels(parcels):
+            truck = self._schedule_one(p, trucks, index)
+            if truck is None:
+                unsked.append(p)
+            if trace is not None:
+                trace.placed(p, truck)
+        if trace is not None:
+            trace.finish()
 
-        for parcel in parcels:
-            p_pq.add(parcel)
+        return unsked
 
-        while not p_pq.is_empty():
-            p = p_pq.remove()
+    def _make_index(self, trucks: List[Truck]) \
+            -> Union[None, TruckIndex, DepotIndex]:
+        """Return the index that the trucks for parcels are found in among
+        <trucks>, in their current state, or None if every truck is to be
+        scanned for each parcel instead.
+        """
+        if self._nearby_depots is not None:
+            depots = self._depots
+            if depots is None:
+                depots = list(dict.fromkeys(truck.dep for truck in trucks))
+            near = self._dmap.nearest_depots(depots, self._nearby_depots)
+            return DepotIndex(trucks, self._t_most_avail, near, self.counters)
+        if self._index_trucks:
+            return TruckIndex(trucks, self._t_most_avail, self.counters)
+        return None
 
-            t_avail = []  # All trucks with available space
-            t_city = []   # All trucks with parcel’s dest and avail space.
+    def _schedule_one(self, p: Parcel, trucks: List[Truck],
+                      index: Union[None, TruckIndex, DepotIndex]) \
+            -> Optional[Truck]:
+        """Pack <p> onto the truck in <trucks> that it should go on, and return
+        that truck, or None if no truck has enough available space.  The truck
+        is found and packed through <index> unless it is None.
+        """
+        if self.counters is not None:
+            self.counters.parcel_started()
+        if index is not None:
+            truck = index.choose(p)
+        else:
+            truck = self._scan_trucks(p, trucks)
+        if self.counters is not None:
+            self.counters.parcel_finished()
+
+        if truck is None:
+            return None
+        if index is not None:
+            index.pack(truck, p)
+        else:
+            truck.pack(p)
+        return truck
 
-            # Last comparison by most or least avail
-            t_pq = PriorityQueue(self._t_order)
 
-            for truck in trucks:
-                if p.p_vol <= truck.avail:
-                    t_avail.append(truck)
+class GreedySession(GreedyScheduler):
+    """A greedy scheduler for parcels that arrive over time, which packs each
+    parcel onto one fleet of trucks as soon as it is submitted.
 
-            for truck in t_avail:
-                if truck.route[-1] == p.dest:
-                    t_city.append(truck)
+    Its TruckIndex is kept between submissions, so each parcel is scheduled in
+    O(log T) time for T trucks.  Submitting parcels one at a time packs them
+    exactly as GreedyScheduler.schedule would if it were given them in an order
+    where they already come by priority; a batch is put in priority order
+    first, exactly as GreedyScheduler.schedule does with it.
+
+    === Private Attributes ===
+    _trucks:
+        The trucks that parcels are scheduled onto.  They must only be packed
+        through this session.
+    _index:
+        The index over <_trucks>, or None if every truck is scanned for each
+        parcel instead.  It is a DepotIndex if parcels only go on trucks from
+        nearby depots.
 
-            if t_city:
-                while t_city:
-                    t_pq.add(t_city.pop(0))
-            elif t_avail and not t_city:
-                while t_avail:
-                    t_pq.add(t_avail.pop(0))
+    === Sample Usage ===
+    >>> config = {'parcel_priority': 'volume',
+    ...           'parcel_order': 'non-increasing',
+    ...           'truck_order': 'non-increasing'}
+    >>> session = GreedySession(config, [Truck(1, 35, 'York'),
+    ...                                  Truck(2, 30, 'York')])
+    >>> session.submit(Parcel(7, 20, 'York', 'Toronto'))
+    1
+    >>> session.submit(Parcel(8, 25, 'York', 'Hamilton'))
+    2
+    >>> session.submit(Parcel(9, 16, 'York', 'Toronto')) is None
+    True
+    >>> batch = [Parcel(10, 18, 'York', 'London'),
+    ...          Parcel(11, 10, 'York', 'Toronto')]
+    >>> [p.p_id for p in session.submit_batch(batch)]
+    [10]
+    >>> session.assign_batch([Parcel(12, 2, 'York', 'London'),
+    ...                       Parcel(13, 3, 'York', 'Toronto')])
+    [2, 1]
+    """
+    _trucks: List[Truck]
+    _index: Union[None, TruckIndex, DepotIndex]
+
+    def __init__(self, config: Dict, trucks: List[Truck],
+                 dmap: Optional[DistanceMap] = None) -> None:
+        """Initialize a session that schedules parcels onto <trucks>, in
+        their current state, with the greedy algorithm configured by <config>
+        and the distances in <dmap> as in GreedyScheduler.
+
+        Precondition: <dmap> is not None if <config> has 'nearby_depots'.
+        """
+        GreedyScheduler.__init__(self, config, dmap)
+        self._trucks = trucks
+        self._index = self._make_index(trucks)
 
-            if not t_pq.is_empty():
-                t_pq.remove().pack(p)
+    def submit(self, parcel: Parcel) -> Optional[int]:
+        """Pack <parcel> onto the truck it should go on, and return the id of
+        that truck, or None if no truck has enough available space.
+        """
+        truck = self._schedule_one(parcel, self._trucks, self._index)
+        if truck is None:
+            return None
+        return truck.t_id
+
+    def submit_batch(self, parcels: Sequence[Parcel]) -> List[Parcel]:
+        """Pack <parcels> in priority order, as GreedyScheduler.schedule
+        would, and return a list of the parcels that did not get scheduled
+        onto any truck.
+        """
+        unsked = []
+        for p in self._order_parcels(parcels):
+            if self._schedule_one(p, self._trucks, self._index) is None:
+                unsked.append(p)
+        return unsked
+
+    def assign_batch(self, parcels: Sequence[Parcel]) -> List[Optional[int]]:
+        """Pack <parcels> in priority order, as submit_batch does, and return
+        a list whose item i is the id of the truck that parcel i of <parcels>
+        was packed onto, or None if it did not get scheduled.
+
+        Precondition: No parcel appears in <parcels> more than once.
+        """
+        positions = {id(p): i for i, p in enumerate(parcels)}
+        assigned = [None] * len(parcels)
+        for p in self._order_parcels(parcels):
+            truck = self._schedule_one(p, self._trucks, self._index)
+            if truck is not None:
+                assigned[positions[id(p)]] = truck.t_id
+        return assigned
+
+
+class InsertionScheduler(GreedyScheduler):
+    """Schedule parcels onto trucks by cheapest insertion: each parcel goes on
+    the truck, and at the place in that truck's route, that lengthens the
+    route the least according to a DistanceMap.
+
+    Parcels are taken in the order configured as for GreedyScheduler.  A
+    parcel whose destination is already on a truck's route costs nothing to
+    add to that truck.  Ties go to the truck with the most available space if
+    the truck order is non-increasing, and with the least otherwise, and then
+    to the truck that comes first.  Routes are closed tours that return to the
+    depot, and legs of unknown distance are never added unless there is no
+    other choice.
+
+    For each truck, the cheapest insertion of each city is cached until the
+    truck's route changes, and only one route changes per parcel, so each
+    parcel takes O(T) time for T trucks, plus O(R) for a route of R stops each
+    time a cached insertion is recomputed.
+
+    === Private Attributes ===
+    _dmap:
+        The distances that insertion costs are computed from.
+
+    === Sample Usage ===
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Hamilton', 'London', 4)
+    >>> m.add_distance('London', 'Toronto', 11)
+    >>> m.add_distance('Toronto', 'Ottawa', 40)
+    >>> m.add_distance('Ottawa', 'London', 50)
+    >>> m.add_distance('Ottawa', 'Hamilton', 49)
+    >>> config = {'parcel_priority': 'volume',
+    ...           'parcel_order': 'non-increasing',
+    ...           'truck_order': 'non-decreasing'}
+    >>> t1 = Truck(1, 30, 'Toronto')
+    >>> t2 = Truck(2, 30, 'Toronto')
+    >>> parcels = [Parcel(1, 20, 'Toronto', 'London'),
+    ...            Parcel(2, 15, 'Toronto', 'Ottawa'),
+    ...            Parcel(3, 5, 'Toronto', 'Hamilton'),
+    ...            Parcel(4, 5, 'Toronto', 'London')]
+    >>> InsertionScheduler(config, m).schedule(parcels, [t1, t2])
+    []
+    >>> t1.route, t2.route
+    (['Toronto', 'Hamilton', 'London'], ['Toronto', 'Ottawa'])
+    >>> t1.parcel_ids(), t2.parcel_ids()
+    ([1, 3, 4], [2])
+    """
+    _dmap: DistanceMap
+
+    def __init__(self, config: Dict, dmap: DistanceMap) -> None:
+        """Initialize a scheduler that orders parcels and breaks ties between
+        trucks as configured by <config> for GreedyScheduler, and computes
+        insertion costs from <dmap>.
+        """
+        GreedyScheduler.__init__(self, config)
+        self._dmap = dmap
+        # Parcels are not placed by GreedyScheduler.schedule, so there is
+        # nothing for its counters to count.
+        self.counters = None
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> by cheapest insertion, and return
+        a list of the parcels that did not get scheduled onto any truck.
+
+        The route of each truck that gets a parcel is replaced with the route
+        that this scheduler plans for it.
+        """
+        matrix = self._dmap.matrix()
+        lookup = matrix.cities.lookup
+        unknown = {}
+
+        def city_id(name: str) -> int:
+            # Cities that are not in the matrix get ids of their own, past
+            # the end of the matrix, so every distance to them is unknown.
+            i = unknown.get(name, lookup(name))
+            if i < 0:
+                i = len(matrix.cities) + len(unknown)
+                unknown[name] = i
+            return i
+
+        names = [list(truck.route) for truck in trucks]
+        routes = [[city_id(city) for city in route] for route in names]
+        on_route = [set(route) for route in routes]
+        # cached[i] maps a city id to its cheapest insertion into routes[i].
+        cached = [{} for _ in trucks]
+
+        unsked = []
+        trace = PlacementTrace(self.verbose_every) if verbose else None
+        for p in self._order_parcels(parcels):
+            dest = city_id(p.dest)
+            best = None
+            for i, truck in enumerate(trucks):
+                avail = truck.avail
+                if avail < p.p_vol:
+                    continue
+                if dest in on_route[i]:
+                    cost, k = 0, -1
+                else:
+                    if dest not in cached[i]:
+                        cached[i][dest] = _cheapest_insertion(routes[i], dest,
+                                                              matrix)
+                    cost, k = cached[i][dest]
+                key = (cost, -avail if self._t_most_avail else avail, i)
+                if best is None or key < best[0]:
+                    best = (key, i, k)
+
+            if best is None:
+                unsked.append(p)
+                if trace is not None:
+                    trace.placed(p, None)
+                continue
+            _, i, k = best
+            if k >= 0:
+                routes[i].insert(k + 1, dest)
+                names[i].insert(k + 1, p.dest)
+                on_route[i].add(dest)
+                cached[i] = {}
+            truck = trucks[i]
+            hops = len(truck.route)
+            truck.pack(p)
+            if len(truck.route) != hops:
+                truck.set_route(names[i])
+            if trace is not None:
+                trace.placed(p, truck)
+
+        if trace is not None:
+            trace.finish()
+        return unsked
+
+
+class BinPackingScheduler(Scheduler):
+    """Schedule parcels onto trucks as a bin-packing problem: parcels are taken
+    largest first, and each goes on a truck chosen by the fit rule of the
+    subclass, regardless of its destination.
+
+    This is an abstract class.  Only child classes should be instantiated.
+    """
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> in non-increasing order of volume,
+        with ties in the order of <parcels>, and return a list of the parcels
+        that did not get scheduled onto any truck.
+
+        <parcels> may also be a ParcelStore, with <trucks> the trucks of a
+        FleetStore over it.
+        """
+        if isinstance(parcels, ParcelStore):
+            ordered = parcels.sorted_views('p_vol', True)
+        else:
+            ordered = sorted(parcels, key=attrgetter('p_vol'), reverse=True)
+
+        unsked = []
+        trace = PlacementTrace(self.verbose_every) if verbose else None
+        self._start([truck.avail for truck in trucks])
+        for p in ordered:
+            i = self._fit(p.p_vol)
+            if i == -1:
+                unsked.append(p)
             else:
+                trucks[i].pack(p)
+                self._packed(i, trucks[i].avail)
+            if trace is not None:
+                trace.placed(p, None if i == -1 else trucks[i])
+        if trace is not None:
+            trace.finish()
+        return unsked
+
+    def _start(self, avail: List[int]) -> None:
+        """Start scheduling onto trucks with the available space in <avail>.
+        """
+        raise NotImplementedError
+
+    def _fit(self, vol: int) -> int:
+        """Return the position of the truck that a parcel with volume <vol>
+        should go on, or -1 if no truck has enough available space.
+        """
+        raise NotImplementedError
+
+    def _packed(self, i: int, avail: int) -> None:
+        """Record that the truck at position <i>, which was just chosen by
+        _fit, now has <avail> available space.
+        """
+        raise NotImplementedError
+
+
+class FirstFitScheduler(BinPackingScheduler):
+    """Schedule parcels by First-Fit-Decreasing: each parcel, largest first,
+    goes on the first truck with enough available space, found in O(log T)
+    time with a FirstFitTree.
+
+    === Private Attributes ===
+    _tree:
+        The tree over the trucks being scheduled, or None before scheduling.
+
+    === Sample Usage ===
+    >>> trucks = [Truck(1, 10, 'York'), Truck(2, 25, 'York')]
+    >>> parcels = [Parcel(1, 5, 'York', 'Toronto'),
+    ...            Parcel(2, 20, 'York', 'Toronto'),
+    ...            Parcel(3, 8, 'York', 'London')]
+    >>> FirstFitScheduler().schedule(parcels, trucks)
+    []
+    >>> [t.parcel_ids() for t in trucks]
+    [[3], [2, 1]]
+    """
+    _tree: Optional[FirstFitTree]
+
+    def __init__(self) -> None:
+        """Initialize a First-Fit-Decreasing scheduler.
+        """
+        self._tree = None
+
+    def _start(self, avail: List[int]) -> None:
+        """Build the segment tree over the available space in <avail>.
+        """
+        self._tree = FirstFitTree(avail)
+
+    def _fit(self, vol: int) -> int:
+        """Return the position of the first truck in the segment tree with at
+        least <vol> available space, or -1 if there is none.
+        """
+        return self._tree.first_fit(vol)
+
+    def _packed(self, i: int, avail: int) -> None:
+        """Update the segment tree with the new available space <avail> of
+        the truck at position <i>.
+        """
+        self._tree.update(i, avail)
+
+
+class BestFitScheduler(BinPackingScheduler):
+    """Schedule parcels by Best-Fit-Decreasing: each parcel, largest first,
+    goes on the truck with the least available space that still fits it,
+    found by binary search in a BestFitIndex.
+
+    === Private Attributes ===
+    _index:
+        The index over the trucks being scheduled, or None before scheduling.
+
+    === Sample Usage ===
+    >>> trucks = [Truck(1, 30, 'York'), Truck(2, 25, 'York')]
+    >>> parcels = [Parcel(1, 5, 'York', 'Toronto'),
+    ...            Parcel(2, 20, 'York', 'Toronto'),
+    ...            Parcel(3, 8, 'York', 'London')]
+    >>> BestFitScheduler().schedule(parcels, trucks)
+    []
+    >>> [t.parcel_ids() for t in trucks]
+    [[3], [2, 1]]
+    """
+    _index: Optional[BestFitIndex]
+
+    def __init__(self) -> None:
+        """Initialize a Best-Fit-Decreasing scheduler.
+        """
+        self._index = None
+
+    def _start(self, avail: List[int]) -> None:
+        """Build the sorted index over the available space in <avail>.
+        """
+        self._index = BestFitIndex(avail)
+
+    def _fit(self, vol: int) -> int:
+        """Return the position of the truck with the least available space
+        of at least <vol>, found in the sorted index, or -1 if there is none.
+        """
+        return self._index.best_fit(vol)
+
+    def _packed(self, i: int, avail: int) -> None:
+        """Move the truck at position <i> to its new available space <avail>
+        in the sorted index.
+        """
+        self._index.update(i, avail)
+
+
+class WorstFitScheduler(BinPackingScheduler):
+    """Schedule parcels by Worst-Fit-Decreasing: each parcel, largest first,
+    goes on the truck with the most available space, found at the top of a
+    WorstFitHeap.  This spreads parcels evenly over the trucks.
+
+    === Private Attributes ===
+    _heap:
+        The heap over the trucks being scheduled, or None before scheduling.
+
+    === Sample Usage ===
+    >>> trucks = [Truck(1, 30, 'York'), Truck(2, 25, 'York')]
+    >>> parcels = [Parcel(1, 5, 'York', 'Toronto'),
+    ...            Parcel(2, 20, 'York', 'Toronto'),
+    ...            Parcel(3, 8, 'York', 'London')]
+    >>> WorstFitScheduler().schedule(parcels, trucks)
+    []
+    >>> [t.parcel_ids() for t in trucks]
+    [[2], [3, 1]]
+    """
+    _heap: Optional[WorstFitHeap]
+
+    def __init__(self) -> None:
+        """Initialize a Worst-Fit-Decreasing scheduler.
+        """
+        self._heap = None
+
+    def _start(self, avail: List[int]) -> None:
+        """Build the heap over the available space in <avail>.
+        """
+        self._heap = WorstFitHeap(avail)
+
+    def _fit(self, vol: int) -> int:
+        """Return the position of the truck at the top of the heap, which has
+        the most available space, if it is at least <vol>, or -1 otherwise.
+        """
+        return self._heap.worst_fit(vol)
+
+    def _packed(self, i: int, avail: int) -> None:
+        """Give the truck at the top of the heap, which is the truck at
+        position <i>, its new available space <avail>.
+        """
+        self._heap.update_worst(avail)
+
+
+class BranchAndBoundScheduler(GreedyScheduler):
+    """Schedule parcels onto trucks by branch and bound, to leave as few
+    parcels unscheduled as possible and then to make the routes as short as
+    possible, within a time budget.
+
+    The search starts from the greedy schedule configured as for
+    GreedyScheduler, and gives the parcels, largest first, to each truck that
+    fits them in turn, or to no truck.  Routes are built by cheapest insertion
+    as in InsertionScheduler, so a schedule is only as short as its insertion
+    routes.  A branch is cut off when even the LP relaxation of the rest of
+    the problem, which packs the smallest remaining parcels into the total
+    space left as if it were one truck, cannot schedule more parcels than the
+    best schedule found, or can only tie it and the routes are already longer.
+    Routes are assumed to only grow as stops are added, as they do when
+    distances obey the triangle inequality.
+
+    If the search finishes within the budget, the schedule is optimal in this
+    sense.  Otherwise the best schedule found is used, and search_stats tells
+    how far it may be from optimal.
+
+    === Public Attributes ===
+    time_budget:
+        The longest time, in seconds, that one call to schedule searches for.
+    search_stats:
+        Statistics on the last call to schedule: the number of parcels left
+        'unscheduled' by the greedy 'warm_start' and by the schedule used,
+        the 'lower_bound' on the number of parcels any schedule leaves
+        unscheduled, their difference as the 'gap', the 'distance' of the
+        planned routes, the number of 'nodes' searched, the 'seconds' spent
+        and whether the schedule is 'optimal'.
+
+    === Private Attributes ===
+    _dmap:
+        The distances that routes are planned with.
+
+    === Sample Usage ===
+    >>> m = DistanceMap()
+    >>> m.add_distance('Toronto', 'Hamilton', 9)
+    >>> m.add_distance('Toronto', 'London', 15)
+    >>> m.add_distance('Hamilton', 'London', 8)
+    >>> config = {'parcel_priority': 'volume',
+    ...           'parcel_order': 'non-decreasing',
+    ...           'truck_order': 'non-increasing'}
+    >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 10, 'Toronto')]
+    >>> parcels = [Parcel(1, 7, 'Toronto', 'Hamilton'),
+    ...            Parcel(2, 6, 'Toronto', 'London'),
+    ...            Parcel(3, 4, 'Toronto', 'Hamilton'),
+    ...            Parcel(4, 3, 'Toronto', 'London')]
+    >>> scheduler = BranchAndBoundScheduler(config, m)
+    >>> scheduler.schedule(parcels, trucks)
+    []
+    >>> [t.parcel_ids() for t in trucks]
+    [[1, 4], [2, 3]]
+    >>> [t.route for t in trucks]
+    [['Toronto', 'London', 'Hamilton'], ['Toronto', 'Hamilton', 'London']]
+    >>> stats = scheduler.search_stats
+    >>> stats['warm_start'], stats['unscheduled'], stats['gap']
+    (1, 0, 0)
+    >>> stats['optimal']
+    True
+    """
+    time_budget: float
+    search_stats: Dict[str, Union[int, float, bool]]
+    _dmap: DistanceMap
+
+    def __init__(self, config: Dict, dmap: DistanceMap,
+                 time_budget: float = OPTIMIZE_TIME_BUDGET) -> None:
+        """Initialize a scheduler that warm-starts from the greedy schedule
+        configured by <config>, plans routes with <dmap>, and searches for at
+        most <time_budget> seconds per call to schedule.
+        """
+        GreedyScheduler.__init__(self, config)
+        self._dmap = dmap
+        self.time_budget = time_budget
+        self.search_stats = {}
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> by branch and bound, and return a
+        list of the parcels that did not get scheduled onto any truck.
+
+        The route of each truck that gets a parcel is replaced with the route
+        that this scheduler plans for it.
+        """
+        start = time.perf_counter()
+        ordered = sorted(parcels, key=attrgetter('p_vol'), reverse=True)
+
+        # Schedule onto copies of the trucks for the warm start.
+        copies = []
+        for truck in trucks:
+            copy = Truck(truck.t_id, truck.avail, truck.dep)
+            copy.set_route(truck.route)
+            copies.append(copy)
+        GreedyScheduler.schedule(self, ordered, copies)
+        position = {}
+        for i, copy in enumerate(copies):
+            for p in copy.par:
+                position[id(p)] = i
+        warm = [position.get(id(p), -1) for p in ordered]
+
+        search = _BranchAndBound(ordered, trucks, self._dmap.matrix())
+        best = search.run(warm, start + self.time_budget)
+        routes = search.plan_routes(best)
+
+        unsked = []
+        for p, i in zip(ordered, best):
+            if i < 0:
                 unsked.append(p)
+            else:
+                trucks[i].pack(p)
+        for truck, route in zip(trucks, routes):
+            if truck.route != route:
+                truck.set_route(route)
 
+        lower_bound = len(ordered) - search.root_bound
+        if search.finished:
+            lower_bound = len(unsked)
+        self.search_stats = {
+            'warm_start': warm.count(-1),
+            'unscheduled': len(unsked),
+            'lower_bound': lower_bound,
+            'gap': len(unsked) - lower_bound,
+            'distance': search.best_dist,
+            'nodes': search.nodes,
+            'seconds': time.perf_counter() - start,
+            'optimal': search.finished
+        }
         return unsked
 
 
+class _BranchAndBound:
+    """The search of a BranchAndBoundScheduler over the ways of assigning
+    parcels, largest first, to trucks.
+
+    Trucks are referred to by their position in the list of trucks, and an
+    assignment is a list whose item d is the position of the truck that
+    parcel d goes on, or -1 if it is left unscheduled.
+
+    === Public Attributes ===
+    root_bound:
+        The most parcels that the LP relaxation allows any schedule to pack.
+    best_dist:
+        The length of the routes planned for the best assignment found.
+    nodes:
+        The number of partial assignments searched.
+    finished:
+        Whether the search was finished before its deadline.
+
+    === Private Attributes ===
+    _vols:
+        The volume of each parcel, in non-increasing order.
+    _neg_vols:
+        The negated volume of each parcel, in non-decreasing order.
+    _dests:
+        The id of the destination of each parcel.
+    _dest_names:
+        The destination of each parcel.
+    _smallest:
+        _smallest[k] is the total volume of the k smallest parcels.
+    _matrix:
+        The distances that insertion costs are computed from.
+    _unknown:
+        The ids given to cities that are not in <_matrix>.
+    _avail:
+        The available space of each truck.
+    _total:
+        The total available space of all trucks.
+    _routes:
+        The route of each truck, as city ids.
+    _names:
+        The route each truck had before the search.
+    _stops:
+        For each truck, the number of its parcels bound for each city on its
+        route.  Cities on its route before the search count once more, so
+        that they are never removed.
+    _loads:
+        The number of parcels given to each truck.
+    _count, _dist:
+        The number of parcels packed and the length of the routes in the
+        current partial assignment.
+    _assign:
+        The current partial assignment.
+    _best, _best_count:
+        The best complete assignment found and the number of parcels it
+        packs.
+
+    === Representation Invariants ===
+    - _vols is sorted in non-increasing order.
+    - _avail[i] >= 0 for every truck i, and _total == sum(_avail)
+    """
+    root_bound: int
+    best_dist: int
+    nodes: int
+    finished: bool
+    _vols: List[int]
+    _neg_vols: List[int]
+    _dests: List[int]
+    _dest_names: List[str]
+    _smallest: List[int]
+    _matrix: DistanceMatrix
+    _unknown: Dict[str, int]
+    _avail: List[int]
+    _total: int
+    _routes: List[List[int]]
+    _names: List[List[str]]
+    _stops: List[Dict[int, int]]
+    _loads: List[int]
+    _count: int
+    _dist: int
+    _assign: List[int]
+    _best: List[int]
+    _best_count: int
+
+    def __init__(self, parcels: List[Parcel], trucks: List[Truck],
+                 matrix: DistanceMatrix) -> None:
+        """Initialize a search for assigning <parcels> to <trucks>, with
+        routes planned according to <matrix>.
+
+        Precondition: <parcels> are in non-increasing order of volume.
+        """
+        self._matrix = matrix
+        self._unknown = {}
+        self._vols = [p.p_vol for p in parcels]
+        self._neg_vols = [-vol for vol in self._vols]
+        self._dest_names = [p.dest for p in parcels]
+        self._dests = [self._city_id(p.dest) for p in parcels]
+        self._smallest = [0]
+        for vol in reversed(self._vols):
+            self._smallest.append(self._smallest[-1] + vol)
+
+        self._avail = [truck.avail for truck in trucks]
+        self._total = sum(self._avail)
+        self._names = [list(truck.route) for truck in trucks]
+        self._routes = [[self._city_id(city) for city in route]
+                        for route in self._names]
+        self._stops = [dict.fromkeys(route, 1) for route in self._routes]
+        self._loads = [0] * len(trucks)
+        self._count = 0
+        self._dist = 0
+        self._assign = [-1] * len(parcels)
+
+        self._best = list(self._assign)
+        self._best_count = 0
+        self.best_dist = 0
+        self.root_bound = self._bound(0)
+        self.nodes = 0
+        self.finished = False
+
+    def _city_id(self, name: str) -> int:
+        """Return the id of the city <name> in the matrix of this search.
+        """
+        # Cities that are not in the matrix get ids of their own, past the
+        # end of the matrix, so every distance to them is unknown.
+        i = self._unknown.get(name, self._matrix.cities.lookup(name))
+        if i < 0:
+            i = len(self._matrix.cities) + len(self._unknown)
+            self._unknown[name] = i
+        return i
+
+    def run(self, warm: List[int], deadline: float) -> List[int]:
+        """Search for the best assignment, starting from the assignment
+        <warm>, until the search is finished or time.perf_counter() passes
+        <deadline>, and return the best assignment found.
+
+        Precondition: <warm> is a feasible assignment.
+        """
+        self._record(warm)
+        if not self._vols:
+            self.finished = True
+            return self._best
+        # Each frame holds the depth of a parcel, the choices of truck for
+        # it, the number of choices tried, and how to undo the last one.
+        stack = [[0, self._choices(0), 0, None]]
+        while stack:
+            if self.nodes % 256 == 0 and time.perf_counter() > deadline:
+                return self._best
+            frame = stack[-1]
+            d, choices, tried, undo = frame
+            if undo is not None:
+                self._unplace(d, undo)
+                frame[3] = None
+            if tried == len(choices):
+                stack.pop()
+                continue
+            frame[2] += 1
+            frame[3] = self._place(d, choices[tried])
+            self.nodes += 1
+
+            if d + 1 == len(self._vols):
+                if (self._count, -self._dist) > (self._best_count,
+                                                 -self.best_dist):
+                    self._best = list(self._assign)
+                    self._best_count = self._count
+                    self.best_dist = self._dist
+                continue
+            bound = self._bound(d + 1)
+            if bound > self._best_count or (bound == self._best_count
+                                            and self._dist < self.best_dist):
+                stack.append([d + 1, self._choices(d + 1), 0, None])
+
+        self.finished = True
+        return self._best
+
+    def plan_routes(self, assign: List[int]) -> List[List[str]]:
+        """Return the route of each truck, as city names, when parcels are
+        assigned by <assign>.
+        """
+        routes = [list(route) for route in self._names]
+        undos = []
+        for d, i in enumerate(assign):
+            undo = self._place(d, i)
+            if undo[1] >= 0:
+                routes[i].insert(undo[1], self._dest_names[d])
+            undos.append(undo)
+        for d in range(len(assign) - 1, -1, -1):
+            self._unplace(d, undos[d])
+        return routes
+
+    def _record(self, assign: List[int]) -> None:
+        """Record the complete assignment <assign> as the best one found.
+        """
+        undos = [self._place(d, i) for d, i in enumerate(assign)]
+        self._best = list(assign)
+        self._best_count = self._count
+        self.best_dist = self._dist
+        for d in range(len(assign) - 1, -1, -1):
+            self._unplace(d, undos[d])
+
+    def _bound(self, d: int) -> int:
+        """Return the most parcels that the LP relaxation allows to be packed
+        when parcels 0 to d - 1 are assigned as they are now.
+        """
+        if not self._avail:
+            return self._count
+        # Only the parcels that fit on some truck can be packed, and those
+        # are the smallest ones, at positions first and after.
+        first = bisect_left(self._neg_vols, -max(self._avail), d)
+        fitting = len(self._vols) - first
+        extra = bisect_right(self._smallest, self._total, 0, fitting + 1) - 1
+        return self._count + extra
+
+    def _choices(self, d: int) -> List[int]:
+        """Return the trucks that parcel <d> may go on, cheapest insertion
+        first, followed by -1 for leaving it unscheduled.
+
+        Of the trucks that have no parcels yet, only one with each available
+        space and route is tried, since the others would give the same
+        schedules.
+        """
+        vol, dest = self._vols[d], self._dests[d]
+        options = []
+        seen = set()
+        for i, avail in enumerate(self._avail):
+            if avail < vol:
+                continue
+            if self._loads[i] == 0:
+                key = (avail, tuple(self._routes[i]))
+                if key in seen:
+                    continue
+                seen.add(key)
+            if dest in self._stops[i]:
+                cost = 0
+            else:
+                cost = _cheapest_insertion(self._routes[i], dest,
+                                           self._matrix)[0]
+            options.append((cost, i))
+        options.sort()
+        return [i for _, i in options] + [-1]
+
+    def _place(self, d: int, i: int) -> Tuple[int, int, int]:
+        """Assign parcel <d> to truck <i>, or leave it unscheduled if <i> is
+        -1, and return how to undo it: the truck, the position its route
+        grew at or -1, and the amount its route grew by.
+        """
+        if i < 0:
+            return -1, -1, 0
+        vol, dest = self._vols[d], self._dests[d]
+        self._assign[d] = i
+        self._avail[i] -= vol
+        self._total -= vol
+        self._loads[i] += 1
+        self._count += 1
+        stops = self._stops[i]
+        stops[dest] = stops.get(dest, 0) + 1
+        if stops[dest] > 1:
+            return i, -1, 0
+        cost, k = _cheapest_insertion(self._routes[i], dest, self._matrix)
+        self._routes[i].insert(k + 1, dest)
+        self._dist += cost
+        return i, k + 1, cost
+
+    def _unplace(self, d: int, undo: Tuple[int, int, int]) -> None:
+        """Undo the assignment of parcel <d>, given what _place returned for
+        it.
+        """
+        i, k, cost = undo
+        if i < 0:
+            return
+        vol, dest = self._vols[d], self._dests[d]
+        self._assign[d] = -1
+        self._avail[i] += vol
+        self._total += vol
+        self._loads[i] -= 1
+        self._count -= 1
+        self._stops[i][dest] -= 1
+        if self._stops[i][dest] == 0:
+            del self._stops[i][dest]
+        if k >= 0:
+            del self._routes[i][k]
+            self._dist -= cost
+
+
+def _cheapest_insertion(route: List[int], city: int,
+                        matrix: DistanceMatrix) -> Tuple[int, int]:
+    """Return the least amount by which inserting <city> lengthens the closed
+    tour <route> of city ids, which returns to route[0], according to
+    <matrix>, and the position k in <route> that <city> is inserted after to
+    achieve it.  Legs of unknown distance count as _UNKNOWN_LEG.
+    """
+    def leg(a: int, b: int) -> int:
+        if a == b:
+            return 0
+        d = matrix.distance_by_id(a, b)
+        return d if d >= 0 else _UNKNOWN_LEG
+
+    best, best_k = None, 0
+    for k, a in enumerate(route):
+        b = route[k + 1] if k + 1 < len(route) else route[0]
+        cost = leg(a, city) + leg(city, b) - leg(a, b)
+        if best is None or cost < best:
+            best, best_k = cost, k
+    return best, best_k
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
 
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['compare_algorithms'],
+        'allowed-io': ['compare_algorithms', 'PlacementTrace.placed',
+                       'PlacementTrace.finish'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'random', 'container', 'domain'],
+                                   'random', 'time', 'operator', 'bisect',
+                                   'heapq',
+                                   'container', 'domain', 'distance_map',
+                                   'store', 'profiling'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
@@ -0,0 +1,418 @@
+"""Assignment 1 - Scheduling service
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module contains class SchedulingService, an asyncio server that keeps one
+fleet of trucks in memory and schedules parcels onto it with the greedy
+algorithm as clients send them, so that many clients can share one warm
+scheduler instead of each reading the data files again.
+
+Clients connect over TCP and send one JSON object per line.  A parcel request
+has the keys 'p_id', 'p_vol', 'source' and 'dest', and is answered with a line
+{"p_id": ..., "truck": ..., "latency_ms": ...}, where "truck" is the id of the
+truck the parcel was packed onto, or null if no truck had enough space.  The
+request {"op": "stats"} is answered with the statistics of the service (see
+SchedulingService.stats).  A request that cannot be understood is answered
+with {"error": ...}, as is a parcel whose volume is not positive or whose
+source or destination is empty, and a request that could not be scheduled
+because its micro-batch failed or the service closed.  Each client's answers
+come back in the order of its requests.
+
+Requests from all clients are coalesced into micro-batches: the service waits
+up to <batch_delay> seconds after the first request of a batch for up to
+<max_batch> requests, and then schedules them together in priority order, as
+GreedyScheduler.schedule would.  At most <max_pending> requests wait to be
+scheduled at once; beyond that, the service stops reading from its clients
+until the backlog clears.
+"""
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+import time
+from domain import Parcel, Fleet
+from distance_map import DistanceMap
+from scheduler import GreedySession
+from experiment import binary_kind, load_trucks, read_trucks, \
+    load_distance_map, read_distance_map
+
+# The default limits on micro-batches and waiting requests.
+MAX_BATCH = 256
+BATCH_DELAY = 0.002
+MAX_PENDING = 4096
+
+
+class SchedulingError(Exception):
+    """Raised when a request to a SchedulingService could not be scheduled,
+    because scheduling its micro-batch failed or the service was closed.
+    """
+
+
+class SchedulingService:
+    """A service that schedules parcels sent by clients onto one fleet of
+    trucks.
+
+    === Public Attributes ===
+    fleet:
+        The trucks that parcels are scheduled onto.
+    max_batch:
+        The largest number of requests scheduled together.
+    batch_delay:
+        The longest time, in seconds, that the first request of a batch waits
+        for more requests to join it.
+
+    === Private Attributes ===
+    _session:
+        The greedy session that packs <fleet>.
+    _pending:
+        The requests waiting to be scheduled: each parcel, the future for its
+        truck id and latency, and the time it arrived.
+    _batch:
+        The requests taken from <_pending> for the micro-batch being
+        collected or scheduled.
+    _server:
+        The TCP server, or None if the service is not started.
+    _batcher:
+        The task that schedules micro-batches, or None if the service is not
+        started.
+    _requests:
+        The number of parcels scheduled (or found not to fit) so far.
+    _unscheduled:
+        The number of parcels that did not fit on any truck so far.
+    _batches:
+        The number of micro-batches scheduled so far.
+    _total_latency:
+        The sum of the latencies, in seconds, of all <_requests> requests.
+    _max_latency:
+        The largest latency, in seconds, of any request so far.
+
+    === Representation Invariants ===
+    - max_batch > 0 and batch_delay >= 0
+    - 0 <= _unscheduled <= _requests
+    - Trucks in <fleet> are only packed through <_session>.
+
+    === Sample Usage ===
+    >>> config = {'parcel_priority': 'volume',
+    ...           'parcel_order': 'non-increasing',
+    ...           'truck_order': 'non-increasing'}
+    >>> fleet = read_trucks('data/truck-data-small.txt', 'Toronto')
+    >>> service = SchedulingService(config, fleet)
+    >>> async def demo():
+    ...     truck, _ = await service.schedule(Parcel(1, 20, 'Toronto', 'York'))
+    ...     await service.close()
+    ...     return truck
+    >>> asyncio.run(demo())
+    140
+    """
+    fleet: Fleet
+    max_batch: int
+    batch_delay: float
+    _session: GreedySession
+    _pending: asyncio.Queue
+    _batch: List[Tuple[Parcel, asyncio.Future, float]]
+    _server: Optional[asyncio.AbstractServer]
+    _batcher: Optional[asyncio.Task]
+    _requests: int
+    _unscheduled: int
+    _batches: int
+    _total_latency: float
+    _max_latency: float
+
+    def __init__(self, config: Dict[str, Union[str, bool]], fleet: Fleet,
+                 max_batch: int = MAX_BATCH,
+                 batch_delay: float = BATCH_DELAY,
+                 max_pending: int = MAX_PENDING,
+                 dmap: Optional[DistanceMap] = None) -> None:
+        """Initialize a service that schedules parcels onto <fleet> with the
+        greedy algorithm configured by <config> and the distances in <dmap>,
+        as in GreedyScheduler.
+
+        Precondition: max_batch > 0, batch_delay >= 0 and max_pending > 0,
+        and <dmap> is not None if <config> has 'nearby_depots'.
+        """
+        self.fleet = fleet
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self._session = GreedySession(config, fleet.trucks, dmap)
+        self._pending = asyncio.Queue(max_pending)
+        self._batch = []
+        self._server = None
+        self._batcher = None
+        self._requests = 0
+        self._unscheduled = 0
+        self._batches = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    async def start(self, host: str = '127.0.0.1',
+                    port: int = 0) -> Tuple[str, int]:
+        """Start serving clients on <host> and <port>, and return the address
+        the service is listening on.  If <port> is 0, any free port is used.
+        """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self) -> None:
+        """Stop serving clients and scheduling batches.
+
+        Every request that has not been scheduled yet fails with a
+        SchedulingError.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._batcher is not None:
+            batcher, self._batcher = self._batcher, None
+            batcher.cancel()
+            try:
+                await batcher
+            except asyncio.CancelledError:
+                pass
+
+        error = SchedulingError('the scheduling service was closed')
+        unsettled = self._batch
+        self._batch = []
+        while not self._pending.empty():
+            unsettled.append(self._pending.get_nowait())
+        for _, result, _ in unsettled:
+            if not result.done():
+                result.set_exception(error)
+
+    async def schedule(self, parcel: Parcel) -> Tuple[Optional[int], float]:
+        """Schedule <parcel> with the next micro-batch, and return the id of
+        the truck it was packed onto (or None if no truck had enough space)
+        and its latency in seconds.
+
+        Wait for room first if <max_pending> requests are already waiting.
+        Raise SchedulingError if the request could not be scheduled.
+        """
+        result = asyncio.get_running_loop().create_future()
+        await self._pending.put((parcel, result, time.perf_counter()))
+        # Start the batcher only once the request is queued, so that a request
+        # that was waiting for room while the service closed is still served.
+        if self._batcher is None:
+            self._batcher = asyncio.create_task(self._run_batches())
+        return await result
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return the statistics of this service: the number of 'requests'
+        and 'batches' scheduled, the number of requests left 'unscheduled',
+        the mean and maximum latency in milliseconds, and the number of
+        'nonempty_trucks' and 'unused_space' in the fleet.
+        """
+        mean = 0.0
+        if self._requests > 0:
+            mean = self._total_latency / self._requests
+        return {
+            'requests': self._requests,
+            'batches': self._batches,
+            'unscheduled': self._unscheduled,
+            'mean_latency_ms': mean * 1000,
+            'max_latency_ms': self._max_latency * 1000,
+            'nonempty_trucks': self.fleet.num_nonempty_trucks(),
+            'unused_space': self.fleet.total_unused_space()
+        }
+
+    async def _next_batch(self) -> None:
+        """Wait for the next request, and collect it in <_batch> together with
+        the requests that arrive within <batch_delay> seconds of it, up to
+        <max_batch> requests in all.
+
+        Precondition: <_batch> is empty.
+        """
+        batch = self._batch
+        batch.append(await self._pending.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_delay
+        while len(batch) < self.max_batch:
+            if not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._pending.get(),
+                                                    remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run_batches(self) -> None:
+        """Schedule micro-batches of waiting requests for as long as this
+        service runs, and settle the future of every request.
+
+        If scheduling a batch fails, each of its requests fails with a
+        SchedulingError, and later batches are still scheduled.
+        """
+        while True:
+            await self._next_batch()
+            batch = self._batch
+            self._batch = []
+            try:
+                assigned = self._session.assign_batch([p for p, _, _ in batch])
+            except Exception as error:
+                failure = SchedulingError(f'scheduling failed: {error!r}')
+                failure.__cause__ = error
+                for _, result, _ in batch:
+                    if not result.done():
+                        result.set_exception(failure)
+                continue
+            done = time.perf_counter()
+            self._batches += 1
+            for (_, result, arrived), t_id in zip(batch, assigned):
+                latency = done - arrived
+                self._requests += 1
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+                if t_id is None:
+                    self._unscheduled += 1
+                if not result.done():
+                    result.set_result((t_id, latency))
+
+    async def _answer(self, line: bytes) -> Dict[str, Union[int, float, str,
+                                                            None]]:
+        """Return the answer to the request on <line>.
+        """
+        try:
+            request = json.loads(line)
+            if request.get('op', 'schedule') == 'stats':
+                return self.stats()
+            parcel = Parcel(int(request['p_id']), int(request['p_vol']),
+                            str(request['source']), str(request['dest']))
+            # The fleet is shared, so a parcel that would free space on a
+            # truck, or that has nowhere to go, must never reach it.
+            if parcel.p_vol <= 0:
+                raise ValueError('p_vol must be positive')
+            if not parcel.source.strip() or not parcel.dest.strip():
+                raise ValueError('source and dest must not be empty')
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return {'error': f'bad request: {error!r}'}
+
+        try:
+            t_id, latency = await self.schedule(parcel)
+        except SchedulingError as error:
+            return {'p_id': parcel.p_id, 'error': str(error)}
+        return {'p_id': parcel.p_id, 'truck': t_id,
+                'latency_ms': latency * 1000}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one client, in order, until it disconnects.
+
+        Requests are read ahead of their answers, so that requests from one
+        client can share a micro-batch, but no more than <max_pending> at a
+        time.
+        """
+        answers = asyncio.Queue(self._pending.maxsize)
+        replier = asyncio.create_task(self._reply(answers, writer))
+        try:
+            async for line in reader:
+                if line.strip():
+                    await answers.put(asyncio.create_task(self._answer(line)))
+        finally:
+            try:
+                await answers.put(None)
+                await replier
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
+
+    @staticmethod
+    async def _reply(answers: asyncio.Queue,
+                     writer: asyncio.StreamWriter) -> None:
+        """Write each answer from <answers> to <writer> as a line of JSON, in
+        order, until None is taken from <answers>.
+        """
+        connected = True
+        while True:
+            answer = await answers.get()
+            if answer is None:
+                return
+            line = json.dumps(await answer).encode() + b'\n'
+            if connected:
+                writer.write(line)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    # Keep taking answers so that the client's handler is
+                    # never blocked, but stop writing them.
+                    connected = False
+
+
+def read_fleet(config: Dict[str, Union[str, bool]]) -> Fleet:
+    """Return a Fleet of the empty trucks in the truck file specified in
+    <config>, which may be a text or a binary truck file.
+
+    Precondition: <config> contains the keys 'truck_file' and
+    'depot_location' as specified in Assignment 1.
+    """
+    if binary_kind(config['truck_file']) == 'trucks':
+        fleet = Fleet()
+        for truck in load_trucks(config['truck_file']):
+            fleet.add_truck(truck)
+        return fleet
+    return read_trucks(config['truck_file'], config['depot_location'])
+
+
+def read_map(config: Dict[str, Union[str, bool]]) -> DistanceMap:
+    """Return a DistanceMap of the distances in the map file specified in
+    <config>, which may be a text or a binary map file, completed if
+    <config> has 'complete_map' set to True.
+
+    Precondition: <config> contains the key 'map_file' as specified in
+    Assignment 1.
+    """
+    complete = config.get('complete_map', False)
+    if binary_kind(config['map_file']) == 'map':
+        return load_distance_map(config['map_file'], complete)
+    return read_distance_map(config['map_file'], complete)
+
+
+def serve(config_file: str, host: str = '127.0.0.1', port: int = 8148) -> None:
+    """Serve clients on <host> and <port> until interrupted, scheduling their
+    parcels onto the trucks of the problem defined in <config_file> with the
+    greedy algorithm it configures.
+
+    Precondition: <config_file> is a json file with keys and values
+    as in the dictionary format defined in Assignment 1, with 'algorithm'
+    set to 'greedy'.  If it has 'nearby_depots', the map is read as well.
+    """
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    dmap = None
+    if 'nearby_depots' in config:
+        dmap = read_map(config)
+
+    async def run() -> None:
+        service = SchedulingService(config, read_fleet(config), dmap=dmap)
+        address = await service.start(host, port)
+        print(f'Scheduling parcels on {address[0]}:{address[1]}')
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['serve'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'asyncio', 'json', 'time', 'domain',
+                                   'distance_map', 'scheduler',
+                                   'experiment'],
+        'disable': ['E1136', 'W0703'],
+        'max-attributes': 15,
+    })
+
+    serve('data/demo.json')
@@ -0,0 +1,472 @@
+"""Compact parcel and truck storage
+
+CSC148, Winter 2021
+
+===== Module Description =====
+
+This module contains ParcelStore and FleetStore, which keep parcels and trucks
+in columns of compact arrays instead of one Python object each.  City names
+are interned to integer ids in a CityTable (from module distance_map) shared
+by both stores.
+
+Items are read through the lightweight view classes ParcelView and TruckView.
+These are subclasses of Parcel and Truck with the same attributes and methods,
+so a ParcelStore and the trucks of a FleetStore can be given to
+GreedyScheduler, and a FleetStore answers all of the Fleet statistics.
+"""
+from typing import List, Any, Callable, Iterator, Sequence, Optional, \
+    overload, Dict
+from array import array
+from domain import Parcel, Truck, Fleet
+from distance_map import CityTable
+
+
+class _SeqView(Sequence):
+    """A read-only sequence that presents the items of an array through a
+    function.
+
+    === Private Attributes ===
+    _items:
+        The underlying items.
+    _get:
+        The function applied to each underlying item when it is read.
+    """
+    _items: Sequence[int]
+    _get: Callable[[int], Any]
+
+    def __init__(self, items: Sequence[int], get: Callable[[int], Any]) -> None:
+        """Initialize a view of <items> through <get>.
+        """
+        self._items = items
+        self._get = get
+
+    def __len__(self) -> int:
+        """Return the number of items in this view.
+        """
+        return len(self._items)
+
+    @overload
+    def __getitem__(self, i: int) -> Any:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Any]:
+        ...
+
+    def __getitem__(self, i: Any) -> Any:
+        """Return the item at index <i>, or a list of the items in slice <i>.
+        """
+        if isinstance(i, slice):
+            return [self._get(item) for item in self._items[i]]
+        return self._get(self._items[i])
+
+    def __eq__(self, other: Any) -> bool:
+        """Return True iff <other> is a sequence with the same items in the
+        same order.
+        """
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the items in this view.
+        """
+        return repr(list(self))
+
+
+class ParcelView(Parcel):
+    """A parcel stored in a ParcelStore.
+
+    It has the same attributes as a Parcel, read from the columns of its store.
+
+    === Public Attributes ===
+    store:
+        The ParcelStore holding this parcel.
+    index:
+        The position of this parcel in <store>.
+    """
+    __slots__ = ('store', 'index')
+    store: 'ParcelStore'
+    index: int
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, store: 'ParcelStore', index: int) -> None:
+        """Initialize a view of the parcel at position <index> in <store>.
+        """
+        self.store = store
+        self.index = index
+
+    @property
+    def p_id(self) -> int:
+        """The unique id of this parcel."""
+        return self.store.p_ids[self.index]
+
+    @property
+    def p_vol(self) -> int:
+        """The volume of this parcel in cubic centimeters."""
+        return self.store.p_vols[self.index]
+
+    @property
+    def source(self) -> str:
+        """The source of this parcel."""
+        return self.store.cities.names[self.store.sources[self.index]]
+
+    @property
+    def dest(self) -> str:
+        """The final destination of this parcel."""
+        return self.store.cities.names[self.store.dests[self.index]]
+
+
+class ParcelStore:
+    """A list of parcels stored as columns of compact arrays.
+
+    Indexing or iterating over a ParcelStore gives a ParcelView for each parcel,
+    in the order the parcels were added.
+
+    === Public Attributes ===
+    cities:
+        The table of city names used by <sources> and <dests>.
+    p_ids:
+        The id of each parcel.
+    p_vols:
+        The volume of each parcel.
+    sources:
+        The city id of the source of each parcel.
+    dests:
+        The city id of the destination of each parcel.
+
+    The columns are arrays, except in a store loaded from a binary parcel
+    file, where they are read-only views of the file and no parcels can be
+    added.
+
+    === Representation Invariants ===
+    - <p_ids>, <p_vols>, <sources> and <dests> all have the same length.
+    - Every item of <sources> and <dests> is an id in <cities>.
+
+    === Sample Usage ===
+    >>> ps = ParcelStore()
+    >>> ps.add_parcel(Parcel(342, 10, 'New York', 'Mississauga'))
+    >>> ps.add_parcel(Parcel(343, 25, 'London', 'Vaughan'))
+    >>> len(ps)
+    2
+    >>> ps[1].p_id, ps[1].p_vol, ps[1].source, ps[1].dest
+    (343, 25, 'London', 'Vaughan')
+    >>> [p.dest for p in ps]
+    ['Mississauga', 'Vaughan']
+    """
+    cities: CityTable
+    p_ids: Sequence[int]
+    p_vols: Sequence[int]
+    sources: Sequence[int]
+    dests: Sequence[int]
+
+    def __init__(self, cities: Optional[CityTable] = None) -> None:
+        """Initialize an empty ParcelStore that interns city names in
+        <cities>, or in a new CityTable if <cities> is None.
+        """
+        self.cities = CityTable() if cities is None else cities
+        self.p_ids = array('q')
+        self.p_vols = array('q')
+        self.sources = array('l')
+        self.dests = array('l')
+
+    def __len__(self) -> int:
+        """Return the number of parcels in this store.
+        """
+        return len(self.p_ids)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this store for pickling, with any columns that
+        are views of a file copied into arrays, since views cannot be pickled.
+        """
+        return {name: array(col.format, col) if isinstance(col, memoryview)
+                else col for name, col in self.__dict__.items()}
+
+    def __getitem__(self, i: int) -> ParcelView:
+        """Return a view of the parcel at position <i>.
+        """
+        if i < 0:
+            i += len(self.p_ids)
+        if not 0 <= i < len(self.p_ids):
+            raise IndexError('parcel index out of range')
+        return ParcelView(self, i)
+
+    def __iter__(self) -> Iterator[ParcelView]:
+        """Return an iterator over views of the parcels in this store.
+        """
+        for i in range(len(self.p_ids)):
+            yield ParcelView(self, i)
+
+    def add(self, p_id: int, vol: int, source: str, dest: str) -> None:
+        """Add a parcel with id <p_id>, volume <vol>, source <source> and
+        destination <dest> to this store.
+        """
+        self.p_ids.append(p_id)
+        self.p_vols.append(vol)
+        self.sources.append(self.cities.intern(source))
+        self.dests.append(self.cities.intern(dest))
+
+    def add_parcel(self, parcel: Parcel) -> None:
+        """Add a copy of <parcel> to this store.
+        """
+        self.add(parcel.p_id, parcel.p_vol, parcel.source, parcel.dest)
+
+    def sorted_views(self, attr: str, reverse: bool) -> Sequence[ParcelView]:
+        """Return the parcels in this store in a stable sort by their attribute
+        <attr>, which is either 'p_vol' or 'dest'.  If <reverse> is True, sort
+        in non-increasing order.  Parcels that tie stay in the order they were
+        added, exactly as in sorted(self, key=attrgetter(attr),
+        reverse=reverse).
+
+        Only the positions of the parcels are sorted, so no parcel views are
+        created until they are read.
+
+        >>> ps = ParcelStore()
+        >>> ps.add(1, 10, 'York', 'Toronto')
+        >>> ps.add(2, 20, 'York', 'London')
+        >>> ps.add(3, 10, 'York', 'Hamilton')
+        >>> [p.p_id for p in ps.sorted_views('p_vol', True)]
+        [2, 1, 3]
+        >>> [p.p_id for p in ps.sorted_views('dest', False)]
+        [3, 2, 1]
+        """
+        if attr == 'p_vol':
+            keys = self.p_vols
+        else:
+            ranks = self.cities.ranks()
+            keys = array('l', (ranks[d] for d in self.dests))
+
+        order = array('l', sorted(range(len(keys)), key=keys.__getitem__,
+                                  reverse=reverse))
+        return _SeqView(order, self.__getitem__)
+
+
+class TruckView(Truck):
+    """A truck stored in a FleetStore.
+
+    It has the same attributes and methods as a Truck.  Its attributes are read
+    from the columns of its fleet, and packing it updates those columns.
+    <par> and <route> are read-only sequences.
+
+    === Public Attributes ===
+    fleet:
+        The FleetStore holding this truck.
+    index:
+        The position of this truck in <fleet>.
+    """
+    __slots__ = ('index',)
+    fleet: 'FleetStore'
+    index: int
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, fleet: 'FleetStore', index: int) -> None:
+        """Initialize a view of the truck at position <index> in <fleet>.
+        """
+        self.fleet = fleet
+        self.index = index
+        self._matrix = None
+        self._hops = 1
+        self._open_dist = 0
+
+    @property
+    def t_id(self) -> int:
+        """The unique id of this truck."""
+        return self.fleet.t_ids[self.index]
+
+    @property
+    def cap(self) -> int:
+        """The truck's initial capacity when empty."""
+        return self.fleet.caps[self.index]
+
+    @property
+    def dep(self) -> str:
+        """The truck's assigned depot location."""
+        return self.fleet.parcels.cities.names[self.fleet.deps[self.index]]
+
+    @property
+    def avail(self) -> int:
+        """The available volume in the truck."""
+        return self.fleet.avails[self.index]
+
+    @property
+    def par(self) -> Sequence[ParcelView]:
+        """The parcels contained by the truck, in the order packed."""
+        return _SeqView(self.fleet.truck_parcels(self.index),
+                        self.fleet.parcels.__getitem__)
+
+    @property
+    def route(self) -> Sequence[str]:
+        """The truck's route to deliver parcels."""
+        return _SeqView(self.fleet.truck_route(self.index),
+                        self.fleet.parcels.cities.names.__getitem__)
+
+    def pack(self, parcel: Parcel) -> bool:
+        """Pack the given parcel in the truck if there is enough space
+        available.
+
+        Precondition: <parcel> is a view into the ParcelStore of this truck's
+        fleet.
+        """
+        return self.fleet.pack(self.index, parcel)
+
+    def set_route(self, route: List[str]) -> None:
+        """Replace the route of this truck with <route>.
+
+        Precondition: route[0] is this truck's depot, and <route> visits the
+        destination of every parcel on this truck.
+        """
+        self.fleet.set_route(self.index, route)
+        self._route_changed()
+
+    def num_par(self) -> int:
+        """Return the number of parcels in a truck.
+        """
+        return len(self.fleet.truck_parcels(self.index))
+
+    def parcel_ids(self) -> List[int]:
+        """Return a list of id of each parcels in the truck in order added.
+        """
+        p_ids = self.fleet.parcels.p_ids
+        return [p_ids[i] for i in self.fleet.truck_parcels(self.index)]
+
+
+class FleetStore(Fleet):
+    """A fleet of trucks stored as columns of compact arrays, carrying parcels
+    from a single ParcelStore.
+
+    Its <trucks> are TruckViews, so every Fleet method works on it unchanged.
+
+    === Public Attributes ===
+    parcels:
+        The store of the parcels that trucks in this fleet can carry.  City
+        ids in this fleet are ids in <parcels>.cities.
+    t_ids:
+        The id of each truck.
+    caps:
+        The capacity of each truck when empty.
+    avails:
+        The available volume in each truck.
+    deps:
+        The city id of the depot of each truck.
+
+    === Private Attributes ===
+    _par:
+        The positions in <parcels> of the parcels packed onto each truck, in
+        the order packed.
+    _route:
+        The city ids of the route of each truck.
+
+    === Representation Invariants ===
+    - <trucks>[i] is a TruckView of position i of this fleet.
+    - <t_ids>, <caps>, <avails>, <deps>, <_par> and <_route> all have the same
+      length as <trucks>.
+
+    === Sample Usage ===
+    >>> ps = ParcelStore()
+    >>> ps.add(342, 10, 'New York', 'Mississauga')
+    >>> ps.add(343, 25, 'London', 'Vaughan')
+    >>> f = FleetStore(ps)
+    >>> f.add_truck(Truck(888, 70, 'Toronto'))
+    >>> t = f.trucks[0]
+    >>> t.pack(ps[0])
+    True
+    >>> t.pack(ps[1])
+    True
+    >>> t.avail
+    35
+    >>> t.route
+    ['Toronto', 'Mississauga', 'Vaughan']
+    >>> f.parcel_allocations()
+    {888: [342, 343]}
+    >>> f.average_fullness()
+    50.0
+    """
+    parcels: ParcelStore
+    t_ids: array
+    caps: array
+    avails: array
+    deps: array
+    _par: List[array]
+    _route: List[array]
+
+    def __init__(self, parcels: ParcelStore) -> None:
+        """Create a FleetStore with no trucks, carrying parcels from
+        <parcels>.
+        """
+        Fleet.__init__(self)
+        self.parcels = parcels
+        self.t_ids = array('q')
+        self.caps = array('q')
+        self.avails = array('q')
+        self.deps = array('l')
+        self._par = []
+        self._route = []
+
+    def add_truck(self, truck: Truck) -> None:
+        """Add a copy of <truck> to this fleet.
+
+        Precondition: No truck with the same ID as <truck> has already been
+        added to this Fleet, and <truck> is empty.
+        """
+        dep = self.parcels.cities.intern(truck.dep)
+        self.t_ids.append(truck.t_id)
+        self.caps.append(truck.cap)
+        self.avails.append(truck.avail)
+        self.deps.append(dep)
+        self._par.append(array('l'))
+        self._route.append(array('l', [dep]))
+        view = TruckView(self, len(self.trucks))
+        self.trucks.append(view)
+        self._by_depot.setdefault(truck.dep, []).append(view)
+        self._count_truck(view)
+
+    def truck_parcels(self, i: int) -> array:
+        """Return the positions in <self>.parcels of the parcels packed onto
+        the truck at position <i>, in the order packed.
+        """
+        return self._par[i]
+
+    def truck_route(self, i: int) -> array:
+        """Return the city ids of the route of the truck at position <i>.
+        """
+        return self._route[i]
+
+    def set_route(self, i: int, route: List[str]) -> None:
+        """Replace the route of the truck at position <i> with <route>.
+
+        Use TruckView.set_route instead, so that the statistics of this fleet
+        stay up to date.
+        """
+        intern = self.parcels.cities.intern
+        self._route[i] = array('l', [intern(city) for city in route])
+
+    def pack(self, i: int, parcel: ParcelView) -> bool:
+        """Pack <parcel> onto the truck at position <i> if there is enough
+        space available.  Return True iff the parcel was packed.
+
+        Precondition: <parcel> is a view into <self>.parcels.
+        """
+        j = parcel.index
+        vol = self.parcels.p_vols[j]
+        old_avail = self.avails[i]
+        if vol <= old_avail:
+            self._par[i].append(j)
+            self.avails[i] -= vol
+            dest = self.parcels.dests[j]
+            route = self._route[i]
+            route_grew = route[-1] != dest
+            if route_grew:
+                route.append(dest)
+            self.truck_packed(self.trucks[i], old_avail, route_grew)
+            return True
+        return False
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'domain', 'distance_map'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()